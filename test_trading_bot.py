@@ -0,0 +1,372 @@
+"""
+Behaviour checks for trading_bot
+
+The benchmarks (python trading_bot.py --bench ...) measure cost; these
+tests hold the correctness checks, run on small instances of the same
+sessions. Run with: python -m pytest -q
+"""
+import asyncio
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+import trading_bot
+from trading_bot import Config, TradeState
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep benchmark scratch files out of the working directory"""
+    monkeypatch.setattr(Config, 'CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_virtual_session_restores_globals():
+    clock, subscriptions = trading_bot.clock, trading_bot.subscriptions
+    mode = Config.ENTRY_MODE
+    with trading_bot.virtual_session({'ENTRY_MODE': 'test'}) as loop:
+        assert trading_bot.clock is not clock
+        assert trading_bot.subscriptions is not subscriptions
+        assert Config.ENTRY_MODE == 'test'
+        loop.run_until_complete(trading_bot.clock.sleep(3600))
+        assert loop.time() >= 3600
+    assert loop.is_closed()
+    assert trading_bot.clock is clock and trading_bot.subscriptions is subscriptions
+    assert Config.ENTRY_MODE == mode
+
+
+def test_simulation_is_deterministic():
+    path = trading_bot.synthetic_price_path(10.0, seed=2)
+    first = trading_bot.run_simulation('SIM', 10.0, path)
+    second = trading_bot.run_simulation('SIM', 10.0, path)
+    assert first['states'] == second['states']
+    assert first['realized_pnl'] == second['realized_pnl'] == 2.5
+    assert first['orders_sent'] == second['orders_sent'] == 88
+    assert first['states'][-1] == TradeState.TRADE_COMPLETE.name
+
+
+@pytest.fixture
+def signal_index(monkeypatch):
+    """A fresh SignalIndex with an hour-long duplicate window"""
+    monkeypatch.setattr(Config, 'SIGNAL_WINDOW_SECONDS', 3600)
+    monkeypatch.setattr(trading_bot, 'signal_leases', trading_bot.SignalLeases())
+    return trading_bot.SignalIndex()
+
+
+@pytest.mark.parametrize('action, prices, expected', [
+    ('reject', [1.2, 1.20, 1.21, 1.22, 1.25], [('new', 100), ('reject', 0), ('reject', 0), ('reject', 0), ('new', 100)]),
+    ('merge', [5.0, 5.01], [('new', 100), ('merge', 0)]),
+    ('scale', [5.0, 5.0, 5.01, 5.0, 5.0, 5.0, 5.0],
+     [('new', 100), ('scale', 50), ('scale', 25), ('scale', 12), ('scale', 6), ('scale', 3), ('reject', 0)]),
+])
+def test_duplicate_signal_classes(signal_index, monkeypatch, action, prices, expected):
+    monkeypatch.setattr(Config, 'SIGNAL_DUPLICATE_ACTION', action)
+    assert [signal_index.admit(7, 'DUP', price, 100)[::2] for price in prices] == expected
+
+
+def test_duplicate_window_expires(signal_index, monkeypatch):
+    monkeypatch.setattr(Config, 'SIGNAL_DUPLICATE_ACTION', 'reject')
+    monkeypatch.setattr(Config, 'SIGNAL_WINDOW_SECONDS', 60)
+    _, first, _ = signal_index.admit(7, 'DUP', 5.0, 100)
+    signal_index.release(signal_index.attach(first))
+    first.last_seen -= 61
+    assert signal_index.admit(7, 'DUP', 5.0, 100)[0] == 'new'
+
+
+def test_expired_signal_does_not_hide_the_next_one(monkeypatch):
+    monkeypatch.setattr(Config, 'SIGNAL_DUPLICATE_ACTION', 'reject')
+    monkeypatch.setattr(Config, 'SIGNAL_WINDOW_SECONDS', 60)
+    index = trading_bot.SignalIndex()
+    _, expired, _ = index.admit(7, 'DUP', 5.0, 100)
+    expired.last_seen -= 61
+    live = trading_bot.Signal(99, 7, 'DUP', expired.price, expired.bucket, trading_bot.clock.time())
+    index.signals[live.signal_id] = live
+    index._buckets[(7, expired.bucket)].append(live)
+    index.attach(live)
+    
+    action, signal, shares = index.admit(7, 'DUP', 5.0, 100)
+    assert (action, signal, shares) == ('reject', live, 0)
+    assert expired.signal_id not in index.signals
+    assert index._buckets[(7, live.bucket)] == [live]
+
+
+def test_traders_share_position_pnl(monkeypatch):
+    manager = trading_bot.OrderManager()
+    monkeypatch.setattr(trading_bot, 'order_manager', manager)
+    traders = [trading_bot.StockTrader(None, 'DUP', 5.0, 100000.0, 2, shares) for shares in (100, 50)]
+    assert all(manager.active_traders.get(trader.trade_id) is trader for trader in traders)
+    for trader, fill in zip(traders, (5.0, 5.2)):
+        trader.live_position, trader.fill_price = trader.position_size, fill
+    
+    pnl = trading_bot.PnLSingle('', '', 0, position=150, value=150 * 5.5)
+    for trader in traders:
+        trader.on_pnl_update(pnl)
+    assert [round(trader.unrealized_pnl, 2) for trader in traders] == [50.0, 15.0]
+    assert len(manager.sharing(traders[0])) == 2
+
+
+def test_unreactivated_parked_stop_is_cancelled(monkeypatch):
+    async def scenario(ib, trader):
+        await ib.qualifyContractsAsync(trader.contract)
+        trader.live_position, trader.fill_price = 10, 10.0
+        trader.state = TradeState.IN_TRADE_PNL_O5
+        await trader.place_stop_loss()
+        assert await trader.park_stop_loss()
+        parked = trader.stop_loss_order
+        monkeypatch.setattr(Config, 'AMEND_ORDERS', False)   # reactivation fails
+        assert trader._record_transition(TradeState.IN_TRADE_PNL_U5)
+        handler = asyncio.create_task(trader.handle_in_trade_pnl_u5())
+        await trading_bot.clock.sleep(10)
+        handler.cancel()
+        return parked
+    
+    with trading_bot.virtual_session({'AMEND_ORDERS': True}, order_manager=trading_bot.OrderManager()) as loop:
+        ib = trading_bot.SimulatedIB()
+        ib.set_price('STOP', 10.0)
+        trader = trading_bot.StockTrader(ib, 'STOP', 10.0, ib.net_liquidation, 2, 10)
+        parked = loop.run_until_complete(scenario(ib, trader))
+    assert parked.orderStatus.status == 'Cancelled'
+    assert parked.order.orderId not in trader.parked_orders
+    assert [trade.order.orderId for trade in ib.openTrades()] == [trader.stop_loss_order.order.orderId]
+    assert trader.stop_loss_order is not parked
+
+
+def test_stress_grid_matches_hand_computed_gaps(monkeypatch):
+    monkeypatch.setattr(trading_bot, 'order_manager', trading_bot.OrderManager())
+    
+    def live(order, filled=0):
+        return trading_bot.Trade(trading_bot.Stock('X', 'SMART', 'USD'), order,
+                                 trading_bot.OrderStatus(status='Submitted', filled=filled), [], [])
+    
+    # AAA: 99 shares from 10.00 marked at 11.00, stop 9.70 / 9.50, TPs at 12 and 13
+    aaa = trading_bot.StockTrader(None, 'AAA', 10.0, 100000.0, 2, 99)
+    aaa.fill_price, aaa.live_position, aaa.unrealized_pnl_pct = 10.0, 99, 10.0
+    aaa.stop_loss_order = live(trading_bot.StopLimitOrder('SELL', 99, 9.5, 9.7))
+    aaa.take_profit_33 = live(trading_bot.LimitOrder('SELL', 33, 12.0))
+    aaa.take_profit_66 = live(trading_bot.LimitOrder('SELL', 33, 13.0))
+    # BBB: 40 shares left at 20.00, stop parked at 12.00 for the original 50, 7 of 17 TP shares still open
+    bbb = trading_bot.StockTrader(None, 'BBB', 20.0, 100000.0, 2, 50)
+    bbb.fill_price, bbb.live_position, bbb.unrealized_pnl_pct = 20.0, 40, 0.0
+    bbb.stop_loss_order = live(trading_bot.StopLimitOrder('SELL', 50, 11.64, 12.0))
+    bbb.take_profit_33 = live(trading_bot.LimitOrder('SELL', 17, 21.0), filled=10)
+    # CCC: stopped out at 5.00, waiting to buy 30 back between 5.00 and 5.20
+    ccc = trading_bot.StockTrader(None, 'CCC', 5.0, 100000.0, 2, 30)
+    ccc.fill_price = 5.0
+    ccc.reentry_order = live(trading_bot.StopLimitOrder('BUY', 30, 5.2, 5.0))
+    
+    result = trading_bot.StressCalculator([-0.20, -0.12, -0.05, 0.03, 0.10]).refresh([aaa, bbb, ccc])
+    expected = {
+        # AAA gaps through its stop at -20% and fills it at -12%; BBB's parked stop is never reached
+        'pnl_change': [-377.8, -226.68, -94.45, 56.67, 188.9],
+        'open_pnl': [-278.8, -127.68, 4.55, 155.67, 287.9],
+        'stopped_shares': [0, 99, 0, 0, 0],
+        'gapped_through_stop_shares': [99, 0, 0, 0, 0],
+        'take_profit_shares': [0, 0, 0, 0, 33 + 7],
+        'reentry_shares': [0, 0, 0, 30, 0],
+        'exposure_after': [871.2 + 640.0, 704.0, 1034.55 + 760.0, 1121.67 + 824.0 + 154.5, 798.6 + 726.0],
+    }
+    for key, values in expected.items():
+        assert result[key] == pytest.approx(values, abs=0.011), key
+    assert result['worst_symbol'] == ['AAA', 'AAA', 'AAA', 'CCC', 'CCC']
+
+
+def test_tick_rules_are_saved_at_close_not_on_fetch(tmp_path):
+    path = str(tmp_path / 'market_rules.json')
+    with trading_bot.virtual_session() as loop:
+        ib = trading_bot.SimulatedIB()
+        contracts = [trading_bot.Stock(symbol, 'SMART', 'USD') for symbol in ('TICKA', 'TICKB')]
+        loop.run_until_complete(ib.qualifyContractsAsync(*contracts))
+        first, second = trading_bot.TickSizeEngine(path), trading_bot.TickSizeEngine(path)
+        assert loop.run_until_complete(first.ensure_rules(ib, contracts[0]))
+        assert loop.run_until_complete(second.ensure_rules(ib, contracts[1]))
+    assert not os.path.exists(path)
+    
+    first.close()
+    second.close()   # keeps the rule the other process saved
+    reloaded = trading_bot.TickSizeEngine(path)
+    reloaded.load()
+    assert all(reloaded.has_rule(contract.conId) for contract in contracts)
+    assert reloaded.round_price(contracts[0].conId, 0.12341) == 0.1234
+    assert reloaded.round_price(contracts[0].conId, 12.3449) == 12.34
+
+
+def test_pegged_entry_budget_runs_from_the_order(monkeypatch):
+    async def scenario(ib, trader):
+        await ib.qualifyContractsAsync(trader.contract)
+        trader.start_time -= timedelta(seconds=30)   # a slow qualification before the order
+        await trader.pegged_entry()
+        return trading_bot.clock.time()
+    
+    config = {'ENTRY_MODE': 'pegged', 'ENTRY_TIME_BUDGET': 20}
+    with trading_bot.virtual_session(config, order_manager=trading_bot.OrderManager(),
+                                     entry_stats=trading_bot.EntryStats()) as loop:
+        ib = trading_bot.SimulatedIB()
+        ib.set_price('PEG', 11.0)   # beyond the slippage cap, so the entry never fills
+        trader = trading_bot.StockTrader(ib, 'PEG', 10.0, ib.net_liquidation, 2, 10)
+        finished = loop.run_until_complete(scenario(ib, trader))
+    assert trader.initial_order.orderStatus.status == 'Cancelled'
+    assert finished - trader.entry_placed_at >= 20
+
+
+def test_lease_race_and_crash_expiry():
+    ttl = 1.0
+    result = trading_bot.benchmark_leases(signals=100, instances=3, samples=50, ttl=ttl)
+    assert result['duplicates'] == 0
+    assert result['unclaimed'] == 0
+    assert sum(result['wins_per_instance'].values()) == 100
+    assert result['crashed_lease_blocked']
+    assert result['crashed_lease_freed_after_s'] < ttl + 1
+
+
+def test_accounts_fill_and_clean_up_per_account():
+    result = trading_bot.benchmark_accounts(signals=10, account_count=3)
+    assert result['skews_reported'] == 10
+    assert result['sizes_per_account'] == {'SIM1': 5, 'SIM2': 10, 'SIM3': 15}   # 1:2:3 by capital
+    assert result['mismatched_positions'] == 0
+    assert result['positions_left_open'] == 0
+    assert result['pnl_handlers_left'] == 0
+
+
+def test_soak_stays_flat():
+    result = trading_bot.run_soak_test(lifecycles=60, concurrency=10, symbol_count=5, trader_lifetime=60)
+    assert result['lifecycles'] == 60
+    assert result['failures'] == []
+
+
+def test_watchdog_attributes_a_stalled_callback():
+    result = trading_bot.benchmark_watchdog(steps=1000, block=0.2)
+    slowest = result['slowest']
+    assert (slowest['symbol'], slowest['state'], slowest['where']) == ('WDOG', 'IN_TRADE_PNL_U5', 'manage_orders')
+    assert result['paused_on_lag']
+    assert result['resumed']
+
+
+def test_status_stream_keeps_every_client_in_sync(monkeypatch):
+    monkeypatch.setattr(trading_bot, 'order_manager', trading_bot.OrderManager())
+    result = asyncio.run(trading_bot.status_fanout_session(50, 10, trader_count=40, seconds=1.0, seed=7))
+    assert result['clients_in_sync'] == 50
+    assert result['fast_client_events'] > 0
+
+
+def test_shadow_pass_matches_per_variant_loop(monkeypatch):
+    monkeypatch.setattr(Config, 'TIMEOUT_MINUTES', 3)   # the 300 s replay also covers expiry
+    signals, seconds, ticks_per_pass = 3, 300, 4
+    paths = trading_bot._shadow_paths(signals, seconds, ticks_per_pass, seed=3)
+    book = trading_bot.ShadowBook()
+    trading_bot.shadow_replay(book, paths, range(signals), seconds, ticks_per_pass)
+    
+    expected = np.zeros(len(book.variants))
+    for path in paths:
+        # Each pass sees the ticks since the previous one and that pass's last price
+        windows = [path[(step - 1) * ticks_per_pass:step * ticks_per_pass + 1] for step in range(1, seconds + 1)]
+        passes = [(float(step), min(window), max(window), window[-1]) for step, window in enumerate(windows, 1)]
+        expected += [trading_bot._shadow_reference(passes, 10.0, 90, variant) for variant in book.variants]
+    assert np.abs(book.totals()[0] - expected).max() < 1e-6
+
+
+def idle_shard_worker(shard, signal_ring_name, done_ring_name):
+    """A worker that never reads its signal ring"""
+    time.sleep(60)
+
+
+def test_shard_stop_forces_a_worker_it_cannot_reach(caplog):
+    coordinator = trading_bot.ShardCoordinator(1, worker=idle_shard_worker)
+    coordinator.start()
+    while coordinator.submit('FULL', 10.0, 100000.0, 2, 10):
+        pass
+    start = time.perf_counter()
+    coordinator.stop(timeout=0.5)
+    assert time.perf_counter() - start < 5
+    assert not coordinator.processes[0].is_alive()
+    assert 'could not be told to stop' in caplog.text
+
+
+def test_reconnect_resyncs_every_trader():
+    traders = 20
+    result = trading_bot.benchmark_reconnect(traders=traders, downtime=5.0)
+    assert result['traders'] == traders
+    assert result['ended'] == 0
+    assert result['missing'] == 0
+    assert result['reattached'] == result['orders']
+    assert result['stale'] == 0
+
+
+def test_scanner_recall_and_features():
+    tape = trading_bot._scanner_tape(symbols=500, seconds=400, ticks_per_second=2, batch=100,
+                                     spikes=5, seed=17, checked=5)
+    assert tape['recall'] >= 0.9
+    assert tape['false_signals'] == 0
+    assert tape['max_relative_error'] < 1e-6
+
+
+def test_scanner_replay_reaches_traders(cache_dir):
+    replay = trading_bot.run_scanner_replay(str(cache_dir / 'tape.csv'))
+    assert replay['spawned'] == replay['movers']
+
+
+ANALYZER_LOG = [
+    # seconds, message
+    (0, "StockTrader initialized for AAA#1 at 10.0"),
+    (1, "StockTrader initialized for AAA#2 at 10.2"),
+    (2, "[AAA#1] Order filled: 100 @ 10.0"),
+    (3, "[AAA#1] State change: NEW -> IN_TRADE_PNL_U5"),
+    (4, "[AAA#1] Stop loss placed: 100 @ 9.5"),
+    (5, "[AAA#2] Order filled: 50 @ 10.2"),
+    (6, "[AAA#2] State change: TradeState.NEW -> TradeState.IN_TRADE_PNL_U5"),
+    (7, "[AAA#2] Stop loss placed: 50 @ 9.8"),
+    (10, "[AAA#1] State change: IN_TRADE_PNL_U5 -> IN_TRADE_PNL_O5"),
+    (12, "[AAA#2] Stop Loss filled: 50 @ 9.8"),
+    (13, "[AAA#2] State change: TradeState.IN_TRADE_PNL_U5 -> TradeState.STOPPED_OUT"),
+    (14, "[AAA#2] State change: TradeState.STOPPED_OUT -> TradeState.TRADE_COMPLETE"),
+    (20, "[AAA#1] Take profit 33% filled: 33 @ 11.0"),
+    (30, "[AAA#1] Take profit 66% filled: 33 @ 12.0"),
+    (40, "[AAA#1] Stop Loss filled: 34 @ 10.5"),
+    (41, "[AAA#1] State change: IN_TRADE_PNL_O5 -> TRADE_COMPLETE"),
+]
+
+
+def test_log_analysis_is_the_same_on_one_or_many_workers(tmp_path, monkeypatch):
+    path = tmp_path / 'session.log'
+    with open(path, 'w') as f:
+        for seconds, message in ANALYZER_LOG:
+            for filler in range(20):   # spreads every lifecycle over several chunks
+                f.write(f"2026-01-05 10:00:{seconds:02d},{filler:03d} - INFO - Account values refreshed\n")
+            f.write(f"2026-01-05 10:00:{seconds:02d},500 - INFO - {message}\n")
+    monkeypatch.setattr(Config, 'ANALYZE_CHUNK_MB', 0.001)
+    
+    single = trading_bot.analyze_log(str(path), workers=1)
+    pooled = trading_bot.analyze_log(str(path), workers=3)
+    assert pooled['workers'] == 3
+    for key in ('symbols', 'total', 'time_in_state', 'open_trades', 'events'):
+        assert single[key] == pooled[key]
+    
+    # AAA#1 makes 116 on 50 of risk (2.32R); AAA#2 loses 20 on 20 of risk (-1R)
+    assert single['open_trades'] == 0
+    assert single['events'] == len(ANALYZER_LOG)
+    total = single['total']
+    assert (total['trades'], total['resolved'], total['win_rate'], total['avg_r'], total['pnl']) == \
+        (2, 2, 0.5, 0.66, 96.0)
+    assert single['time_in_state'] == {
+        'NEW': (2, 4.0, 8.0), 'STOPPED_OUT': (1, 1.0, 1.0),
+        'IN_TRADE_PNL_U5': (2, 7.0, 14.0), 'IN_TRADE_PNL_O5': (1, 31.0, 31.0),
+    }
+
+
+def test_bar_store_keeps_bars_when_capacity_changes(tmp_path):
+    rows = np.zeros(30, dtype=trading_bot.BAR_DTYPE)
+    rows['time'] = np.arange(30) * 60
+    rows['close'] = np.arange(30) + 10.0
+    store = trading_bot.BarStore(str(tmp_path), 50)
+    store.append('BARS', rows)
+    del store
+    
+    grown = trading_bot.BarStore(str(tmp_path), 100)
+    assert list(grown.bars('BARS')['time']) == list(rows['time'])
+    del grown
+    
+    shrunk = trading_bot.BarStore(str(tmp_path), 20)
+    assert list(shrunk.bars('BARS')['time']) == list(rows['time'][-20:])
+    assert os.path.getsize(tmp_path / 'BARS.bars') == 16 + 20 * trading_bot.BAR_DTYPE.itemsize
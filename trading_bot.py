@@ -14,11 +14,39 @@ import os
 from ib_insync import *
 from datetime import datetime, timedelta
 import keyboard
+import selectors
+import types
+import random
+import gc
+import tracemalloc
+import contextlib
+from collections import OrderedDict, deque
+from enum import IntEnum
+from array import array
 from typing import Dict, List
 import threading
 import colorama
 from colorama import Fore, Style
 import functools
+import json
+import bisect
+from decimal import Decimal
+import queue
+import struct
+import argparse
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+import zlib
+import copy
+import dataclasses
+import sys
+import signal
+import sqlite3
+import socket
+import mmap
+import re
+import itertools
 
 colorama.init()
 
@@ -32,119 +60,4382 @@ class Config:
     LOG_DIR = "bot_logs"
     LOG_FILE = "trading_bot.log"
     
+    # Local caches
+    CACHE_DIR = "bot_cache"
+    MARKET_RULE_CACHE_FILE = "market_rules.json"
+    BAR_DIR = "bars"  # Per-symbol bar files, under CACHE_DIR
+    
+    # Session Recorder
+    RECORDER_ENABLED = True
+    RECORDER_DIR = "bot_sessions"
+    RECORDER_BATCH_SIZE = 4096  # Events per buffer
+    RECORDER_FLUSH_SECONDS = 1.0  # Max age of a partially filled buffer
+    
+    # Trade Blotter (SQLite)
+    BLOTTER_ENABLED = True
+    BLOTTER_DIR = "bot_blotter"
+    BLOTTER_FILE = "blotter.db"
+    BLOTTER_BATCH_SIZE = 2000  # Rows per write transaction
+    BLOTTER_FLUSH_SECONDS = 0.5  # Max age of unwritten rows
+    BLOTTER_ID_SPAN = 1_000_000_000  # Trade ids per process; shard N numbers from (N + 1) * span + 1
+    
+    # Signal Deduplication (one signal per conId and price band)
+    SIGNAL_BAND_TICKS = 2  # Pastes within this many ticks of an open signal's price are that signal
+    SIGNAL_WINDOW_SECONDS = 60  # A signal keeps absorbing repeats this long after its last paste
+    SIGNAL_DUPLICATE_ACTION = 'reject'  # 'reject', 'merge' (absorb and extend the window) or 'scale'
+    SIGNAL_SCALE_FACTOR = 0.5  # 'scale': each repeat trades this fraction of the previous repeat
+    
+    # Multi-Instance Coordination (signal leases shared by every bot instance)
+    LEASES_ENABLED = True
+    LEASE_BACKEND = 'sqlite'  # 'sqlite' (a file every instance opens) or 'memory' (this process only)
+    LEASE_PATH = None  # Defaults to CACHE_DIR/leases.db; point every desk at the same file
+    LEASE_TTL = 15.0  # Seconds a lease outlives its last renewal, so a dead instance's signals free up
+    LEASE_RENEW_SECONDS = 5.0
+    LEASE_SYMBOLS = False  # Also lease the symbol, so no other instance trades it at any price
+    INSTANCE_ID = None  # Lease owner name; defaults to host:pid
+    
+    # Log Analysis (--analyze-log)
+    ANALYZE_CHUNK_MB = 64  # Log slice per worker task
+    ANALYZE_WORKERS = None  # Worker processes; None = one per core
+    
     # IB Connection
     IB_HOST = '127.0.0.1'
     IB_PORT = 7496
     IB_CLIENT_ID = 1
     
-    # Trading Parameters
-    MAX_REENTRIES = 5
-    TIMEOUT_MINUTES = 5
-    STOP_LOSS_PCT = 0.975  # 2.5% stop loss
-    ENTRY_LIMIT_PCT = 1.02  # 2% above entry for limit order
+    # Status API (Server-Sent Events on loopback)
+    STATUS_SERVER_ENABLED = True
+    STATUS_HOST = '127.0.0.1'
+    STATUS_PORT = 8765  # Shard workers listen on STATUS_PORT + 1 + shard
+    STATUS_INTERVAL = 0.25  # Seconds between delta publications
+    STATUS_MAX_CLIENTS = 64
+    STATUS_SEND_BUFFER = 65536  # Bytes queued per client before its deltas start coalescing
+    
+    # Profiling
+    PROFILE_ON_START = False
+    PROFILE_DIR = "bot_profiles"
+    PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between event loop stack samples
+    PROFILE_TOP_N = 15
+    PROFILE_TOGGLE_COMMAND = "!PROFILE"  # Paste as a symbol to toggle profiling (SIGUSR1 on Unix)
+    
+    # Loop Watchdog
+    WATCHDOG_ENABLED = False
+    WATCHDOG_INTERVAL = 0.05  # Heartbeat period; lag is how late the heartbeat wakes up
+    WATCHDOG_ATTRIBUTE = False  # Name slow callbacks via asyncio debug mode (several times the per-callback cost)
+    WATCHDOG_SLOW_CALLBACK = 0.05  # Callbacks / coroutine steps longer than this are recorded
+    WATCHDOG_SAMPLES = 4096  # Lag samples kept for percentiles
+    WATCHDOG_SLOW_KEEP = 200  # Most recent slow callbacks kept
+    LAG_SAFETY_LIMIT = 2.0  # Seconds of lag that trigger LAG_SAFETY_ACTION
+    LAG_SAFETY_ACTION = 'pause'  # 'pause' new signals, 'flatten' every position, or 'none'
+    LAG_RESUME_SECONDS = 30  # Lag must stay under half the limit this long before signals resume
+    
+    # Stress Test
+    STRESS_SHOCKS = (-0.20, -0.10, -0.05, 0.05, 0.10, 0.20)  # Instant gaps applied to every position
+    STRESS_REFRESH_SECONDS = 1.0  # Background re-evaluation interval (0 = on demand only)
+    
+    # Shadow Strategies (virtual parameter variants run on every real signal)
+    SHADOW_ENABLED = False
+    SHADOW_DIR = "bot_shadow"
+    SHADOW_GRID = {  # Every combination is one variant (6 x 4 x 4 x 4 = 384)
+        'stop_loss_pct': (0.95, 0.96, 0.97, 0.975, 0.98, 0.99),
+        'entry_limit_pct': (1.0, 1.01, 1.02, 1.03),
+        'tp_scale': (0.5, 0.75, 1.0, 1.5),  # Scales each TP_*_MULTIPLIER's profit
+        'max_reentries': (0, 1, 3, 5),
+    }
+    SHADOW_MAX_SIGNALS = 50  # Signals shadowed at once (each holds a market data line)
+    SHADOW_MIN_INTERVAL = 0.1  # Seconds between vectorized passes
+    SHADOW_MAX_CPU_PCT = 5.0  # Passes are spaced so shadowing uses at most this share of the loop
+    
+    # Momentum Scanner (signals from streaming quotes instead of the clipboard)
+    SCANNER_ENABLED = False
+    SCANNER_SOURCE = 'quotes'  # 'quotes' (stream SCANNER_UNIVERSE), 'ib_scanner', or a replay CSV path
+    SCANNER_UNIVERSE = []  # Symbols streamed by the 'quotes' source
+    SCANNER_SCAN_CODE = 'TOP_PERC_GAIN'  # IB scan whose top rows are streamed by 'ib_scanner'
+    SCANNER_MAX_LINES = 50  # Market data lines the scanner may hold
+    SCANNER_CAPACITY = 8192  # Symbols held in the feature arrays
+    SCANNER_BIN_SECONDS = 1.0  # Ring buffer bin width
+    SCANNER_LOOKBACK_SECONDS = 60  # Window for percent change and relative volume
+    SCANNER_VOLUME_HALFLIFE = 300  # Seconds; half-life of the per-bin volume baseline
+    SCANNER_MIN_CHANGE_PCT = 3.0  # Rise over the lookback needed for a signal
+    SCANNER_MIN_RELATIVE_VOLUME = 3.0  # Lookback volume over its baseline needed for a signal
+    SCANNER_MIN_PRICE = 1.0
+    SCANNER_MAX_PRICE = 50.0
+    SCANNER_COOLDOWN_SECONDS = 300  # No second signal for a symbol within this long
+    
+    # Connection Supervision
+    RECONNECT_INITIAL_DELAY = 1.0  # Seconds before the first reconnect attempt
+    RECONNECT_MAX_DELAY = 30.0  # Backoff cap
+    RECONNECT_TIMEOUT = 10  # Per-attempt connect/sync timeout
+    
+    # Trading Parameters
+    MAX_REENTRIES = 5
+    TIMEOUT_MINUTES = 5
+    STOP_LOSS_PCT = 0.975  # 2.5% stop loss (default when no ATR is available)
+    STOP_LIMIT_GAP_PCT = 0.025  # Stop-limit price sits this fraction of fill below the stop trigger
+    ENTRY_LIMIT_PCT = 1.02  # 2% above entry for limit order
+    
+    # Entry Execution
+    ENTRY_MODE = 'fixed'  # 'fixed': one GTC limit at ENTRY_LIMIT_PCT; 'pegged': follow the live ask
+    ENTRY_MAX_SLIPPAGE_PCT = 1.0  # Pegged limit never goes above entry price + this
+    ENTRY_PEG_OFFSET_PCT = 0.0  # Pegged limit relative to the ask
+    ENTRY_TIME_BUDGET = 20  # Seconds before an unfilled pegged entry is cancelled
+    ENTRY_REPRICE_INTERVAL = 0.5  # Minimum seconds between pegged amendments
+    
+    # Position Sizing (customize based on your risk tolerance)
+    MIN_POSITION_SIZE = 3
+    POSITION_CAPITAL = 30  # Dollar amount to use for position sizing
+    
+    # ATR Sizing (falls back to POSITION_CAPITAL/STOP_LOSS_PCT without bars)
+    ATR_SIZING = True
+    ATR_PERIOD = 14  # Bars in the Wilder ATR
+    ATR_STOP_MULTIPLIER = 2.0  # Stop distance in ATRs
+    RISK_PER_TRADE = 0.75  # Dollars lost if the stop is hit (2.5% of POSITION_CAPITAL)
+    MAX_POSITION_CAPITAL = 60  # Cap on entry value for tight-ATR symbols
+    MIN_STOP_DISTANCE_PCT = 0.01
+    MAX_STOP_DISTANCE_PCT = 0.10
+    
+    # Multi-Account Allocation
+    ACCOUNTS = {}  # account -> ratio, e.g. {'U1111111': 1.0, 'U2222222': 0.5}; two or more fan signals out
+    ALLOCATION_MODE = 'ratio'  # 'ratio' (ACCOUNTS values) or 'capital' (each account's NetLiquidation)
+    
+    # Account State (one account summary subscription, cached)
+    ACCOUNT_WAIT_SECONDS = 10  # Wait for the first NetLiquidation before taking signals
+    ACCOUNT_STALE_SECONDS = 300  # Warn when account values are older (IB refreshes the summary every 3 min)
+    MIN_EXCESS_LIQUIDITY = 0.0  # Refuse new signals while excess liquidity is below this
+    
+    # Historical Bars
+    BAR_SIZE = '5 mins'
+    BAR_SECONDS = 300
+    BAR_CAPACITY = 4096  # Bars kept per symbol (oldest half dropped when full)
+    BAR_HISTORY_DURATION = '10 D'  # First fetch for a symbol
+    BAR_REFRESH_SECONDS = 60  # Incremental top-up interval per symbol
+    HIST_MAX_REQUESTS = 50  # IB pacing: at most 60 historical requests...
+    HIST_WINDOW_SECONDS = 600  # ...per 10 minutes
+    HIST_MIN_INTERVAL = 15  # No identical request within 15 seconds
+    
+    # Take Profit Levels
+    TP_33_MULTIPLIER = 1.33  # 33% profit target
+    TP_66_MULTIPLIER = 1.66  # 66% profit target
+    TP_99_MULTIPLIER = 1.99  # 99% profit target
+    
+    # Order Amendment (modify orders in place instead of cancel/replace)
+    AMEND_ORDERS = True
+    PARKED_STOP_PCT = 0.5  # Parked stop loss sits 50% below fill (disaster stop)
+    PARKED_TP_MULTIPLIER = 3.0  # Parked take profits sit at 3x fill
+    
+    # Watchlist / Price Sanity Check
+    WATCHLIST_MODE = False
+    WATCHLIST = []  # Symbols streamed for the whole session
+    MARKET_DATA_LINES = 90  # Max concurrent quote subscriptions (IB default allowance is 100)
+    PRICE_SANITY_MAX_DEVIATION_PCT = 5  # Reject signals further than this from the live quote
+    PRICE_SANITY_REJECT_NO_QUOTE = False  # Reject signals when no live quote is available
+    QUOTE_STALE_SECONDS = 10
+    QUOTE_WAIT_SECONDS = 2  # Wait for the first quote of an on-demand symbol
+    
+    # Sharding (multi-process traders)
+    SHARDS = 0  # Worker processes hosting traders (0 = all traders on the main event loop)
+    SHARD_RING_CAPACITY = 1024  # Signals buffered per worker
+    SHARD_POLL_SECONDS = 0.005  # Ring poll interval in workers and the coordinator
+    
+    # State Tracking
+    STATE_HISTORY_SIZE = 16  # Transitions kept per trader (ring buffer)
+    
+    # PnL Thresholds (%)
+    PNL_THRESHOLD_5 = 5
+    PNL_THRESHOLD_33 = 33
+    PNL_THRESHOLD_66 = 66
+    PNL_THRESHOLD_99 = 99
+
+
+# Setup logging
+os.makedirs(Config.LOG_DIR, exist_ok=True)
+log_path = os.path.join(Config.LOG_DIR, Config.LOG_FILE)
+logging.basicConfig(
+    filename=log_path,
+    filemode='a',
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+
+def splash_screen():
+    """Display startup banner"""
+    os.system('cls' if os.name == 'nt' else 'clear')
+    print("\033[31m" + r"""
+    -----------------------------------------------------------------------------------------------------
+    |                                                                                                   |
+    |    ██████╗    ███████╗   █████╗   ██████╗   ██╗  ██╗   █████╗   ███╗   ██╗  ██████╗     ███████║  |
+    |    ██╔══██╗   ██╔════╝  ██╔══██╗  ██╔══██╗  ██║  ██║  ██╔══██╗  ████╗  ██║  ██╔══██╗    ╚════██║  |
+    |    ██║  ██║   █████╗    ███████║  ██║  ██║  ███████║  ███████║  ██╔██╗ ██║  ██║  ██║    ███████║  |
+    |    ██║  ██║   ██╔══╝    ██╔══██║  ██║  ██║  ██╔══██║  ██╔══██║  ██║╚██╗██║  ██║  ██║    ██╔════╝  |
+    |    ██████╔╝   ███████╗  ██║  ██║  ██████╔╝  ██║  ██║  ██║  ██║  ██║ ╚████║  ██████╔╝    ███████╗  |
+    |    ╚═════╝    ╚══════╝  ╚═╝  ╚═╝  ╚═════╝   ╚═╝  ╚═╝  ╚═╝  ╚═╝  ╚═╝  ╚═══╝  ╚═════╝     ╚══════╝  |
+    |                                                                                                   |
+    |                                       D E A D H A N D  v2.0                                       |
+    |                                Tactical Execution Interface Launched!!                            |
+    -----------------------------------------------------------------------------------------------------
+    """ + "\033[0m")
+    time.sleep(0.01)
+
+
+class ClipboardClearedException(Exception):
+    """Exception raised when clipboard is cleared during input"""
+    pass
+
+
+class Clock:
+    """
+    Wall-clock time source used by every timing path in the bot
+    
+    Timers (sleep, wait_for) go through the running event loop, so under a
+    VirtualTimeEventLoop they advance virtual time instead of waiting.
+    """
+    
+    def time(self) -> float:
+        """Current epoch time in seconds"""
+        return time.time()
+    
+    def now(self) -> datetime:
+        """Current local datetime"""
+        return datetime.now()
+    
+    async def sleep(self, seconds: float):
+        """Suspend the current coroutine"""
+        await asyncio.sleep(seconds)
+    
+    async def wait_for(self, awaitable, timeout: float):
+        """Await with a timeout"""
+        return await asyncio.wait_for(awaitable, timeout)
+
+
+class VirtualClock(Clock):
+    """Clock driven by a VirtualTimeEventLoop's virtual time"""
+    
+    def __init__(self, loop: 'VirtualTimeEventLoop', epoch: float = None):
+        self.loop = loop
+        self.epoch = time.time() if epoch is None else epoch
+    
+    def time(self) -> float:
+        return self.epoch + self.loop.time()
+    
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time())
+
+
+class _VirtualSelector:
+    """Selector wrapper that skips idle waits by advancing virtual time"""
+    
+    def __init__(self, selector):
+        self._selector = selector
+        self.loop = None
+    
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Nothing scheduled - only real I/O can wake the loop
+            return self._selector.select(None)
+        self.loop.advance(timeout)
+        return []
+    
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop running on virtual time
+    
+    Whenever the loop would block waiting for the next timer, virtual time
+    jumps straight to that timer instead. Sessions therefore run as fast as
+    the CPU allows, and deterministically for a given input.
+    """
+    
+    def __init__(self, start: float = 0.0):
+        self._virtual_time = start
+        selector = _VirtualSelector(selectors.DefaultSelector())
+        selector.loop = self
+        super().__init__(selector)
+    
+    def time(self) -> float:
+        return self._virtual_time
+    
+    def advance(self, seconds: float):
+        """Move virtual time forward"""
+        if seconds > 0:
+            self._virtual_time += seconds
+
+
+clock = Clock()
+
+
+def set_clock(new_clock: Clock):
+    """Replace the global clock (e.g. with a VirtualClock for simulation)"""
+    global clock
+    clock = new_clock
+
+
+class TradeState(IntEnum):
+    """Trading state machine states"""
+    NEW = 0                   # Entry not filled yet
+    IN_TRADE_PNL_U5 = 1       # In trade, PnL under 5%
+    STOPPED_OUT = 2           # Stop loss hit
+    WAITING_REENTRY = 3       # Waiting for reentry trigger
+    IN_TRADE_PNL_O5 = 4       # In trade, PnL over 5%
+    IN_TRADE_PNL_O33 = 5      # In trade, PnL over 33%
+    IN_TRADE_PNL_O66 = 6      # In trade, PnL over 66%
+    IN_TRADE_PNL_O99 = 7      # In trade, PnL over 99%
+    TRADE_COMPLETE = 8        # Trade finished
+    
+    def __str__(self):
+        return self.name
+    
+    def __format__(self, spec):
+        return format(self.name, spec)
+
+
+def _state_mask(*states: TradeState) -> int:
+    """Bitmask of target states"""
+    mask = 0
+    for state in states:
+        mask |= 1 << state
+    return mask
+
+
+# Allowed transitions, indexed by the current state
+STATE_TRANSITIONS = (
+    _state_mask(TradeState.IN_TRADE_PNL_U5, TradeState.TRADE_COMPLETE),                  # NEW
+    _state_mask(TradeState.STOPPED_OUT, TradeState.IN_TRADE_PNL_O5,
+                TradeState.TRADE_COMPLETE),                                                # IN_TRADE_PNL_U5
+    _state_mask(TradeState.WAITING_REENTRY, TradeState.TRADE_COMPLETE),                  # STOPPED_OUT
+    _state_mask(TradeState.IN_TRADE_PNL_U5, TradeState.TRADE_COMPLETE),                  # WAITING_REENTRY
+    _state_mask(TradeState.IN_TRADE_PNL_O33, TradeState.IN_TRADE_PNL_U5,
+                TradeState.TRADE_COMPLETE),                                                # IN_TRADE_PNL_O5
+    _state_mask(TradeState.IN_TRADE_PNL_O66, TradeState.IN_TRADE_PNL_O5,
+                TradeState.TRADE_COMPLETE),                                                # IN_TRADE_PNL_O33
+    _state_mask(TradeState.IN_TRADE_PNL_O99, TradeState.IN_TRADE_PNL_O33,
+                TradeState.TRADE_COMPLETE),                                                # IN_TRADE_PNL_O66
+    _state_mask(TradeState.TRADE_COMPLETE),                                               # IN_TRADE_PNL_O99
+    0,                                                                                    # TRADE_COMPLETE
+)
+
+# Profit states above U5 (take profits live, stop loss parked)
+HIGHER_STATES_MASK = _state_mask(
+    TradeState.IN_TRADE_PNL_O5, TradeState.IN_TRADE_PNL_O33,
+    TradeState.IN_TRADE_PNL_O66, TradeState.IN_TRADE_PNL_O99
+)
+
+
+class TickSizeEngine:
+    """
+    Market-rule based price rounding
+    
+    Market rules are fetched once per conId (contract details ->
+    marketRuleIds -> reqMarketRule) and cached on disk, so later sessions
+    round to the valid tick without any extra round trips. Each rule is
+    precomputed into sorted price bands that are searched with bisect.
+    The disk cache is read by the first ensure_rules(), not at import,
+    and written by close() at shutdown, never from the event loop.
+    """
+    
+    def __init__(self, cache_path: str = None):
+        self.cache_path = cache_path   # None keeps rules in memory only
+        self.loaded = False
+        self.dirty = False   # rules fetched since the cache was read
+        self.contract_rules: Dict[int, int] = {}   # conId -> marketRuleId
+        self.rules: Dict[int, List[List[float]]] = {}   # marketRuleId -> [[lowEdge, increment], ...]
+        self._bands: Dict[int, tuple] = {}   # marketRuleId -> (edges, increments, decimals)
+    
+    def load(self):
+        """Load cached market rules from disk"""
+        self.loaded = True
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            self.contract_rules = {int(k): int(v) for k, v in data.get('contracts', {}).items()}
+            for rule_id, increments in data.get('rules', {}).items():
+                self.add_rule(int(rule_id), increments)
+            logging.info(
+                f"Loaded {len(self.rules)} market rules for "
+                f"{len(self.contract_rules)} contracts from cache"
+            )
+        except Exception as e:
+            logging.error(f"Market rule cache load error: {e}")
+            self.contract_rules = {}
+            self.rules = {}
+            self._bands = {}
+    
+    def save(self):
+        """Persist market rules to disk, keeping rules other processes saved meanwhile"""
+        if not self.cache_path:
+            return
+        try:
+            data = {'contracts': {}, 'rules': {}}
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, 'r') as f:
+                    data = json.load(f)   # shard workers share the file
+            data['contracts'].update({str(k): v for k, v in self.contract_rules.items()})
+            data['rules'].update({str(k): v for k, v in self.rules.items()})
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+        except Exception as e:
+            logging.error(f"Market rule cache save error: {e}")
+    
+    def close(self):
+        """Save rules fetched this session (at shutdown)"""
+        if self.dirty:
+            self.save()
+    
+    def add_rule(self, rule_id: int, increments):
+        """Register a market rule and precompute its price bands"""
+        bands = sorted([float(low_edge), float(increment)] for low_edge, increment in increments)
+        self.rules[rule_id] = bands
+        edges = [low_edge for low_edge, _ in bands]
+        steps = [increment for _, increment in bands]
+        decimals = [max(0, -Decimal(str(increment)).normalize().as_tuple().exponent) for increment in steps]
+        self._bands[rule_id] = (edges, steps, decimals)
+    
+    def has_rule(self, con_id: int) -> bool:
+        """Check if a usable market rule is cached for the contract"""
+        return self.contract_rules.get(con_id) in self._bands
+    
+    async def ensure_rules(self, ib: IB, contract: Contract) -> bool:
+        """Fetch and cache the market rule for a qualified contract"""
+        if not contract.conId:
+            return False
+        if not self.loaded:
+            self.load()
+        if self.has_rule(contract.conId):
+            return True
+        
+        details = await ib.reqContractDetailsAsync(contract)
+        if not details:
+            return False
+        detail = details[0]
+        rule_ids = [r for r in detail.marketRuleIds.split(',') if r]
+        if not rule_ids:
+            return False
+        
+        # marketRuleIds is aligned with validExchanges
+        exchanges = detail.validExchanges.split(',')
+        index = exchanges.index(contract.exchange) if contract.exchange in exchanges else 0
+        rule_id = int(rule_ids[min(index, len(rule_ids) - 1)])
+        
+        if rule_id not in self._bands:
+            increments = await ib.reqMarketRuleAsync(rule_id)
+            if not increments:
+                return False
+            self.add_rule(rule_id, [(inc.lowEdge, inc.increment) for inc in increments])
+        
+        self.contract_rules[contract.conId] = rule_id
+        self.dirty = True
+        logging.info(f"[{contract.symbol}] Market rule {rule_id} cached for conId {contract.conId}")
+        return True
+    
+    def tick_size(self, con_id: int, price: float):
+        """Valid price increment at a price, or None if no rule is cached"""
+        rule_id = self.contract_rules.get(con_id)
+        if rule_id is None or rule_id not in self._bands:
+            return None
+        edges, steps, _ = self._bands[rule_id]
+        increment = steps[max(0, bisect.bisect_right(edges, price) - 1)]
+        return increment if increment > 0 else None
+    
+    def round_price(self, con_id: int, price: float):
+        """Round price to the nearest valid tick, or None if no rule is cached"""
+        rule_id = self.contract_rules.get(con_id)
+        if rule_id is None or rule_id not in self._bands:
+            return None
+        edges, steps, decimals = self._bands[rule_id]
+        index = max(0, bisect.bisect_right(edges, price) - 1)
+        increment = steps[index]
+        if increment <= 0:
+            return None
+        return round(round(price / increment) * increment, decimals[index])
+
+
+class SessionRecorder:
+    """
+    Append-only columnar recorder for PnL updates, order events and state changes
+    
+    Events are written into preallocated NumPy column buffers on the event
+    loop. Full (or stale) buffers are handed to a background writer thread
+    which appends them to the session file as column blocks, so the loop
+    never touches the disk.
+    
+    File layout:
+        MAGIC, then a sequence of chunks, each starting with a 4-byte tag
+        and a uint32 length:
+        - b'STRS': UTF-8 JSON list of strings appended to the string table
+        - b'BLK1': row count n, followed by each column's n raw values
+    """
+    
+    MAGIC = b'DHSESS01'
+    
+    EVENT_PNL = 1
+    EVENT_ORDER_STATUS = 2
+    EVENT_FILL = 3
+    EVENT_STATE = 4
+    KIND_NAMES = {1: 'pnl', 2: 'order_status', 3: 'fill', 4: 'state'}
+    
+    # Column name -> dtype, in on-disk order
+    COLUMNS = (
+        ('ts', np.float64),       # clock time (epoch seconds)
+        ('kind', np.uint8),       # EVENT_* code
+        ('symbol', np.uint32),    # string table index
+        ('order_id', np.int32),   # orderId (0 if not an order event)
+        ('code', np.uint32),      # string index: order status / new state / fill side
+        ('ref', np.uint32),       # string index: previous state / order type
+        ('v1', np.float64),       # unrealized PnL / filled / shares
+        ('v2', np.float64),       # PnL % / remaining / price
+        ('v3', np.float64),       # daily PnL / avg fill price / cumulative qty
+    )
+    
+    def __init__(self, batch_size: int = 4096, flush_seconds: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.path = None
+        self.active = False
+        
+        # String table (interned on the event loop, shipped with the next batch)
+        self._strings: Dict[str, int] = {'': 0}
+        self._pending_strings: List[str] = ['']
+        
+        # Buffers
+        self._free = queue.SimpleQueue()
+        self._buffer = None
+        self._n = 0
+        self._batch_started = 0.0
+        
+        # Writer thread
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        
+        # Cost accounting
+        self.events_recorded = 0
+        self.record_ns_total = 0
+        self.record_ns_max = 0
+        self.batches_written = 0
+        self.bytes_written = 0
+    
+    def _new_buffer(self):
+        """Allocate one set of column buffers"""
+        return {name: np.zeros(self.batch_size, dtype=dtype) for name, dtype in self.COLUMNS}
+    
+    def open(self, path: str, preallocate: int = 4):
+        """Open a session file and start the background writer"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        with open(path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(self.MAGIC)
+        for _ in range(preallocate):
+            self._free.put(self._new_buffer())
+        self._buffer = self._free.get()
+        self._n = 0
+        self._writer = threading.Thread(target=self._writer_loop, name='session-recorder', daemon=True)
+        self._writer.start()
+        self.active = True
+        logging.info(f"Session recorder writing to {path}")
+    
+    def close(self):
+        """Flush remaining events and stop the writer"""
+        if not self.active:
+            return
+        self.flush()
+        self.active = False
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+        logging.info(f"Session recorder closed - {self.stats()}")
+    
+    def intern(self, text: str) -> int:
+        """Map a string to its table index"""
+        index = self._strings.get(text)
+        if index is None:
+            index = len(self._strings)
+            self._strings[text] = index
+            self._pending_strings.append(text)
+        return index
+    
+    def record(self, kind: int, symbol: str, order_id: int = 0, code: str = '', ref: str = '',
+               v1: float = 0.0, v2: float = 0.0, v3: float = 0.0):
+        """Append one event to the current buffer (event loop only)"""
+        if not self.active:
+            return
+        t0 = time.perf_counter_ns()
+        
+        ts = clock.time()
+        buf = self._buffer
+        i = self._n
+        if i == 0:
+            self._batch_started = ts
+        buf['ts'][i] = ts
+        buf['kind'][i] = kind
+        buf['symbol'][i] = self.intern(symbol)
+        buf['order_id'][i] = order_id
+        buf['code'][i] = self.intern(code)
+        buf['ref'][i] = self.intern(ref)
+        buf['v1'][i] = v1
+        buf['v2'][i] = v2
+        buf['v3'][i] = v3
+        self._n = i + 1
+        
+        if self._n >= self.batch_size or ts - self._batch_started >= self.flush_seconds:
+            self.flush()
+        
+        elapsed = time.perf_counter_ns() - t0
+        self.events_recorded += 1
+        self.record_ns_total += elapsed
+        if elapsed > self.record_ns_max:
+            self.record_ns_max = elapsed
+    
+    def flush(self):
+        """Hand the current buffer to the writer thread"""
+        if not self.active or (self._n == 0 and len(self._pending_strings) == 0):
+            return
+        self._queue.put((self._buffer, self._n, self._pending_strings))
+        self._pending_strings = []
+        try:
+            self._buffer = self._free.get_nowait()
+        except queue.Empty:
+            self._buffer = self._new_buffer()
+        self._n = 0
+    
+    async def run_flusher(self):
+        """Periodically flush partially filled buffers"""
+        while self.active:
+            await clock.sleep(self.flush_seconds)
+            if self._n and clock.time() - self._batch_started >= self.flush_seconds:
+                self.flush()
+    
+    def _writer_loop(self):
+        """Background thread: append batches to the session file"""
+        with open(self.path, 'ab') as f:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                buf, n, strings = item
+                try:
+                    if strings:
+                        payload = json.dumps(strings).encode('utf-8')
+                        f.write(b'STRS' + struct.pack('<I', len(payload)) + payload)
+                        self.bytes_written += 8 + len(payload)
+                    if n:
+                        f.write(b'BLK1' + struct.pack('<I', n))
+                        for name, _ in self.COLUMNS:
+                            data = buf[name][:n].tobytes()
+                            f.write(data)
+                            self.bytes_written += len(data)
+                        self.bytes_written += 8
+                    f.flush()
+                    self.batches_written += 1
+                except Exception as e:
+                    logging.error(f"Session recorder write error: {e}")
+                finally:
+                    self._free.put(buf)
+    
+    def stats(self) -> dict:
+        """Recording cost statistics"""
+        mean_ns = self.record_ns_total / self.events_recorded if self.events_recorded else 0
+        return {
+            'events': self.events_recorded,
+            'mean_us': round(mean_ns / 1000, 3),
+            'max_us': round(self.record_ns_max / 1000, 3),
+            'batches': self.batches_written,
+            'bytes': self.bytes_written
+        }
+    
+    # ---- Event hooks ----
+    
+    def record_pnl(self, symbol: str, unrealized_pnl: float, unrealized_pnl_pct: float, daily_pnl: float):
+        """Record a PnL update"""
+        self.record(self.EVENT_PNL, symbol, v1=unrealized_pnl, v2=unrealized_pnl_pct, v3=daily_pnl)
+    
+    def record_state(self, symbol: str, old_state: 'TradeState', new_state: 'TradeState'):
+        """Record a state machine transition by state name"""
+        self.record(self.EVENT_STATE, symbol, code=new_state.name, ref=old_state.name)
+    
+    def on_order_status(self, trade: Trade):
+        """ib.orderStatusEvent handler"""
+        status = trade.orderStatus
+        self.record(
+            self.EVENT_ORDER_STATUS, trade.contract.symbol, trade.order.orderId,
+            code=status.status, ref=trade.order.orderType,
+            v1=status.filled, v2=status.remaining, v3=status.avgFillPrice
+        )
+    
+    def on_exec_details(self, trade: Trade, fill: Fill):
+        """ib.execDetailsEvent handler"""
+        execution = fill.execution
+        self.record(
+            self.EVENT_FILL, trade.contract.symbol, trade.order.orderId,
+            code=execution.side, ref=trade.order.orderType,
+            v1=execution.shares, v2=execution.price, v3=execution.cumQty
+        )
+    
+    def attach(self, ib: IB):
+        """Subscribe to order status and fill events"""
+        ib.orderStatusEvent += self.on_order_status
+        ib.execDetailsEvent += self.on_exec_details
+
+
+def load_session(path: str) -> Dict[str, np.ndarray]:
+    """
+    Load a recorded session into NumPy arrays
+    
+    Returns:
+        Dict with one array per recorder column plus 'strings', an object
+        array for decoding the 'symbol', 'code' and 'ref' columns
+        (e.g. result['strings'][result['symbol']]).
+    """
+    strings: List[str] = []
+    blocks = {name: [] for name, _ in SessionRecorder.COLUMNS}
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(SessionRecorder.MAGIC):
+        raise ValueError(f"Not a session file: {path}")
+    
+    view = memoryview(data)
+    offset = len(SessionRecorder.MAGIC)
+    while offset + 8 <= len(data):
+        tag = bytes(view[offset:offset + 4])
+        (length,) = struct.unpack_from('<I', data, offset + 4)
+        offset += 8
+        if tag == b'STRS':
+            strings.extend(json.loads(bytes(view[offset:offset + length]).decode('utf-8')))
+            offset += length
+        elif tag == b'BLK1':
+            for name, dtype in SessionRecorder.COLUMNS:
+                size = length * np.dtype(dtype).itemsize
+                blocks[name].append(np.frombuffer(data, dtype=dtype, count=length, offset=offset))
+                offset += size
+        else:
+            raise ValueError(f"Corrupt session file {path} at offset {offset - 8}")
+    
+    session = {
+        name: np.concatenate(blocks[name]) if blocks[name] else np.zeros(0, dtype=dtype)
+        for name, dtype in SessionRecorder.COLUMNS
+    }
+    session['strings'] = np.array(strings, dtype=object)
+    return session
+
+
+def benchmark_recorder(events: int = 200000) -> dict:
+    """Measure event loop cost per recorded event"""
+    recorder = SessionRecorder(batch_size=Config.RECORDER_BATCH_SIZE)
+    path = os.path.join(Config.RECORDER_DIR, f"bench_{os.getpid()}.dhrec")
+    recorder.open(path)
+    try:
+        start = time.perf_counter()
+        for i in range(events):
+            recorder.record_pnl('BENCH', i * 0.01, i * 0.001, 0.0)
+        elapsed = time.perf_counter() - start
+    finally:
+        recorder.close()
+    session = load_session(path)
+    os.remove(path)
+    result = recorder.stats()
+    result['wall_us_per_event'] = round(elapsed / events * 1e6, 3)
+    result['events_read_back'] = len(session['ts'])
+    return result
+
+
+class TradeBlotter:
+    """
+    Append-only SQLite record of orders, fills, state transitions and round trips
+    
+    The event loop only appends row tuples to in-memory lists. Full (or
+    stale) batches are handed to a writer thread that inserts them in one
+    transaction on a WAL-mode database, so the loop never waits on disk and
+    readers (reports) never block the writer.
+    
+    Every StockTrader gets a trade_id; orders it places are mapped to that
+    id so order status and fill events can be attributed to the trade.
+    Each process numbers its trades in its own block of BLOTTER_ID_SPAN
+    ids (the main process from 1, shard N from (N + 1) * span + 1), so
+    trade ids stay unique when the reports read all blotters together.
+    """
+    
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS orders (
+            ts REAL, trade_id INTEGER, symbol TEXT, account TEXT, order_id INTEGER,
+            action TEXT, order_type TEXT, quantity REAL, lmt_price REAL, aux_price REAL,
+            status TEXT, filled REAL, avg_fill_price REAL)""",
+        """CREATE TABLE IF NOT EXISTS fills (
+            exec_id TEXT PRIMARY KEY, ts REAL, trade_id INTEGER, symbol TEXT, account TEXT,
+            order_id INTEGER, side TEXT, shares REAL, price REAL)""",
+        """CREATE TABLE IF NOT EXISTS transitions (
+            ts REAL, trade_id INTEGER, symbol TEXT, account TEXT, from_state TEXT, to_state TEXT)""",
+        """CREATE TABLE IF NOT EXISTS round_trips (
+            trade_id INTEGER PRIMARY KEY, day TEXT, symbol TEXT, account TEXT, entry_price REAL,
+            opened REAL, closed REAL, position_size INTEGER, fill_price REAL,
+            bought REAL, sold REAL, realized_pnl REAL, reentries INTEGER, stopped_out INTEGER)""",
+        "CREATE INDEX IF NOT EXISTS orders_order ON orders(order_id)",
+        "CREATE INDEX IF NOT EXISTS orders_trade ON orders(trade_id)",
+        "CREATE INDEX IF NOT EXISTS fills_trade ON fills(trade_id)",
+        "CREATE INDEX IF NOT EXISTS fills_symbol ON fills(symbol, ts)",
+        "CREATE INDEX IF NOT EXISTS transitions_trade ON transitions(trade_id, ts)",
+        "CREATE INDEX IF NOT EXISTS round_trips_symbol ON round_trips(symbol, day)",
+        "CREATE INDEX IF NOT EXISTS round_trips_day ON round_trips(day)",
+    )
+    INSERTS = {
+        'orders': "INSERT INTO orders VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        'fills': "INSERT OR IGNORE INTO fills VALUES (?,?,?,?,?,?,?,?,?)",
+        'transitions': "INSERT INTO transitions VALUES (?,?,?,?,?,?)",
+        'round_trips': "INSERT OR REPLACE INTO round_trips VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+    }
+    
+    def __init__(self, batch_size: int = 2000, flush_seconds: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.path = None
+        self.attached: List[str] = []   # other blotters (shard files) the reports read with this one
+        self.active = False
+        self._next_trade_id = 1
+        self._rows = {table: [] for table in self.INSERTS}
+        self._pending = 0
+        self._batch_started = 0.0
+        self._order_trades: Dict[int, int] = {}   # orderId -> trade_id
+        self._trade_orders: Dict[int, list] = {}   # trade_id -> [orderId, ...]
+        self._executions: Dict[int, list] = {}   # trade_id -> [bought, sold, average cost, realized PnL]
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        
+        # Cost accounting
+        self.events_recorded = 0
+        self.record_ns_total = 0
+        self.batches_written = 0
+        self.rows_written = 0
+        self.write_seconds = 0.0
+    
+    def open(self, path: str, instance: int = 0):
+        """Create the schema and start the writer thread; trade ids come from the instance's block"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        db = sqlite3.connect(path)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                db.execute(statement)
+            db.commit()
+            first = instance * Config.BLOTTER_ID_SPAN + 1
+            last = db.execute(
+                "SELECT max(id) FROM (SELECT max(trade_id) AS id FROM transitions WHERE trade_id BETWEEN ?1 AND ?2"
+                " UNION ALL SELECT max(trade_id) FROM orders WHERE trade_id BETWEEN ?1 AND ?2"
+                " UNION ALL SELECT max(trade_id) FROM round_trips WHERE trade_id BETWEEN ?1 AND ?2)",
+                (first, first + Config.BLOTTER_ID_SPAN - 1)
+            ).fetchone()[0]
+        finally:
+            db.close()
+        self._next_trade_id = (last or first - 1) + 1
+        self._writer = threading.Thread(target=self._writer_loop, name='trade-blotter', daemon=True)
+        self._writer.start()
+        self.active = True
+        logging.info(f"Trade blotter writing to {path}")
+    
+    def close(self):
+        """Write remaining rows and stop the writer"""
+        if not self.active:
+            return
+        self.flush()
+        self.active = False
+        self._queue.put(None)
+        self._writer.join(timeout=30)
+        logging.info(f"Trade blotter closed - {self.stats()}")
+    
+    def next_trade_id(self) -> int:
+        """Allocate the id that ties a trader's rows together"""
+        trade_id = self._next_trade_id
+        self._next_trade_id += 1
+        return trade_id
+    
+    def _append(self, table: str, row: tuple):
+        """Queue one row (event loop only)"""
+        t0 = time.perf_counter_ns()
+        if self._pending == 0:
+            self._batch_started = clock.time()
+        self._rows[table].append(row)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+        self.events_recorded += 1
+        self.record_ns_total += time.perf_counter_ns() - t0
+    
+    def flush(self):
+        """Hand the queued rows to the writer thread"""
+        if not self._pending:
+            return
+        self._queue.put(self._rows)
+        self._rows = {table: [] for table in self.INSERTS}
+        self._pending = 0
+    
+    async def run_flusher(self):
+        """Periodically flush rows older than flush_seconds"""
+        while self.active:
+            await clock.sleep(self.flush_seconds)
+            if self._pending and clock.time() - self._batch_started >= self.flush_seconds:
+                self.flush()
+    
+    def _writer_loop(self):
+        """Background thread: insert batches, one transaction per wakeup"""
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        stopping = False
+        while not stopping:
+            batches = [self._queue.get()]
+            while True:   # coalesce whatever else is already queued
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batches:
+                stopping = True
+                batches = [batch for batch in batches if batch is not None]
+            if not batches:
+                continue
+            start = time.perf_counter()
+            try:
+                db.execute("BEGIN")
+                rows = 0
+                for batch in batches:
+                    for table, table_rows in batch.items():
+                        if table_rows:
+                            db.executemany(self.INSERTS[table], table_rows)
+                            rows += len(table_rows)
+                db.execute("COMMIT")
+                self.rows_written += rows
+                self.batches_written += len(batches)
+            except Exception as e:
+                logging.error(f"Trade blotter write error: {e}")
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+            self.write_seconds += time.perf_counter() - start
+        db.close()
+    
+    def stats(self) -> dict:
+        """Recording and write statistics"""
+        return {
+            'events': self.events_recorded,
+            'mean_us': round(self.record_ns_total / self.events_recorded / 1000, 3) if self.events_recorded else 0,
+            'batches': self.batches_written,
+            'rows': self.rows_written,
+            'write_seconds': round(self.write_seconds, 3),
+        }
+    
+    # ---- Event hooks ----
+    
+    def record_order(self, trade_id: int, account: str, trade: Trade):
+        """Record an order placed or amended by a trader"""
+        if not self.active:
+            return
+        order = trade.order
+        if order.orderId not in self._order_trades:
+            self._order_trades[order.orderId] = trade_id
+            self._trade_orders.setdefault(trade_id, []).append(order.orderId)
+        status = trade.orderStatus
+        self._append('orders', (
+            clock.time(), trade_id, trade.contract.symbol, account, order.orderId,
+            order.action, order.orderType, order.totalQuantity, order.lmtPrice, order.auxPrice,
+            status.status, status.filled, status.avgFillPrice
+        ))
+    
+    def record_transition(self, trade_id: int, symbol: str, account: str,
+                          old_state: 'TradeState', new_state: 'TradeState'):
+        """Record a state machine transition by state name"""
+        if self.active:
+            self._append('transitions', (clock.time(), trade_id, symbol, account, old_state.name, new_state.name))
+    
+    def record_round_trip(self, trader: 'StockTrader'):
+        """Record a finished trader's outcome and forget its orders"""
+        if not self.active:
+            return
+        bought, sold, _, realized = self._executions.pop(trader.trade_id, (0, 0, 0.0, 0.0))
+        for order_id in self._trade_orders.pop(trader.trade_id, ()):
+            self._order_trades.pop(order_id, None)
+        self._append('round_trips', (
+            trader.trade_id, clock.now().strftime('%Y-%m-%d'), trader.symbol,
+            trader.account, trader.entry_price, trader.start_time.timestamp(), clock.time(),
+            trader.position_size, trader.fill_price, bought, sold, round(realized, 4),
+            trader.reentry_count, int(trader.state_counts[TradeState.STOPPED_OUT] > 0)
+        ))
+    
+    def on_order_status(self, trade: Trade):
+        """ib.orderStatusEvent handler"""
+        trade_id = self._order_trades.get(trade.order.orderId)
+        if trade_id is None or not self.active:
+            return
+        order, status = trade.order, trade.orderStatus
+        self._append('orders', (
+            clock.time(), trade_id, trade.contract.symbol, order.account, order.orderId,
+            order.action, order.orderType, order.totalQuantity, order.lmtPrice, order.auxPrice,
+            status.status, status.filled, status.avgFillPrice
+        ))
+    
+    def on_exec_details(self, trade: Trade, fill: Fill):
+        """ib.execDetailsEvent handler"""
+        if not self.active:
+            return
+        execution = fill.execution
+        trade_id = self._order_trades.get(trade.order.orderId)
+        if trade_id is not None:
+            totals = self._executions.setdefault(trade_id, [0, 0, 0.0, 0.0])
+            held = totals[0] - totals[1]
+            if execution.side == 'BOT':
+                totals[2] = (held * totals[2] + execution.shares * execution.price) / (held + execution.shares)
+                totals[0] += execution.shares
+            else:
+                totals[3] += execution.shares * (execution.price - totals[2])
+                totals[1] += execution.shares
+        self._append('fills', (
+            execution.execId, clock.time(), trade_id, trade.contract.symbol, execution.acctNumber,
+            trade.order.orderId, execution.side, execution.shares, execution.price
+        ))
+    
+    def attach(self, ib: IB):
+        """Subscribe to order status and fill events"""
+        ib.orderStatusEvent += self.on_order_status
+        ib.execDetailsEvent += self.on_exec_details
+    
+    # ---- Reports (separate read connection; WAL lets them run beside the writer) ----
+    
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Run a read-only query against the blotter (and every attached one)"""
+        db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            if self.attached:
+                self._attach(db)
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+    
+    def _attach(self, db: sqlite3.Connection):
+        """Shadow each table with a temp view over this blotter and the attached ones"""
+        schemas = ['main']
+        for index, path in enumerate(self.attached):
+            db.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", f"blotter{index}"))
+            schemas.append(f"blotter{index}")
+        for table in self.INSERTS:
+            union = " UNION ALL ".join(f"SELECT * FROM {schema}.{table}" for schema in schemas)
+            db.execute(f"CREATE TEMP VIEW {table} AS {union}")
+    
+    def pnl_by_symbol(self, day: str = None) -> List[tuple]:
+        """(symbol, round trips, realized PnL), optionally for one day (YYYY-MM-DD)"""
+        if day:
+            return self.query(
+                "SELECT symbol, count(*), round(sum(realized_pnl), 2) FROM round_trips "
+                "WHERE day = ? GROUP BY symbol ORDER BY 3 DESC", (day,)
+            )
+        return self.query(
+            "SELECT symbol, count(*), round(sum(realized_pnl), 2) FROM round_trips "
+            "GROUP BY symbol ORDER BY 3 DESC"
+        )
+    
+    def pnl_by_day(self) -> List[tuple]:
+        """(day, round trips, realized PnL)"""
+        return self.query(
+            "SELECT day, count(*), round(sum(realized_pnl), 2) FROM round_trips GROUP BY day ORDER BY day"
+        )
+    
+    def reentry_success_rate(self) -> tuple:
+        """(trades with reentries, of which profitable, rate)"""
+        total, wins = self.query(
+            "SELECT count(*), coalesce(sum(realized_pnl > 0), 0) FROM round_trips WHERE reentries > 0"
+        )[0]
+        return total, wins, round(wins / total, 3) if total else None
+    
+    def time_in_state(self, symbol: str = None) -> List[tuple]:
+        """(state, visits, mean seconds, total seconds) from consecutive transitions"""
+        where = "WHERE symbol = ?" if symbol else ""
+        return self.query(
+            "SELECT to_state, count(*), round(avg(next_ts - ts), 2), round(sum(next_ts - ts), 1) FROM ("
+            "  SELECT to_state, ts, lead(ts) OVER (PARTITION BY trade_id ORDER BY ts) AS next_ts"
+            f"  FROM transitions {where}"
+            ") WHERE next_ts IS NOT NULL GROUP BY to_state ORDER BY 4 DESC",
+            (symbol,) if symbol else ()
+        )
+
+
+def benchmark_blotter(trades: int = 20000, symbol_count: int = 50) -> dict:
+    """Sustained blotter write throughput and report query latency"""
+    path = os.path.join(Config.BLOTTER_DIR, f"bench_{os.getpid()}.db")
+    store = TradeBlotter(Config.BLOTTER_BATCH_SIZE, Config.BLOTTER_FLUSH_SECONDS)
+    store.open(path)
+    rng = random.Random(7)
+    ladder = (TradeState.NEW, TradeState.IN_TRADE_PNL_U5, TradeState.IN_TRADE_PNL_O5,
+              TradeState.IN_TRADE_PNL_O33, TradeState.STOPPED_OUT, TradeState.WAITING_REENTRY,
+              TradeState.TRADE_COMPLETE)
+    mid_run_rows = None
+    try:
+        start = time.perf_counter()
+        for i in range(trades):
+            trade_id = store.next_trade_id()
+            symbol = f"BENCH{i % symbol_count}"
+            contract = Stock(symbol, 'SMART', 'USD')
+            exit_price = round(10.0 * (1 + rng.gauss(0, 0.05)), 2)
+            for order_id, action, price in ((2 * i + 1, 'BUY', 10.0), (2 * i + 2, 'SELL', exit_price)):
+                trade = Trade(contract, LimitOrder(action, 10, price, orderId=order_id, account='SIM'),
+                              OrderStatus(orderId=order_id, status='Submitted'), [], [])
+                store.record_order(trade_id, 'SIM', trade)
+                execution = Execution(execId=f"B{order_id}", acctNumber='SIM', orderId=order_id,
+                                      side='BOT' if action == 'BUY' else 'SLD', shares=10, price=price)
+                store.on_exec_details(trade, Fill(contract, execution, CommissionReport(), None))
+                trade.orderStatus.status = 'Filled'
+                store.on_order_status(trade)
+            for old_state, new_state in zip(ladder, ladder[1:]):
+                store.record_transition(trade_id, symbol, 'SIM', old_state, new_state)
+            store.record_round_trip(types.SimpleNamespace(
+                trade_id=trade_id, symbol=symbol, account='SIM', entry_price=10.0,
+                start_time=clock.now(), position_size=10, fill_price=10.0,
+                reentry_count=i % 3, state_counts={TradeState.STOPPED_OUT: i % 2}
+            ))
+            if i == trades // 2:
+                store.flush()
+                time.sleep(0.05)
+                mid_run_rows = store.query("SELECT count(*) FROM transitions")[0][0]
+        enqueue_seconds = time.perf_counter() - start
+        store.close()
+        elapsed = time.perf_counter() - start
+        
+        queries = {}
+        for name, report in (('pnl_by_symbol', store.pnl_by_symbol), ('pnl_by_day', store.pnl_by_day),
+                             ('reentry_success_rate', store.reentry_success_rate),
+                             ('time_in_state', store.time_in_state)):
+            t0 = time.perf_counter()
+            report()
+            queries[f"{name}_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        reentries = store.reentry_success_rate()
+        size_kb = round(os.path.getsize(path) / 1024)
+    finally:
+        store.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    
+    stats = store.stats()
+    return {
+        'events': stats['events'],
+        'mean_enqueue_us': stats['mean_us'],
+        'loop_events_per_sec': round(stats['events'] / enqueue_seconds),
+        'sustained_rows_per_sec': round(stats['rows'] / elapsed),
+        'writer_rows_per_sec': round(stats['rows'] / stats['write_seconds']) if stats['write_seconds'] else None,
+        'transactions': stats['batches'],
+        'rows_read_mid_run': mid_run_rows,
+        'db_kb': size_kb,
+        **queries,
+        'reentry_success': reentries,
+    }
+
+
+class MemoryLeaseBackend:
+    """
+    Lease table held in this process
+    
+    Stands in for a shared store when only one instance runs. A shared
+    backend only needs these methods; times are passed in so every backend
+    compares expiries against the same wall clock.
+    """
+    BLOCKING = False   # calls may wait on other instances (run them off the event loop)
+    
+    def __init__(self, path: str = None):
+        self._leases: Dict[str, tuple] = {}   # key -> (owner, expires)
+    
+    def acquire(self, keys: tuple, owner: str, now: float, expires: float) -> bool:
+        """Take every key (all or none) unless another live owner holds one"""
+        for key in keys:
+            holder = self._leases.get(key)
+            if holder is not None and holder[0] != owner and holder[1] >= now:
+                return False
+        for key in keys:
+            self._leases[key] = (owner, expires)
+        return True
+    
+    def renew(self, owner: str, expires: float) -> int:
+        """Extend every lease the owner holds; returns how many it still holds"""
+        renewed = 0
+        for key, (holder, _) in self._leases.items():
+            if holder == owner:
+                self._leases[key] = (owner, expires)
+                renewed += 1
+        return renewed
+    
+    def release(self, keys: tuple, owner: str):
+        for key in keys:
+            if self._leases.get(key, ('',))[0] == owner:
+                del self._leases[key]
+    
+    def release_all(self, owner: str):
+        for key in [key for key, (holder, _) in self._leases.items() if holder == owner]:
+            del self._leases[key]
+    
+    def holders(self, now: float) -> Dict[str, tuple]:
+        """Live leases: key -> (owner, expires)"""
+        return {key: lease for key, lease in self._leases.items() if lease[1] >= now}
+    
+    def close(self):
+        pass
+
+
+class SQLiteLeaseBackend(MemoryLeaseBackend):
+    """
+    Lease table in a SQLite file opened by every instance
+    
+    Acquiring is one IMMEDIATE transaction of upserts that only overwrite a
+    row when it has expired or is already ours, so two instances racing for
+    the same signal cannot both win. In WAL mode with synchronous=NORMAL a
+    commit does not wait for fsync, which keeps a grant under a millisecond.
+    """
+    BLOCKING = True   # another instance's write transaction makes us wait up to the busy timeout
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL,"
+        " expires REAL NOT NULL, acquired REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner)",
+    )
+    UPSERT = (
+        "INSERT INTO leases VALUES (?,?,?,?) ON CONFLICT (key) DO UPDATE"
+        " SET owner = excluded.owner, expires = excluded.expires, acquired = excluded.acquired"
+        " WHERE leases.expires < ? OR leases.owner = excluded.owner"
+    )
+    
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        # Used from executor threads only, one call at a time
+        self.db = sqlite3.connect(path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+    
+    def acquire(self, keys: tuple, owner: str, now: float, expires: float) -> bool:
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for key in keys:
+                    if self.db.execute(self.UPSERT, (key, owner, expires, now, now)).rowcount != 1:
+                        self.db.execute("ROLLBACK")
+                        return False
+                self.db.execute("COMMIT")
+                return True
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+    
+    def renew(self, owner: str, expires: float) -> int:
+        with self.lock:
+            return self.db.execute("UPDATE leases SET expires = ? WHERE owner = ?", (expires, owner)).rowcount
+    
+    def release(self, keys: tuple, owner: str):
+        with self.lock:
+            self.db.executemany("DELETE FROM leases WHERE key = ? AND owner = ?", [(key, owner) for key in keys])
+    
+    def release_all(self, owner: str):
+        with self.lock:
+            self.db.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+    
+    def holders(self, now: float) -> Dict[str, tuple]:
+        with self.lock:
+            rows = self.db.execute("SELECT key, owner, expires FROM leases WHERE expires >= ?", (now,)).fetchall()
+        return {key: (owner, expires) for key, owner, expires in rows}
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+LEASE_BACKENDS = {'memory': MemoryLeaseBackend, 'sqlite': SQLiteLeaseBackend}
+
+
+class SignalLeases:
+    """
+    Which bot instance owns each (symbol, price) signal
+    
+    signal_index only stops duplicates inside one process. Before a
+    signal is spawned it is leased in a store every instance shares; a
+    signal another instance holds is skipped. Leases are renewed in the
+    background and lapse LEASE_TTL seconds after the owner stops renewing,
+    so a crashed instance frees its signals. Expiries use the wall clock,
+    which every instance shares, never the (possibly virtual) trading clock.
+    """
+    
+    def __init__(self):
+        self.backend = None
+        self.owner = None
+        self.held: Dict[tuple, tuple] = {}   # (symbol, entry_price) -> lease keys
+        self._symbol_refs: Dict[str, int] = {}
+        self._task = None
+        
+        # Stats
+        self.acquired = 0
+        self.refused = 0
+        self.acquire_ns_total = 0
+        self.acquire_ns_max = 0
+        self.lost = 0
+    
+    def open(self, backend=None, owner: str = None):
+        """Connect to the lease store (Config.LEASE_BACKEND unless a backend is given)"""
+        if backend is None:
+            path = Config.LEASE_PATH or os.path.join(Config.CACHE_DIR, 'leases.db')
+            backend = LEASE_BACKENDS[Config.LEASE_BACKEND](path)
+        self.backend = backend
+        self.owner = owner or Config.INSTANCE_ID or f"{socket.gethostname()}:{os.getpid()}"
+        logging.info(f"Signal leases: {type(backend).__name__} as {self.owner}")
+    
+    def start(self):
+        """Renew held leases in the background"""
+        if self.backend is not None and self._task is None:
+            self._task = asyncio.create_task(self.run_renewer())
+    
+    def close(self):
+        """Stop renewing and hand back every lease this instance holds"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.backend is not None:
+            try:
+                self.backend.release_all(self.owner)
+                self.backend.close()
+            except sqlite3.Error as e:
+                logging.error(f"Lease store close error: {e}")
+            self.backend = None
+            logging.info(f"Signal leases closed - {self.stats()}")
+        self.held.clear()
+        self._symbol_refs.clear()
+    
+    @staticmethod
+    def keys_for(symbol: str, entry_price: float) -> tuple:
+        """Lease keys for one signal (repr keeps 12.5 and 12.50 the same signal)"""
+        if Config.LEASE_SYMBOLS:
+            return (f"signal:{symbol}@{entry_price!r}", f"symbol:{symbol}")
+        return (f"signal:{symbol}@{entry_price!r}",)
+    
+    def acquire(self, symbol: str, entry_price: float) -> bool:
+        """Lease a signal for this instance; False if another live instance holds it (blocks)"""
+        if self.backend is None:
+            return True
+        t0 = time.perf_counter_ns()
+        keys = self.keys_for(symbol, entry_price)
+        now = time.time()
+        try:
+            granted = self.backend.acquire(keys, self.owner, now, now + Config.LEASE_TTL)
+        except sqlite3.Error as e:
+            return self._store_error(symbol, e)
+        return self._granted(symbol, entry_price, keys, granted, t0)
+    
+    async def acquire_async(self, symbol: str, entry_price: float) -> bool:
+        """acquire() from the event loop: a shared store is waited on in an executor thread"""
+        if self.backend is None or not self.backend.BLOCKING:
+            return self.acquire(symbol, entry_price)
+        t0 = time.perf_counter_ns()
+        keys = self.keys_for(symbol, entry_price)
+        now = time.time()
+        try:
+            granted = await asyncio.get_running_loop().run_in_executor(
+                None, self.backend.acquire, keys, self.owner, now, now + Config.LEASE_TTL
+            )
+        except sqlite3.Error as e:
+            return self._store_error(symbol, e)
+        return self._granted(symbol, entry_price, keys, granted, t0)
+    
+    @staticmethod
+    def _store_error(symbol: str, error: Exception) -> bool:
+        # A store that cannot be reached must not stop this desk from trading
+        logging.error(f"[{symbol}] Lease store error, trading unleased: {error}")
+        print(f"\t[{symbol}] Lease store unavailable - not coordinated with other instances")
+        return True
+    
+    def _granted(self, symbol: str, entry_price: float, keys: tuple, granted: bool, t0: int) -> bool:
+        """Book the outcome of an acquire"""
+        elapsed = time.perf_counter_ns() - t0
+        self.acquire_ns_total += elapsed
+        if elapsed > self.acquire_ns_max:
+            self.acquire_ns_max = elapsed
+        if not granted:
+            self.refused += 1
+            return False
+        self.acquired += 1
+        self.held[(symbol, entry_price)] = keys
+        self._symbol_refs[symbol] = self._symbol_refs.get(symbol, 0) + 1
+        return True
+    
+    def release(self, symbol_price_key: tuple):
+        """Give up a signal's lease (no-op if this instance does not hold it)"""
+        keys = self.held.pop(symbol_price_key, None)
+        if keys is None or self.backend is None:
+            return
+        symbol = symbol_price_key[0]
+        self._symbol_refs[symbol] -= 1
+        if self._symbol_refs[symbol]:
+            keys = keys[:1]   # other signals of this symbol still need the symbol lease
+        else:
+            del self._symbol_refs[symbol]
+        if self.backend.BLOCKING:
+            try:
+                future = asyncio.get_running_loop().run_in_executor(None, self._release, symbol, keys)
+            except RuntimeError:   # no loop running (shutdown)
+                self._release(symbol, keys)
+            else:
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            return
+        self._release(symbol, keys)
+    
+    def _release(self, symbol: str, keys: tuple):
+        try:
+            self.backend.release(keys, self.owner)
+        except sqlite3.Error as e:
+            logging.error(f"[{symbol}] Lease release error (expires in {Config.LEASE_TTL}s): {e}")
+    
+    async def run_renewer(self):
+        """Extend held leases every LEASE_RENEW_SECONDS (a shared store off the event loop)"""
+        while True:
+            await clock.sleep(Config.LEASE_RENEW_SECONDS)
+            if not self.held:
+                continue
+            expected = len({key for keys in self.held.values() for key in keys})
+            expires = time.time() + Config.LEASE_TTL
+            try:
+                if self.backend.BLOCKING:
+                    renewed = await asyncio.get_running_loop().run_in_executor(
+                        None, self.backend.renew, self.owner, expires
+                    )
+                else:
+                    # The in-process table is only ever touched from the loop thread
+                    renewed = self.backend.renew(self.owner, expires)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Lease renewal error: {e}")
+                continue
+            if renewed < expected:
+                # Renewal came too late and another instance may now own the signal
+                self.lost += expected - renewed
+                logging.warning(f"Signal leases: {expected - renewed} lease(s) expired before renewal")
+                print(f"\t[!] {expected - renewed} signal lease(s) lapsed - another instance may take them")
+    
+    def stats(self) -> dict:
+        attempts = self.acquired + self.refused
+        return {
+            'acquired': self.acquired,
+            'refused': self.refused,
+            'held': len(self.held),
+            'lost': self.lost,
+            'mean_acquire_us': round(self.acquire_ns_total / attempts / 1000, 1) if attempts else None,
+            'max_acquire_us': round(self.acquire_ns_max / 1000, 1),
+        }
+
+
+class Signal:
+    """One trade signal in the SignalIndex"""
+    
+    __slots__ = ('signal_id', 'con_id', 'symbol', 'price', 'bucket', 'first_seen', 'last_seen',
+                 'repeats', 'running')
+    
+    def __init__(self, signal_id: int, con_id: int, symbol: str, price: float, bucket: int, now: float):
+        self.signal_id = signal_id
+        self.con_id = con_id
+        self.symbol = symbol
+        self.price = price   # tick-rounded price of the first paste
+        self.bucket = bucket
+        self.first_seen = now
+        self.last_seen = now
+        self.repeats = 0   # duplicates merged, scaled or rejected
+        self.running = 0   # traders still trading this signal
+    
+    @property
+    def key(self) -> tuple:
+        """(symbol, price) the signal is leased under"""
+        return (self.symbol, self.price)
+
+
+class SignalIndex:
+    """
+    Open signals keyed by conId and tick-rounded price band
+    
+    A pasted price is rounded to the contract's tick (market rule, else
+    $0.01 / $0.0001) and matched against signals of the same conId within
+    SIGNAL_BAND_TICKS ticks, so 1.2 and 1.20 or a one-tick move are the
+    same signal. Signals sit in (conId, price // band) buckets and only the
+    neighbouring buckets are searched, so a lookup is O(1). A signal stays
+    open while any of its traders runs and for SIGNAL_WINDOW_SECONDS after
+    its last paste; repeats inside that are handled by
+    SIGNAL_DUPLICATE_ACTION:
+    
+    - 'reject': refused.
+    - 'merge': absorbed into the open signal, extending its window.
+    - 'scale': traded again at SIGNAL_SCALE_FACTOR times the previous size,
+      until that is under MIN_POSITION_SIZE.
+    """
+    
+    def __init__(self):
+        self.con_ids: Dict[str, int] = {}   # symbol -> conId
+        self.signals: Dict[int, Signal] = {}   # signal_id -> Signal
+        self._buckets: Dict[tuple, list] = {}   # (conId, bucket) -> [Signal, ...]
+        self._next_id = 1
+        
+        # Stats
+        self.new = 0
+        self.rejected = 0
+        self.merged = 0
+        self.scaled = 0
+        self.lookups = 0
+        self.lookup_ns_total = 0
+        self.lookup_ns_max = 0
+    
+    async def resolve(self, ib, symbol: str):
+        """conId for a symbol (qualified and its market rule loaded once per symbol), or None"""
+        con_id = self.con_ids.get(symbol)
+        if con_id is not None:
+            return con_id
+        contract = quote_table.contracts.get(symbol) or Stock(symbol, 'SMART', 'USD')
+        if not contract.conId:
+            await ib.qualifyContractsAsync(contract)
+            if not contract.conId:
+                return None
+        try:
+            await tick_engine.ensure_rules(ib, contract)
+        except Exception as e:
+            logging.error(f"[{symbol}] Market rule error: {e}")
+        self.con_ids[symbol] = contract.conId
+        return contract.conId
+    
+    @staticmethod
+    def tick(con_id: int, price: float) -> float:
+        """Price increment used for rounding and bands"""
+        return tick_engine.tick_size(con_id, price) or (0.01 if price >= 1 else 0.0001)
+    
+    def find(self, con_id: int, price: float, now: float, tick: float = None):
+        """Closest open signal within SIGNAL_BAND_TICKS of price (expired ones are dropped)"""
+        tick = tick or self.tick(con_id, price)
+        band = tick * max(1, Config.SIGNAL_BAND_TICKS)
+        bucket = int(price // band)
+        best = None
+        expired = []
+        for key in ((con_id, bucket - 1), (con_id, bucket), (con_id, bucket + 1)):
+            for signal in self._buckets.get(key, ()):
+                if not signal.running and now - signal.last_seen > Config.SIGNAL_WINDOW_SECONDS:
+                    expired.append(signal)
+                    continue
+                distance = abs(signal.price - price)
+                if distance <= band + tick * 1e-6 and (best is None or distance < abs(best.price - price)):
+                    best = signal
+        for signal in expired:   # removed after the scan, which must not skip the next signal in a bucket
+            self._remove(signal)
+        return best
+    
+    def admit(self, con_id: int, symbol: str, price: float, position: int) -> tuple:
+        """
+        Classify a pasted signal: ('new' | 'scale', signal, shares to trade)
+        or ('merge' | 'reject', signal, 0)
+        
+        A new signal is indexed straight away; call discard() if it is not
+        traded after all.
+        """
+        t0 = time.perf_counter_ns()
+        now = clock.time()
+        tick = self.tick(con_id, price)
+        price = tick_engine.round_price(con_id, price) or round(round(price / tick) * tick, 10)
+        signal = self.find(con_id, price, now, tick)
+        if signal is None:
+            band = tick * max(1, Config.SIGNAL_BAND_TICKS)
+            signal = Signal(self._next_id, con_id, symbol, price, int(price // band), now)
+            self._next_id += 1
+            self.signals[signal.signal_id] = signal
+            self._buckets.setdefault((con_id, signal.bucket), []).append(signal)
+            self.new += 1
+            result = ('new', signal, position)
+        else:
+            signal.repeats += 1
+            action = Config.SIGNAL_DUPLICATE_ACTION
+            scaled = int(position * Config.SIGNAL_SCALE_FACTOR ** signal.repeats)
+            if action == 'merge':
+                signal.last_seen = now
+                self.merged += 1
+                result = ('merge', signal, 0)
+            elif action == 'scale' and scaled >= Config.MIN_POSITION_SIZE:
+                signal.last_seen = now
+                self.scaled += 1
+                result = ('scale', signal, scaled)
+            else:
+                self.rejected += 1
+                result = ('reject', signal, 0)
+        
+        elapsed = time.perf_counter_ns() - t0
+        self.lookups += 1
+        self.lookup_ns_total += elapsed
+        if elapsed > self.lookup_ns_max:
+            self.lookup_ns_max = elapsed
+        return result
+    
+    def attach(self, signal: Signal) -> int:
+        """Count a trader spawned for the signal; returns the id the trader releases"""
+        signal.running += 1
+        return signal.signal_id
+    
+    def release(self, signal_id: int):
+        """A trader of the signal finished; the lease goes with the signal's last trader"""
+        signal = self.signals.get(signal_id)
+        if signal is None:
+            return
+        signal.running -= 1
+        if signal.running > 0:
+            return
+        signal_leases.release(signal.key)
+        if clock.time() - signal.last_seen > Config.SIGNAL_WINDOW_SECONDS:
+            self._remove(signal)
+    
+    def discard(self, signal: Signal):
+        """Forget a new signal that was not traded (lease refused, shard busy)"""
+        if not signal.running:
+            self._remove(signal)
+    
+    def _remove(self, signal: Signal):
+        self.signals.pop(signal.signal_id, None)
+        bucket = self._buckets.get((signal.con_id, signal.bucket))
+        if bucket and signal in bucket:
+            bucket.remove(signal)
+            if not bucket:
+                del self._buckets[(signal.con_id, signal.bucket)]
+    
+    def stats(self) -> dict:
+        return {
+            'open': len(self.signals),
+            'running': sum(1 for signal in self.signals.values() if signal.running),
+            'new': self.new,
+            'merged': self.merged,
+            'scaled': self.scaled,
+            'rejected': self.rejected,
+            'avg_lookup_us': round(self.lookup_ns_total / self.lookups / 1000, 2) if self.lookups else 0,
+            'max_lookup_us': round(self.lookup_ns_max / 1000, 2),
+        }
+
+
+def _lease_contender(path: str, owner: str, signals: int, seed: int, barrier, results):
+    """Bot instance stand-in: try to lease every race signal, in its own order"""
+    leases = SignalLeases()
+    leases.open(SQLiteLeaseBackend(path), owner)
+    order = list(range(signals))
+    random.Random(seed).shuffle(order)
+    barrier.wait()
+    won = [i for i in order if leases.acquire(f"RACE{i}", 10.0)]
+    results.put((owner, won, leases.stats()['mean_acquire_us']))
+    leases.backend.close()   # exit holding the leases, as a live instance would
+
+
+def _lease_crasher(path: str, ttl: float):
+    """Instance that takes a lease and dies without releasing it"""
+    Config.LEASE_TTL = ttl
+    leases = SignalLeases()
+    leases.open(SQLiteLeaseBackend(path), 'crashed-desk')
+    leases.acquire('CRASH', 10.0)
+    os._exit(1)
+
+
+def benchmark_leases(signals: int = 500, instances: int = 4, samples: int = 2000, ttl: float = 2.0) -> dict:
+    """Spawn-path lease cost, an instance race for the same signals and expiry after a crash"""
+    path = os.path.join(Config.CACHE_DIR, 'bench_leases.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    leases = SignalLeases()
+    leases.open(SQLiteLeaseBackend(path), 'bench-desk')
+    try:
+        # Uncontended acquire, as on the spawn path
+        latencies = []
+        for i in range(samples):
+            t0 = time.perf_counter_ns()
+            leases.acquire(f"SPAWN{i}", 10.0)
+            latencies.append(time.perf_counter_ns() - t0)
+        for i in range(samples):
+            leases.release((f"SPAWN{i}", 10.0))
+        latencies.sort()
+        
+        # Several instances race for the same signals
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(instances)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_lease_contender, args=(path, f"desk{k}", signals, k, barrier, results))
+            for k in range(instances)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=120) for _ in processes]
+        for process in processes:
+            process.join()
+        wins: Dict[int, int] = {}
+        for _, won, _ in outcomes:
+            for i in won:
+                wins[i] = wins.get(i, 0) + 1
+        duplicates = sum(1 for count in wins.values() if count > 1)
+        unclaimed = signals - len(wins)
+        
+        # A crashed instance's lease blocks others until it expires
+        crasher = context.Process(target=_lease_crasher, args=(path, ttl))
+        crasher.start()
+        crasher.join()
+        crashed_at = time.time()
+        blocked = not leases.acquire('CRASH', 10.0)
+        while not leases.acquire('CRASH', 10.0) and time.time() - crashed_at < ttl * 5:
+            time.sleep(0.02)
+        freed_after = time.time() - crashed_at
+    finally:
+        leases.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    
+    return {
+        'median_acquire_us': round(latencies[len(latencies) // 2] / 1000, 1),
+        'p99_acquire_us': round(latencies[int(len(latencies) * 0.99)] / 1000, 1),
+        'instances': instances,
+        'race_signals': signals,
+        'wins_per_instance': {owner: len(won) for owner, won, _ in outcomes},
+        'contended_mean_acquire_us': [mean for _, _, mean in outcomes],
+        'duplicates': duplicates,
+        'unclaimed': unclaimed,
+        'crashed_lease_blocked': blocked,
+        'crashed_lease_freed_after_s': round(freed_after, 2),
+    }
+
+
+def benchmark_signals(symbol_count: int = 1000, lookups: int = 100000, seed: int = 13) -> dict:
+    """Signal index lookup cost with 1x and 10x as many open signals"""
+    global signal_leases
+    rng = random.Random(seed)
+    saved_config = (Config.SIGNAL_DUPLICATE_ACTION, Config.SIGNAL_WINDOW_SECONDS)
+    saved_leases = signal_leases
+    signal_leases = SignalLeases()   # no store: acquire() always grants
+    logging.disable(logging.INFO)
+    try:
+        Config.SIGNAL_DUPLICATE_ACTION, Config.SIGNAL_WINDOW_SECONDS = 'reject', 3600
+        lookup_us = {}
+        for scale in (1, 10):
+            index = SignalIndex()
+            for i in range(symbol_count * scale):
+                index.con_ids[f"S{i}"] = i + 1
+                index.admit(i + 1, f"S{i}", round(rng.uniform(1, 50), 2), 100)
+            index.lookups = index.lookup_ns_total = 0
+            for _ in range(lookups):
+                i = rng.randrange(symbol_count * scale)
+                index.admit(i + 1, f"S{i}", round(rng.uniform(1, 50), 2), 100)
+            lookup_us[symbol_count * scale] = round(index.lookup_ns_total / index.lookups / 1000, 2)
+    finally:
+        logging.disable(logging.NOTSET)
+        Config.SIGNAL_DUPLICATE_ACTION, Config.SIGNAL_WINDOW_SECONDS = saved_config
+        signal_leases = saved_leases
+    
+    return {'avg_lookup_us': lookup_us}
+
+
+class ConnectionSupervisor:
+    """
+    Reconnects a dropped IB connection and resyncs trader state
+    
+    On disconnect ib_insync resets its wrapper: open-order Trade objects are
+    replaced, PnL and market data subscriptions are forgotten and
+    positions() stays empty until the next sync. Until recovery completes,
+    traders are held in wait_ready(), so they never act on that empty state.
+    Reconnecting re-runs ib_insync's startup sync, which requests positions,
+    open and completed orders, and then executions, in one concurrent batch.
+    Each trader's existing Trade objects are then re-attached to the client
+    together with any fills from the outage, and every PnL and market data
+    subscription is re-requested.
+    """
+    
+    def __init__(self):
+        self.ib = None
+        self.client_id = None
+        self.ready = True
+        self.stopping = False
+        self.disconnected_at = None
+        self.reconnects = 0
+        self.last_recovery = {}
+        self._waiters: List[asyncio.Future] = []
+        self._task = None
+    
+    def start(self, ib, client_id: int):
+        """Watch an IB connection for drops"""
+        self.ib = ib
+        self.client_id = client_id
+        self.stopping = False
+        ib.disconnectedEvent += self.on_disconnected
+    
+    def stop(self):
+        """Stop supervising (call before a deliberate disconnect)"""
+        self.stopping = True
+        if self.ib is not None:
+            self.ib.disconnectedEvent -= self.on_disconnected
+        if self._task is not None:
+            self._task.cancel()
+        self._set_ready()
+    
+    def on_disconnected(self):
+        """ib.disconnectedEvent handler"""
+        if self.stopping or not self.ready:
+            return
+        self.ready = False
+        self.disconnected_at = clock.time()
+        logging.error("IB connection lost - traders paused, reconnecting")
+        print("\n\t[!] IB connection lost - traders paused, reconnecting...")
+        self._task = asyncio.ensure_future(self.recover())
+    
+    async def wait_ready(self):
+        """Block while the connection is down or being resynced"""
+        if self.ready:
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+    
+    def _set_ready(self):
+        self.ready = True
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(True)
+    
+    async def recover(self):
+        """Reconnect with exponential backoff, then resync"""
+        delay = Config.RECONNECT_INITIAL_DELAY
+        attempts = 0
+        while not self.stopping:
+            await clock.sleep(delay * random.uniform(0.8, 1.2))
+            attempts += 1
+            try:
+                await self.ib.connectAsync(
+                    Config.IB_HOST, Config.IB_PORT, clientId=self.client_id,
+                    timeout=Config.RECONNECT_TIMEOUT
+                )
+                break
+            except Exception as e:
+                logging.warning(f"Reconnect attempt {attempts} failed: {e}")
+                print(f"\t[!] Reconnect attempt {attempts} failed - retrying in {delay * 2:.0f}s")
+                delay = min(delay * 2, Config.RECONNECT_MAX_DELAY)
+        if self.stopping:
+            return
+        
+        connected_at = clock.time()
+        resync_start = time.perf_counter()
+        stats = self.resync()
+        resync_ms = (time.perf_counter() - resync_start) * 1000
+        self.reconnects += 1
+        self.last_recovery = dict(
+            stats, attempts=attempts, resync_ms=round(resync_ms, 2),
+            downtime=round(connected_at - self.disconnected_at, 3),
+            recovery_time=round(clock.time() - self.disconnected_at, 3)
+        )
+        logging.info(f"IB connection restored: {self.last_recovery}")
+        print(
+            f"\t[+] IB connection restored - {stats['reattached']} orders re-attached, "
+            f"{stats['resubscribed']} subscriptions renewed"
+        )
+        self._set_ready()
+    
+    def resync(self) -> dict:
+        """Re-attach every trader's Trade objects and renew all subscriptions"""
+        reattached = missing = 0
+        for trader in list(order_manager.active_traders.values()):
+            for trade in trader.tracked_orders():
+                if self.reattach_trade(trade):
+                    reattached += 1
+                elif not trade.isDone():
+                    missing += 1
+                    logging.warning(
+                        f"[{trader.symbol}] Order {trade.order.orderId} not found after reconnect"
+                    )
+        resubscribed = subscriptions.resubscribe_all(self.ib)
+        account_state.resubscribe()
+        quote_table.rebind_tickers()
+        momentum_scanner.resubscribe()
+        return {'reattached': reattached, 'missing': missing, 'resubscribed': resubscribed}
+    
+    def reattach_trade(self, trade: Trade) -> bool:
+        """Make the client update a trader's existing Trade instead of its post-reconnect copy"""
+        wrapper = self.ib.wrapper
+        order = trade.order
+        key = wrapper.orderKey(order.clientId, order.orderId, order.permId)
+        synced = wrapper.trades.get(key) or wrapper.permId2Trade.get(order.permId)
+        if synced is None:
+            return False
+        if synced is trade:
+            return True
+        
+        # Carry over status and any fills that happened while disconnected
+        known = {fill.execution.execId for fill in trade.fills}
+        trade.fills.extend(fill for fill in synced.fills if fill.execution.execId not in known)
+        trade.log.extend(synced.log)
+        trade.orderStatus = synced.orderStatus
+        if trade.orderStatus.status == 'Filled' and trade.fills:
+            # Completed orders come back without fill quantities
+            filled = sum(fill.execution.shares for fill in trade.fills)
+            trade.orderStatus.filled = filled
+            trade.orderStatus.remaining = order.totalQuantity - filled
+            trade.orderStatus.avgFillPrice = sum(
+                fill.execution.price * fill.execution.shares for fill in trade.fills
+            ) / filled
+        
+        for registry, registry_key in ((wrapper.trades, key), (wrapper.trades, order.permId),
+                                       (wrapper.permId2Trade, order.permId)):
+            if registry.get(registry_key) is synced:
+                registry[registry_key] = trade
+        return True
+
+
+class OrderManager:
+    """Global order manager for emergency operations"""
+    
+    def __init__(self):
+        self.ib = None
+        self.active_traders: Dict[int, 'StockTrader'] = {}   # trade_id -> trader
+        self._by_symbol: Dict[str, list] = {}   # symbol -> traders (several signals may share one)
+        self.hotkey_active = False
+    
+    def attach(self, ib):
+        """Install the fill dispatcher on an IB instance"""
+        if ib is self.ib:
+            return
+        if self.ib is not None:
+            self.ib.execDetailsEvent -= self._dispatch_fill
+        self.ib = ib
+        ib.execDetailsEvent += self._dispatch_fill
+    
+    def _dispatch_fill(self, trade: Trade, fill: Fill):
+        """ib.execDetailsEvent handler - let the traders of this symbol react to their own fills"""
+        for trader in self._by_symbol.get(trade.contract.symbol, ()):
+            trader.on_fill(trade)
+    
+    def register_trader(self, trader: 'StockTrader'):
+        """Register active trader"""
+        if trader.ib is not None:
+            self.attach(trader.ib)
+        self.active_traders[trader.trade_id] = trader
+        self._by_symbol.setdefault(trader.symbol, []).append(trader)
+    
+    def unregister_trader(self, trader: 'StockTrader'):
+        """Unregister completed trader"""
+        if self.active_traders.get(trader.trade_id) is trader:
+            del self.active_traders[trader.trade_id]
+            traders = self._by_symbol[trader.symbol]
+            traders.remove(trader)
+            if not traders:
+                del self._by_symbol[trader.symbol]
+    
+    def sharing(self, trader: 'StockTrader') -> list:
+        """Active traders holding the same broker position (symbol and account) as trader"""
+        return [other for other in self._by_symbol.get(trader.symbol, ()) if other.account == trader.account]
+    
+    def setup_emergency_hotkeys(self):
+        """Setup keyboard hotkeys for emergency operations"""
+        keyboard.add_hotkey('ctrl+shift+x', self.clear_clipboard_symbol)
+    
+    def clear_clipboard_symbol(self):
+        """Emergency clipboard clear to stop processing current symbol"""
+        if self.hotkey_active:
+            return
+        self.hotkey_active = True
+        try:
+            print("\n\t=== CLEARING CLIPBOARD SYMBOL ===")
+            pyperclip.copy("")
+            print("\tClipboard cleared - waiting for new symbol...")
+        except Exception as e:
+            print(f"\tClipboard clear error: {e}")
+        finally:
+            self.hotkey_active = False
+
+
+class SubscriptionManager:
+    """
+    Reference-counted market data and PnL subscriptions per conId
+    
+    Traders acquire a subscription when they need it and release it when
+    they finish; the IB request is only made for the first holder and only
+    cancelled when the last one releases. PnL updates arrive through a
+    single pnlSingleEvent handler that dispatches to the registered
+    callbacks for that conId, so finished traders leave no handlers behind.
+    
+    Every market data consumer (watchlist, price checks, pegged entries,
+    shadow strategies, the scanner) draws on one budget of
+    Config.MARKET_DATA_LINES lines. A holder that passes on_evict may lose
+    its line when the budget is full: lines with only such holders are
+    evicted least-recently-used first. When nothing can be evicted,
+    acquire_mkt_data returns None.
+    """
+    
+    def __init__(self):
+        self.ib = None
+        self._pnl: Dict[tuple, list] = {}   # (account, conId) -> [refcount, PnLSingle]
+        self._pnl_handlers: Dict[tuple, list] = {}   # (account, conId) -> [callback, ...]
+        self._mkt_data: Dict[int, list] = {}   # conId -> [refcount, Ticker, Contract, keepers, [on_evict, ...]]
+        self._evictable: 'OrderedDict[int, None]' = OrderedDict()   # lines held only by evictable holders, LRU first
+        self._mkt_ib = None
+    
+    def attach(self, ib):
+        """Install the PnL dispatcher on an IB instance"""
+        if ib is self.ib:
+            return
+        if self.ib is not None:
+            self.ib.pnlSingleEvent -= self._dispatch_pnl
+        self.ib = ib
+        ib.pnlSingleEvent += self._dispatch_pnl
+    
+    def _dispatch_pnl(self, pnl):
+        """ib.pnlSingleEvent handler - route to the traders of this account/conId"""
+        for callback in self._pnl_handlers.get((pnl.account, pnl.conId), ()):
+            if profiler.active:
+                profiler.time_callback(callback, pnl)
+            else:
+                callback(pnl)
+    
+    def acquire_pnl(self, ib, account: str, con_id: int, callback) -> PnLSingle:
+        """Subscribe (or share) PnL updates for a position"""
+        self.attach(ib)
+        key = (account, con_id)
+        entry = self._pnl.get(key)
+        if entry is None:
+            entry = self._pnl[key] = [0, ib.reqPnLSingle(account, modelCode='', conId=con_id)]
+            logging.info(f"PnL subscription opened for conId {con_id} ({account})")
+        entry[0] += 1
+        self._pnl_handlers.setdefault(key, []).append(callback)
+        return entry[1]
+    
+    def release_pnl(self, account: str, con_id: int, callback):
+        """Release a PnL subscription; cancelled when the last holder releases"""
+        key = (account, con_id)
+        handlers = self._pnl_handlers.get(key)
+        if handlers and callback in handlers:
+            handlers.remove(callback)
+            if not handlers:
+                del self._pnl_handlers[key]
+        entry = self._pnl.get(key)
+        if entry is None:
+            return
+        entry[0] -= 1
+        if entry[0] <= 0:
+            del self._pnl[key]
+            try:
+                self.ib.cancelPnLSingle(account, '', con_id)
+            except Exception as e:
+                logging.error(f"Cancel PnL subscription error for conId {con_id}: {e}")
+            logging.info(f"PnL subscription closed for conId {con_id} ({account})")
+    
+    def acquire_mkt_data(self, ib, contract: Contract, on_evict=None) -> Ticker:
+        """
+        Subscribe (or share) streaming quotes for a qualified contract;
+        None when every line is taken by holders that keep theirs
+        
+        on_evict(contract) makes this hold evictable: it is called instead
+        of a release when the line is taken back for another consumer.
+        """
+        self._mkt_ib = ib
+        con_id = contract.conId
+        entry = self._mkt_data.get(con_id)
+        if entry is None:
+            if len(self._mkt_data) >= Config.MARKET_DATA_LINES and not self.evict_one():
+                logging.warning(
+                    f"[{contract.symbol}] No market data line available ({Config.MARKET_DATA_LINES} in use)"
+                )
+                return None
+            entry = self._mkt_data[con_id] = [0, ib.reqMktData(contract, '', False, False), contract, 0, []]
+            logging.info(f"[{contract.symbol}] Market data subscription opened")
+        entry[0] += 1
+        if on_evict is None:
+            entry[3] += 1
+            self._evictable.pop(con_id, None)
+        else:
+            entry[4].append(on_evict)
+            if not entry[3]:
+                self._evictable[con_id] = None
+                self._evictable.move_to_end(con_id)
+        return entry[1]
+    
+    def release_mkt_data(self, ib, contract: Contract, on_evict=None):
+        """Release a market data subscription (the on_evict it was acquired with, if any)"""
+        con_id = contract.conId
+        entry = self._mkt_data.get(con_id)
+        if entry is None:
+            return
+        entry[0] -= 1
+        if on_evict is None:
+            entry[3] -= 1
+        elif on_evict in entry[4]:
+            entry[4].remove(on_evict)
+        if entry[0] <= 0:
+            self._close_mkt_data(ib, con_id)
+        elif not entry[3]:
+            self._evictable[con_id] = None
+    
+    def _close_mkt_data(self, ib, con_id: int):
+        entry = self._mkt_data.pop(con_id)
+        self._evictable.pop(con_id, None)
+        try:
+            ib.cancelMktData(entry[2])
+        except Exception as e:
+            logging.error(f"[{entry[2].symbol}] Cancel market data error: {e}")
+        logging.info(f"[{entry[2].symbol}] Market data subscription closed")
+    
+    def touch(self, con_id: int):
+        """Mark an evictable line as just used"""
+        if con_id in self._evictable:
+            self._evictable.move_to_end(con_id)
+    
+    def evict_one(self) -> bool:
+        """Take back the least recently used evictable line"""
+        if not self._evictable:
+            return False
+        con_id = next(iter(self._evictable))
+        entry = self._mkt_data[con_id]
+        self._close_mkt_data(self._mkt_ib, con_id)
+        for on_evict in entry[4]:
+            on_evict(entry[2])
+        logging.info(f"[{entry[2].symbol}] Market data line evicted (least recently used)")
+        return True
+    
+    def resubscribe_all(self, ib) -> int:
+        """Re-request every held subscription after a reconnect (IB forgets them)"""
+        for (account, con_id), entry in self._pnl.items():
+            entry[1] = ib.reqPnLSingle(account, modelCode='', conId=con_id)
+        for entry in self._mkt_data.values():
+            entry[1] = ib.reqMktData(entry[2], '', False, False)
+        return len(self._pnl) + len(self._mkt_data)
+    
+    def ticker(self, con_id: int) -> Ticker:
+        """Current Ticker for a subscribed conId"""
+        entry = self._mkt_data.get(con_id)
+        return entry[1] if entry else None
+    
+    def counts(self) -> dict:
+        """Live subscription and handler counts"""
+        return {
+            'pnl_subscriptions': len(self._pnl),
+            'pnl_handlers': sum(len(handlers) for handlers in self._pnl_handlers.values()),
+            'mkt_data_subscriptions': len(self._mkt_data),
+            'ib_pnl_handlers': len(self.ib.pnlSingleEvent) if self.ib is not None else 0
+        }
+
+
+class AccountSnapshot:
+    """Latest typed account values, each with the wall time it last changed"""
+    __slots__ = ('account', 'net_liquidation', 'buying_power', 'excess_liquidity', 'day_pnl', 'updated')
+    
+    def __init__(self, account: str):
+        self.account = account
+        self.net_liquidation = None
+        self.buying_power = None
+        self.excess_liquidity = None
+        self.day_pnl = None
+        self.updated: Dict[str, float] = {}   # field -> time.time() of the last update
+    
+    def age(self, field: str = 'net_liquidation') -> float:
+        """Seconds since the field was last updated (inf if it never was)"""
+        updated = self.updated.get(field)
+        return time.time() - updated if updated is not None else float('inf')
+    
+    def as_dict(self) -> dict:
+        return {
+            'net_liquidation': self.net_liquidation,
+            'buying_power': self.buying_power,
+            'excess_liquidity': self.excess_liquidity,
+            'day_pnl': self.day_pnl,
+            'age_seconds': round(self.age(), 1),
+        }
+
+
+class AccountState:
+    """
+    Account values kept current by one subscription instead of polled
+    
+    reqAccountSummary streams NetLiquidation, BuyingPower and
+    ExcessLiquidity for every account through accountSummaryEvent, the
+    default account's updates also arrive through accountValueEvent, and
+    reqPnL supplies day P&L. Each update is parsed once into an
+    AccountSnapshot, so a read is a dict lookup and an attribute; values that
+    have not arrived yet read as None rather than raising.
+    """
+    TAGS = {
+        'NetLiquidation': 'net_liquidation',
+        'BuyingPower': 'buying_power',
+        'ExcessLiquidity': 'excess_liquidity',
+    }
+    
+    def __init__(self):
+        self.ib = None
+        self.accounts: Dict[str, AccountSnapshot] = {}
+        self.default_account = None
+        self._pnl: Dict[str, object] = {}   # account -> PnL subscription
+        self._ready = None
+        self.updates = 0
+    
+    async def start(self, ib, accounts: List[str] = None):
+        """Subscribe to the account summary and day P&L of every managed account"""
+        self.ib = ib
+        self._ready = asyncio.Event()
+        accounts = accounts or list(ib.wrapper.accounts)
+        self.default_account = accounts[0] if accounts else None
+        ib.accountSummaryEvent += self.on_account_value
+        ib.accountValueEvent += self.on_account_value
+        ib.pnlEvent += self.on_pnl
+        for value in ib.accountValues():
+            self.on_account_value(value)
+        await self.subscribe(accounts)
+    
+    async def subscribe(self, accounts: List[str] = None):
+        """(Re-)request the summary and P&L streams (IB forgets them on reconnect)"""
+        accounts = accounts or list(self._pnl) or list(self.ib.wrapper.accounts)
+        for account in accounts:
+            self._pnl[account] = self.ib.reqPnL(account)
+        await self.ib.reqAccountSummaryAsync()
+    
+    def resubscribe(self):
+        """Renew the subscriptions after a reconnect (returns immediately)"""
+        if self.ib is not None:
+            asyncio.ensure_future(self.subscribe())
+    
+    def stop(self):
+        if self.ib is None:
+            return
+        self.ib.accountSummaryEvent -= self.on_account_value
+        self.ib.accountValueEvent -= self.on_account_value
+        self.ib.pnlEvent -= self.on_pnl
+        for account in self._pnl:
+            try:
+                self.ib.cancelPnL(account)
+            except Exception as e:
+                logging.warning(f"Cancel account PnL error: {e}")
+        self._pnl.clear()
+        self.ib = None
+    
+    def _snapshot(self, account: str) -> AccountSnapshot:
+        snapshot = self.accounts.get(account)
+        if snapshot is None:
+            snapshot = self.accounts[account] = AccountSnapshot(account)
+        return snapshot
+    
+    def on_account_value(self, value):
+        """accountSummaryEvent / accountValueEvent handler"""
+        field = self.TAGS.get(value.tag)
+        if field is None or not value.account or value.account == 'All':
+            return
+        try:
+            number = float(value.value)
+        except ValueError:
+            return
+        snapshot = self._snapshot(value.account)
+        setattr(snapshot, field, number)
+        snapshot.updated[field] = time.time()
+        self.updates += 1
+        if field == 'net_liquidation' and self._ready is not None:
+            self._ready.set()
+    
+    def on_pnl(self, pnl):
+        """pnlEvent handler (account-wide day P&L)"""
+        if pnl.dailyPnL is None or pnl.dailyPnL != pnl.dailyPnL:
+            return
+        snapshot = self._snapshot(pnl.account)
+        snapshot.day_pnl = pnl.dailyPnL
+        snapshot.updated['day_pnl'] = time.time()
+        self.updates += 1
+    
+    def get(self, account: str = None) -> AccountSnapshot:
+        """Snapshot for an account (default: the first managed account), None before any data"""
+        return self.accounts.get(account or self.default_account)
+    
+    def net_liquidation(self, account: str = None) -> float:
+        snapshot = self.get(account)
+        return snapshot.net_liquidation if snapshot else None
+    
+    def buying_power(self, account: str = None) -> float:
+        snapshot = self.get(account)
+        return snapshot.buying_power if snapshot else None
+    
+    async def wait_ready(self, timeout: float = None) -> bool:
+        """Wait for the first NetLiquidation; False on timeout"""
+        if self._ready is None:
+            return False
+        try:
+            await clock.wait_for(self._ready.wait(), timeout or Config.ACCOUNT_WAIT_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    def risk_check(self, symbol: str, account: str = None) -> bool:
+        """Account-level gate for a new signal"""
+        snapshot = self.get(account)
+        if snapshot is None:
+            return True
+        if snapshot.excess_liquidity is not None and snapshot.excess_liquidity < Config.MIN_EXCESS_LIQUIDITY:
+            logging.warning(f"[{symbol}] Refused: excess liquidity {snapshot.excess_liquidity:,.2f}")
+            print(f"\t[!] Excess liquidity ${snapshot.excess_liquidity:,.2f} below "
+                  f"${Config.MIN_EXCESS_LIQUIDITY:,.2f} - {symbol} not traded")
+            return False
+        if snapshot.age() > Config.ACCOUNT_STALE_SECONDS:
+            logging.warning(f"Account values are {snapshot.age():.0f}s old")
+            print(f"\t[!] Account values are {snapshot.age():.0f}s old")
+        return True
+    
+    def stats(self) -> dict:
+        return {
+            'updates': self.updates,
+            'accounts': {account: snapshot.as_dict() for account, snapshot in self.accounts.items()},
+        }
+
+
+class QuoteTable:
+    """
+    Streaming top-of-book quotes held in preallocated arrays
+    
+    Watchlist symbols stay subscribed for the whole session. Other symbols
+    are subscribed on demand as evictable lines, which SubscriptionManager
+    takes back least-recently-used first when another consumer needs a
+    line under Config.MARKET_DATA_LINES.
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ib = None
+        self.bid = np.full(capacity, np.nan)
+        self.ask = np.full(capacity, np.nan)
+        self.last = np.full(capacity, np.nan)
+        self.updated = np.zeros(capacity)
+        
+        self.slots: Dict[str, int] = {}   # symbol -> slot
+        self.contracts: Dict[str, Contract] = {}
+        self._ticker_slots: Dict[int, int] = {}   # id(ticker) -> slot
+        self._tickers: Dict[str, Ticker] = {}
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self.pinned = set()   # watchlist symbols (never evicted)
+        
+        # Sanity check timing
+        self.checks = 0
+        self.check_ns_total = 0
+        self.check_ns_max = 0
+    
+    async def start(self, ib: IB, watchlist: List[str]):
+        """Attach to IB and subscribe the watchlist"""
+        self.ib = ib
+        ib.pendingTickersEvent += self.on_pending_tickers
+        for symbol in watchlist:
+            await self.subscribe(symbol.upper(), pinned=True)
+        logging.info(f"Watchlist streaming {len(self.pinned)} symbols")
+        print(f"\tWatchlist streaming {len(self.pinned)} symbols")
+    
+    async def subscribe(self, symbol: str, pinned: bool = False) -> bool:
+        """Start streaming a symbol into a free slot (pinned: never evicted)"""
+        if symbol in self.slots:
+            return True
+        contract = Stock(symbol, 'SMART', 'USD')
+        qualified = await self.ib.qualifyContractsAsync(contract)
+        if not qualified or not contract.conId:
+            logging.warning(f"[{symbol}] Could not qualify contract for quotes")
+            return False
+        
+        # No awaits from here on: the line (evicting only now) and slot are reserved in one step
+        if symbol in self.slots:
+            return True   # a concurrent subscribe got there first
+        if not self._free_slots:
+            logging.warning(f"[{symbol}] No quote slot available")
+            return False
+        ticker = subscriptions.acquire_mkt_data(self.ib, contract, on_evict=None if pinned else self._evicted)
+        if ticker is None:
+            return False
+        slot = self._free_slots.pop()
+        self.bid[slot] = self.ask[slot] = self.last[slot] = np.nan
+        self.updated[slot] = 0.0
+        if pinned:
+            self.pinned.add(symbol)
+        self.slots[symbol] = slot
+        self.contracts[symbol] = contract
+        self._tickers[symbol] = ticker
+        self._ticker_slots[id(ticker)] = slot
+        if ticker.time:
+            self.on_pending_tickers([ticker])   # already streaming elsewhere
+        logging.info(f"[{symbol}] Quote subscription started (slot {slot})")
+        return True
+    
+    def unsubscribe(self, symbol: str):
+        """Stop streaming a symbol and free its slot"""
+        contract = self._free(symbol)
+        if contract is None:
+            return
+        pinned = symbol in self.pinned
+        self.pinned.discard(symbol)
+        subscriptions.release_mkt_data(self.ib, contract, on_evict=None if pinned else self._evicted)
+        logging.info(f"[{symbol}] Quote subscription released")
+    
+    def _evicted(self, contract: Contract):
+        """SubscriptionManager took back an on-demand symbol's line"""
+        self._free(contract.symbol)
+    
+    def _free(self, symbol: str):
+        """Clear a symbol's slot; returns its contract (None if not held)"""
+        slot = self.slots.pop(symbol, None)
+        if slot is None:
+            return None
+        ticker = self._tickers.pop(symbol)
+        self._ticker_slots.pop(id(ticker), None)
+        self.bid[slot] = self.ask[slot] = self.last[slot] = np.nan
+        self._free_slots.append(slot)
+        return self.contracts.pop(symbol)
+    
+    def rebind_tickers(self):
+        """Pick up the new Ticker objects after subscriptions were re-requested"""
+        self._ticker_slots.clear()
+        for symbol, slot in self.slots.items():
+            ticker = subscriptions.ticker(self.contracts[symbol].conId)
+            if ticker is None:
+                continue
+            self._tickers[symbol] = ticker
+            self._ticker_slots[id(ticker)] = slot
+    
+    def on_pending_tickers(self, tickers):
+        """ib.pendingTickersEvent handler"""
+        now = clock.time()
+        for ticker in tickers:
+            slot = self._ticker_slots.get(id(ticker))
+            if slot is None:
+                continue
+            self.bid[slot] = ticker.bid if ticker.bid and ticker.bid > 0 else np.nan
+            self.ask[slot] = ticker.ask if ticker.ask and ticker.ask > 0 else np.nan
+            self.last[slot] = ticker.last if ticker.last and ticker.last > 0 else np.nan
+            self.updated[slot] = now
+    
+    def reference_price(self, symbol: str):
+        """Best reference price (ask, then last, then bid) and its age in seconds"""
+        slot = self.slots.get(symbol)
+        if slot is None or not self.updated[slot]:
+            return None, None
+        for price in (self.ask[slot], self.last[slot], self.bid[slot]):
+            if price == price:   # not NaN
+                return float(price), clock.time() - self.updated[slot]
+        return None, None
+    
+    async def wait_for_quote(self, symbol: str, timeout: float) -> bool:
+        """Wait for the first quote of a freshly subscribed symbol"""
+        start = clock.time()
+        while clock.time() - start < timeout:
+            if self.reference_price(symbol)[0] is not None:
+                return True
+            await clock.sleep(0.05)
+        return False
+    
+    def check_price(self, symbol: str, price: float):
+        """
+        Compare a signal price with the live quote
+        
+        Returns:
+            (ok, reference_price, deviation_pct) - reference is None when
+            there is no usable quote
+        """
+        t0 = time.perf_counter_ns()
+        reference, age = self.reference_price(symbol)
+        if reference is None or age > Config.QUOTE_STALE_SECONDS:
+            result = (not Config.PRICE_SANITY_REJECT_NO_QUOTE, None, None)
+        else:
+            deviation_pct = (price - reference) / reference * 100
+            result = (abs(deviation_pct) <= Config.PRICE_SANITY_MAX_DEVIATION_PCT, reference, deviation_pct)
+        elapsed = time.perf_counter_ns() - t0
+        self.checks += 1
+        self.check_ns_total += elapsed
+        if elapsed > self.check_ns_max:
+            self.check_ns_max = elapsed
+        return result
+    
+    async def sanity_check(self, symbol: str, price: float) -> bool:
+        """Check a pasted price against the market, subscribing on demand"""
+        if symbol not in self.slots:
+            if await self.subscribe(symbol):
+                await self.wait_for_quote(symbol, Config.QUOTE_WAIT_SECONDS)
+        contract = self.contracts.get(symbol)
+        if contract is not None:
+            subscriptions.touch(contract.conId)
+        
+        ok, reference, deviation_pct = self.check_price(symbol, price)
+        if reference is None:
+            logging.warning(f"[{symbol}] No live quote for price check of {price}")
+            print(f"\t[{symbol}] No live quote - price {price} unchecked")
+        elif ok:
+            logging.info(f"[{symbol}] Price {price} vs quote {reference} ({deviation_pct:+.2f}%) - OK")
+            print(f"\t[{symbol}] Price check OK: {price} vs live {reference} ({deviation_pct:+.2f}%)")
+        else:
+            logging.warning(f"[{symbol}] Price {price} rejected - live quote {reference} ({deviation_pct:+.2f}%)")
+            print(
+                f"\t[!] {symbol} price {price} is {deviation_pct:+.2f}% from live quote "
+                f"{reference} - signal rejected"
+            )
+        return ok
+    
+    def stats(self) -> dict:
+        """Price check timing statistics"""
+        return {
+            'checks': self.checks,
+            'mean_us': round(self.check_ns_total / self.checks / 1000, 3) if self.checks else 0,
+            'max_us': round(self.check_ns_max / 1000, 3),
+            'subscriptions': len(self.slots)
+        }
+
+
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'),
+    ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+])
+
+
+class BarStore:
+    """
+    Historical bars per symbol in memory-mapped files
+    
+    Each symbol has one file under CACHE_DIR/BAR_DIR: a 16-byte header
+    (magic, bar count) followed by fixed-size BAR_DTYPE records. Tracked
+    symbols are topped up in the background with requests that only cover
+    the span since the last stored bar, under IB's historical data pacing
+    limits. ATR is recomputed when bars arrive and cached, so a lookup at
+    signal time is a dict read. A file written with another BAR_CAPACITY is
+    rewritten at the new size keeping its newest bars.
+    """
+    HEADER = struct.Struct('<8sq')
+    MAGIC = b'DHBARS01'
+    
+    def __init__(self, directory: str, capacity: int):
+        self.directory = directory
+        self.capacity = capacity
+        self.ib = None
+        self._maps: Dict[str, np.memmap] = {}
+        self._bars: Dict[str, np.ndarray] = {}
+        self.contracts: Dict[str, Contract] = {}
+        self.symbols = set()   # symbols kept up to date by the refresher
+        self.indicators: Dict[str, tuple] = {}   # symbol -> (atr, atr_pct, last_close)
+        self._last_fetch: Dict[str, float] = {}
+        self._requests = deque()   # times of recent historical requests
+        self._task = None
+        
+        # Stats
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.bars_added = 0
+        self.lookups = 0
+        self.lookup_ns_total = 0
+    
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, f"{symbol}.bars")
+    
+    def _open(self, symbol: str) -> np.ndarray:
+        """Map a symbol's bar file, creating it on first use"""
+        bars = self._bars.get(symbol)
+        if bars is not None:
+            return bars
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(symbol)
+        size = self.HEADER.size + self.capacity * BAR_DTYPE.itemsize
+        if os.path.exists(path) and os.path.getsize(path) != size:
+            self._resize(symbol, path, size)
+        fresh = not os.path.exists(path)
+        mapped = np.memmap(path, dtype=np.uint8, mode='w+' if fresh else 'r+', shape=(size,))
+        if fresh or self.HEADER.unpack_from(mapped, 0)[0] != self.MAGIC:
+            self.HEADER.pack_into(mapped, 0, self.MAGIC, 0)
+        self._maps[symbol] = mapped
+        bars = self._bars[symbol] = mapped[self.HEADER.size:].view(BAR_DTYPE)
+        self._update_indicators(symbol)
+        return bars
+    
+    def _resize(self, symbol: str, path: str, size: int):
+        """Rewrite a bar file made with another capacity at this one, keeping the newest bars"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        records = (len(data) - self.HEADER.size) // BAR_DTYPE.itemsize
+        if (len(data) < self.HEADER.size or self.HEADER.unpack_from(data, 0)[0] != self.MAGIC
+                or (len(data) - self.HEADER.size) % BAR_DTYPE.itemsize):
+            backup = path + '.bak'
+            os.replace(path, backup)
+            logging.warning(f"[{symbol}] Unreadable bar file moved to {backup}")
+            return
+        count = min(max(self.HEADER.unpack_from(data, 0)[1], 0), records)
+        kept = np.frombuffer(data, dtype=BAR_DTYPE, count=count, offset=self.HEADER.size)[-self.capacity:]
+        tmp_path = path + '.tmp'
+        mapped = np.memmap(tmp_path, dtype=np.uint8, mode='w+', shape=(size,))
+        self.HEADER.pack_into(mapped, 0, self.MAGIC, len(kept))
+        mapped[self.HEADER.size:].view(BAR_DTYPE)[:len(kept)] = kept
+        mapped.flush()
+        del mapped
+        os.replace(tmp_path, path)
+        if len(kept) < count:
+            logging.warning(f"[{symbol}] Bar file shrunk to {self.capacity} bars, {count - len(kept)} oldest dropped")
+        else:
+            logging.info(f"[{symbol}] Bar file resized from {records} to {self.capacity} bars, {count} kept")
+    
+    def count(self, symbol: str) -> int:
+        """Bars stored for a symbol"""
+        self._open(symbol)
+        return self.HEADER.unpack_from(self._maps[symbol], 0)[1]
+    
+    def bars(self, symbol: str) -> np.ndarray:
+        """Stored bars, oldest first (a view onto the mapped file)"""
+        return self._open(symbol)[:self.count(symbol)]
+    
+    def last_time(self, symbol: str):
+        """Epoch seconds of the newest stored bar, or None"""
+        count = self.count(symbol)
+        return int(self._bars[symbol]['time'][count - 1]) if count else None
+    
+    def append(self, symbol: str, rows: np.ndarray) -> int:
+        """
+        Merge bars (oldest first) into the store
+        
+        Rows older than the newest stored bar are ignored; a row with the
+        same timestamp replaces it (the last bar of a fetch is usually still
+        forming). Returns the number of new bars.
+        """
+        bars = self._open(symbol)
+        count = self.count(symbol)
+        if count and len(rows):
+            last = bars['time'][count - 1]
+            rows = rows[rows['time'] >= last]
+            if len(rows) and rows['time'][0] == last:
+                bars[count - 1] = rows[0]
+                rows = rows[1:]
+        added = len(rows)
+        if added:
+            rows = rows[-self.capacity:]
+            if count + len(rows) > self.capacity:
+                keep = max(self.capacity // 2 - len(rows), 0)
+                bars[:keep] = bars[count - keep:count]
+                count = keep
+            bars[count:count + len(rows)] = rows
+            count += len(rows)
+            self.HEADER.pack_into(self._maps[symbol], 0, self.MAGIC, count)
+            self.bars_added += added
+        self._update_indicators(symbol)
+        return added
+    
+    def _update_indicators(self, symbol: str):
+        """Recompute the cached Wilder ATR from the newest bars"""
+        period = Config.ATR_PERIOD
+        count = self.HEADER.unpack_from(self._maps[symbol], 0)[1]
+        if count <= period:
+            self.indicators.pop(symbol, None)
+            return
+        recent = self._bars[symbol][max(count - period * 10, 0):count]
+        high, low, close = recent['high'], recent['low'], recent['close']
+        true_range = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+        atr = float(true_range[:period].mean())
+        for value in true_range[period:].tolist():
+            atr += (value - atr) / period
+        last_close = float(close[-1])
+        if last_close > 0:
+            self.indicators[symbol] = (atr, atr / last_close, last_close)
+    
+    def atr_pct(self, symbol: str):
+        """Cached ATR as a fraction of the last close, or None"""
+        t0 = time.perf_counter_ns()
+        cached = self.indicators.get(symbol)
+        self.lookups += 1
+        self.lookup_ns_total += time.perf_counter_ns() - t0
+        return cached[1] if cached is not None else None
+    
+    def start(self, ib: IB, symbols: List[str]):
+        """Track symbols and start the background refresher"""
+        self.ib = ib
+        for symbol in symbols:
+            self.track(symbol)
+        self._task = asyncio.create_task(self.run_refresher())
+        logging.info(f"Bar store tracking {len(self.symbols)} symbols")
+        print(f"\tBar store tracking {len(self.symbols)} symbols")
+    
+    def stop(self):
+        """Stop the refresher and flush the mapped files"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for mapped in self._maps.values():
+            mapped.flush()
+    
+    def track(self, symbol: str):
+        """Keep a symbol topped up from now on"""
+        if symbol not in self.symbols:
+            self.symbols.add(symbol)
+            self._open(symbol)
+    
+    async def _pace(self, symbol: str):
+        """Wait until a historical request for symbol fits IB's pacing limits"""
+        while True:
+            now = clock.time()
+            while self._requests and now - self._requests[0] >= Config.HIST_WINDOW_SECONDS:
+                self._requests.popleft()
+            wait = self._last_fetch.get(symbol, 0) + Config.HIST_MIN_INTERVAL - now
+            if len(self._requests) >= Config.HIST_MAX_REQUESTS:
+                wait = max(wait, self._requests[0] + Config.HIST_WINDOW_SECONDS - now)
+            if wait <= 0:
+                self._requests.append(now)
+                self._last_fetch[symbol] = now
+                return
+            await clock.sleep(wait)
+    
+    def _duration(self, symbol: str) -> str:
+        """Request span covering the bars since the newest stored one"""
+        last = self.last_time(symbol)
+        if last is None:
+            return Config.BAR_HISTORY_DURATION
+        gap = int(clock.time() - last) + Config.BAR_SECONDS
+        if gap <= 86400:
+            return f"{max(gap, Config.BAR_SECONDS * 2)} S"
+        return f"{min(-(-gap // 86400), 365)} D"
+    
+    async def fetch(self, symbol: str) -> int:
+        """Fetch bars newer than the store's last one; returns bars added"""
+        contract = self.contracts.get(symbol)
+        if contract is None:
+            contract = Stock(symbol, 'SMART', 'USD')
+            qualified = await self.ib.qualifyContractsAsync(contract)
+            if not qualified or not contract.conId:
+                raise ValueError("could not qualify contract")
+            self.contracts[symbol] = contract
+        duration = self._duration(symbol)
+        await self._pace(symbol)
+        bar_list = await self.ib.reqHistoricalDataAsync(
+            contract, endDateTime='', durationStr=duration,
+            barSizeSetting=Config.BAR_SIZE, whatToShow='TRADES',
+            useRTH=False, formatDate=2
+        )
+        self.fetches += 1
+        rows = np.array(
+            [(int(bar.date.timestamp()), bar.open, bar.high, bar.low, bar.close, bar.volume)
+             for bar in bar_list or []],
+            dtype=BAR_DTYPE
+        )
+        added = self.append(symbol, rows)
+        logging.info(f"[{symbol}] Bars: {duration} requested, {added} new, {self.count(symbol)} stored")
+        return added
+    
+    async def run_refresher(self):
+        """Top up tracked symbols every BAR_REFRESH_SECONDS"""
+        while True:
+            for symbol in sorted(self.symbols):
+                if clock.time() - self._last_fetch.get(symbol, 0) < Config.BAR_REFRESH_SECONDS:
+                    continue
+                await connection_supervisor.wait_ready()
+                try:
+                    await self.fetch(symbol)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.fetch_errors += 1
+                    self._last_fetch[symbol] = clock.time()
+                    logging.warning(f"[{symbol}] Bar fetch failed: {e}")
+            await clock.sleep(1)
+    
+    def stats(self) -> dict:
+        """Fetch and lookup statistics"""
+        return {
+            'symbols': len(self.symbols),
+            'fetches': self.fetches,
+            'fetch_errors': self.fetch_errors,
+            'bars_added': self.bars_added,
+            'lookups': self.lookups,
+            'mean_lookup_us': round(self.lookup_ns_total / self.lookups / 1000, 3) if self.lookups else 0,
+        }
+
+
+class MomentumScanner:
+    """
+    Rolling momentum features for a universe of streaming symbols
+    
+    Each symbol owns a row of preallocated arrays: ring buffers holding the
+    close and traded volume of every SCANNER_BIN_SECONDS bin over the last
+    SCANNER_LOOKBACK_SECONDS, the running window volume, an EWMA baseline of
+    volume per bin and the session high. A batch of ticks is folded in with
+    a handful of vectorized operations over the ticked rows, and rolling to
+    the next bin touches each row once, so the cost of a tick does not grow
+    with the lookback or the universe. A tick that sets a new high, is up
+    SCANNER_MIN_CHANGE_PCT over the lookback and comes with
+    SCANNER_MIN_RELATIVE_VOLUME times the usual volume becomes a
+    (symbol, price) signal passed to on_signal.
+    
+    The arrays are allocated by start() or the first slot(), so a bot
+    that never runs the scanner does not pay for them.
+    """
+    
+    def __init__(self, capacity: int = None, lookback: float = None, bin_seconds: float = None):
+        self.capacity = capacity or Config.SCANNER_CAPACITY
+        self.bin_seconds = bin_seconds or Config.SCANNER_BIN_SECONDS
+        self.bins = int(round((lookback or Config.SCANNER_LOOKBACK_SECONDS) / self.bin_seconds)) + 1
+        self.decay = 0.5 ** (self.bin_seconds / Config.SCANNER_VOLUME_HALFLIFE)
+        self.close = None   # last price in each bin
+        self.volume = None   # volume traded in each bin
+        self.window_volume = None   # sum of the volume ring
+        self.base_volume = None   # EWMA of volume per closed bin
+        self.last = None
+        self.high = None
+        self.cum_volume = None   # feed's day volume at the last quote
+        self.first_bin = None
+        self.last_signal = None
+        self.bin = None   # index of the bin being filled
+        
+        self.slots: Dict[str, int] = {}   # symbol -> row
+        self.symbols: List[str] = []   # row -> symbol
+        self.on_signal = None   # callback(symbol, price, tick_stamp_ns)
+        self.ib = None
+        self.scan = None
+        self.contracts: Dict[str, Contract] = {}   # symbols holding a market data line
+        self._con_slots: Dict[int, int] = {}   # conId -> row
+        self._task = None
+        
+        # Stats
+        self.ticks = 0
+        self.batches = 0
+        self.batch_ns_total = 0
+        self.batch_ns_max = 0
+        self.signals = 0
+        self.dispatched = 0
+        self.signal_latency_us = deque(maxlen=4096)   # tick receipt -> signal emitted
+        self.dispatch_latency_us = deque(maxlen=4096)   # tick receipt -> trader spawned
+    
+    def allocate(self):
+        """Allocate the feature arrays (once)"""
+        if self.last is not None:
+            return
+        self.close = np.full((self.capacity, self.bins), np.nan)
+        self.volume = np.zeros((self.capacity, self.bins))
+        self.window_volume = np.zeros(self.capacity)
+        self.base_volume = np.zeros(self.capacity)
+        self.last = np.full(self.capacity, np.nan)
+        self.high = np.full(self.capacity, np.nan)
+        self.cum_volume = np.full(self.capacity, np.nan)
+        self.first_bin = np.zeros(self.capacity, dtype=np.int64)
+        self.last_signal = np.full(self.capacity, -np.inf)
+    
+    def slot(self, symbol: str):
+        """Row for a symbol, allocated on first use; None when the arrays are full"""
+        slot = self.slots.get(symbol)
+        if slot is None:
+            if len(self.symbols) >= self.capacity:
+                return None
+            self.allocate()
+            slot = self.slots[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return slot
+    
+    def advance(self, now: float):
+        """Roll every row's rings forward to the bin containing now"""
+        current = int(now // self.bin_seconds)
+        if self.bin is None:
+            self.bin = current
+        steps = current - self.bin
+        if steps <= 0:
+            return
+        n = len(self.symbols)
+        for b in range(self.bin + 1, self.bin + 1 + min(steps, self.bins)):
+            closed = self.volume[:n, (b - 1) % self.bins]
+            self.base_volume[:n] = self.base_volume[:n] * self.decay + closed * (1 - self.decay)
+            pos = b % self.bins
+            self.window_volume[:n] -= self.volume[:n, pos]
+            self.volume[:n, pos] = 0.0
+            self.close[:n, pos] = self.last[:n]
+        if steps > self.bins:
+            # Idle longer than the window: the remaining bins closed empty
+            self.base_volume[:n] *= self.decay ** (steps - self.bins)
+            self.window_volume[:n] = 0.0
+        self.bin = current
+    
+    def on_ticks(self, slots: np.ndarray, prices: np.ndarray, volumes: np.ndarray,
+                 stamp_ns: int = None, now: float = None) -> int:
+        """
+        Fold a batch of ticks (one per row, volume traded since the last
+        tick) into the features; returns the number of signals emitted
+        """
+        t0 = time.perf_counter_ns()
+        now = clock.time() if now is None else now
+        self.advance(now)
+        pos = self.bin % self.bins
+        fresh = self.last[slots] != self.last[slots]
+        if fresh.any():
+            # First tick of a symbol: its whole ring starts at this price
+            rows = slots[fresh]
+            self.close[rows] = prices[fresh, None]
+            self.first_bin[rows] = self.bin
+        previous_high = self.high[slots]
+        self.last[slots] = prices
+        self.close[slots, pos] = prices
+        self.high[slots] = np.fmax(previous_high, prices)
+        self.volume[slots, pos] += volumes
+        window_volume = self.window_volume[slots] + volumes
+        self.window_volume[slots] = window_volume
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_pct = (prices / self.close[slots, (pos + 1) % self.bins] - 1) * 100
+            relative_volume = window_volume / (self.base_volume[slots] * self.bins)
+            hits = (
+                (prices > previous_high)
+                & (change_pct >= Config.SCANNER_MIN_CHANGE_PCT)
+                & (relative_volume >= Config.SCANNER_MIN_RELATIVE_VOLUME)
+                & (prices >= Config.SCANNER_MIN_PRICE) & (prices <= Config.SCANNER_MAX_PRICE)
+                & (now - self.last_signal[slots] >= Config.SCANNER_COOLDOWN_SECONDS)
+                & (self.bin - self.first_bin[slots] >= self.bins - 1)
+            )
+        
+        emitted = 0
+        if hits.any():
+            for i in np.flatnonzero(hits).tolist():
+                slot = int(slots[i])
+                symbol, price = self.symbols[slot], float(prices[i])
+                self.last_signal[slot] = now
+                stamp = t0 if stamp_ns is None else stamp_ns
+                self.signal_latency_us.append((time.perf_counter_ns() - stamp) / 1000)
+                self.signals += 1
+                emitted += 1
+                logging.info(
+                    f"[{symbol}] Scanner signal @ {price}: {change_pct[i]:+.1f}% over "
+                    f"{(self.bins - 1) * self.bin_seconds:g}s, relative volume {relative_volume[i]:.1f}, new high"
+                )
+                if self.on_signal is not None:
+                    self.on_signal(symbol, price, stamp)
+        
+        elapsed = time.perf_counter_ns() - t0
+        self.ticks += len(slots)
+        self.batches += 1
+        self.batch_ns_total += elapsed
+        self.batch_ns_max = max(self.batch_ns_max, elapsed)
+        return emitted
+    
+    def features(self, symbol: str) -> dict:
+        """Current feature values of a symbol, or None"""
+        slot = self.slots.get(symbol)
+        if slot is None or self.last[slot] != self.last[slot]:
+            return None
+        oldest = self.close[slot, (self.bin + 1) % self.bins]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative_volume = self.window_volume[slot] / (self.base_volume[slot] * self.bins)
+        return {
+            'last': float(self.last[slot]),
+            'change_pct': float((self.last[slot] / oldest - 1) * 100),
+            'window_volume': float(self.window_volume[slot]),
+            'relative_volume': float(relative_volume),
+            'high': float(self.high[slot]),
+        }
+    
+    def record_dispatch(self, stamp_ns: int):
+        """A scanner signal reached a trader"""
+        self.dispatched += 1
+        self.dispatch_latency_us.append((time.perf_counter_ns() - stamp_ns) / 1000)
+    
+    # Sources
+    
+    async def start(self, ib: IB, source: str = None):
+        """Start feeding the scanner from quotes, an IB scan or a replay file"""
+        source = source or Config.SCANNER_SOURCE
+        self.ib = ib
+        self.allocate()
+        if source == 'quotes':
+            ib.pendingTickersEvent += self.on_pending_tickers
+            await self.stream(Config.SCANNER_UNIVERSE[:Config.SCANNER_MAX_LINES])
+        elif source == 'ib_scanner':
+            ib.pendingTickersEvent += self.on_pending_tickers
+            subscription = ScannerSubscription(
+                instrument='STK', locationCode='STK.US.MAJOR',
+                scanCode=Config.SCANNER_SCAN_CODE, numberOfRows=Config.SCANNER_MAX_LINES
+            )
+            self.scan = ib.reqScannerSubscription(subscription)
+            self.scan.updateEvent += self.on_scan_data
+        else:
+            self._task = asyncio.create_task(self.replay(source))
+        logging.info(f"Momentum scanner started ({source})")
+        print(f"\tMomentum scanner started ({source}, {len(self.contracts)} symbols streaming)")
+    
+    def stop(self):
+        """Stop the sources and release the scanner's market data lines"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.ib is None:
+            return
+        self.ib.pendingTickersEvent -= self.on_pending_tickers
+        if self.scan is not None:
+            self.scan.updateEvent -= self.on_scan_data
+            try:
+                self.ib.cancelScannerSubscription(self.scan)
+            except Exception as e:
+                logging.error(f"Cancel scanner subscription error: {e}")
+            self.scan = None
+        for symbol in list(self.contracts):
+            self.unstream(symbol)
+        if self.ticks:
+            logging.info(f"Momentum scanner: {self.stats()}")
+        self.ib = None
+    
+    async def stream(self, symbols: List[str]):
+        """Qualify symbols in one request and subscribe their quotes"""
+        contracts = [Stock(symbol.upper(), 'SMART', 'USD') for symbol in symbols
+                     if symbol.upper() not in self.contracts]
+        if contracts:
+            await self.ib.qualifyContractsAsync(*contracts)
+        for contract in contracts:
+            if not contract.conId:
+                logging.warning(f"[{contract.symbol}] Could not qualify contract for the scanner")
+                continue
+            self.watch(contract)
+    
+    def watch(self, contract: Contract):
+        """Subscribe a qualified contract's quotes into its row"""
+        if contract.symbol in self.contracts or len(self.contracts) >= Config.SCANNER_MAX_LINES:
+            return
+        slot = self.slot(contract.symbol)
+        if slot is None:
+            logging.warning(f"[{contract.symbol}] Scanner arrays full")
+            return
+        if subscriptions.acquire_mkt_data(self.ib, contract) is None:
+            return
+        self.contracts[contract.symbol] = contract
+        self._con_slots[contract.conId] = slot
+        self.cum_volume[slot] = np.nan
+    
+    def unstream(self, symbol: str):
+        """Release a symbol's quotes (its row and features are kept)"""
+        contract = self.contracts.pop(symbol, None)
+        if contract is None:
+            return
+        self._con_slots.pop(contract.conId, None)
+        subscriptions.release_mkt_data(self.ib, contract)
+    
+    def resubscribe(self):
+        """Re-request the IB scan after a reconnect (quote lines are renewed with the rest)"""
+        if self.scan is None:
+            return
+        self.scan.updateEvent -= self.on_scan_data
+        self.scan = self.ib.reqScannerSubscription(self.scan.subscription)
+        self.scan.updateEvent += self.on_scan_data
+    
+    def on_scan_data(self, scan):
+        """Scanner subscription update: stream the new top rows, drop the ones that left"""
+        contracts = {data.contractDetails.contract.symbol: data.contractDetails.contract for data in scan}
+        for symbol in [symbol for symbol in self.contracts if symbol not in contracts]:
+            self.unstream(symbol)
+        for contract in contracts.values():
+            self.watch(contract)
+    
+    def on_pending_tickers(self, tickers):
+        """ib.pendingTickersEvent handler - one batch per event"""
+        stamp = time.perf_counter_ns()
+        slots, prices, volumes = [], [], []
+        for ticker in tickers:
+            slot = self._con_slots.get(ticker.contract.conId)
+            if slot is None:
+                continue
+            price = ticker.last if ticker.last and ticker.last > 0 else ticker.marketPrice()
+            if not price > 0:
+                continue
+            day_volume = ticker.volume if ticker.volume and ticker.volume > 0 else 0.0
+            previous = self.cum_volume[slot]
+            self.cum_volume[slot] = day_volume
+            slots.append(slot)
+            prices.append(price)
+            volumes.append(day_volume - previous if day_volume >= previous else 0.0)
+        if slots:
+            self.on_ticks(np.array(slots), np.array(prices), np.array(volumes), stamp)
+    
+    def load_replay(self, path: str) -> List[tuple]:
+        """
+        Read a 'seconds,symbol,price,volume' CSV (header optional, volume
+        traded since the symbol's previous row) into per-timestamp batches
+        """
+        batches = []
+        rows = {}
+        stamp = None
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.strip().split(',')
+                if len(parts) < 4:
+                    continue
+                try:
+                    seconds, price, volume = float(parts[0]), float(parts[2]), float(parts[3])
+                except ValueError:
+                    continue
+                if seconds != stamp and rows:
+                    batches.append((stamp, rows))
+                    rows = {}
+                stamp = seconds
+                slot = self.slot(parts[1].strip().upper())
+                if slot is not None:
+                    # Repeats within a timestamp collapse into one tick
+                    volume += rows[slot][1] if slot in rows else 0.0
+                    rows[slot] = (price, volume)
+        if rows:
+            batches.append((stamp, rows))
+        return [
+            (seconds, np.fromiter(rows, dtype=np.int64, count=len(rows)),
+             np.array([row[0] for row in rows.values()]), np.array([row[1] for row in rows.values()]))
+            for seconds, rows in batches
+        ]
+    
+    async def replay(self, path: str):
+        """Feed a recorded or synthetic tape on the bot's clock"""
+        batches = self.load_replay(path)
+        logging.info(f"Scanner replay: {len(batches)} batches from {path}")
+        start = clock.time() - (batches[0][0] if batches else 0)
+        for seconds, slots, prices, volumes in batches:
+            wait = start + seconds - clock.time()
+            if wait > 0:
+                await clock.sleep(wait)
+            self.on_ticks(slots, prices, volumes)
+        logging.info("Scanner replay finished")
+    
+    def stats(self) -> dict:
+        """Throughput, signal counts and tick-to-signal latency"""
+        signal_latency = np.array(self.signal_latency_us) if self.signal_latency_us else np.zeros(1)
+        dispatch_latency = np.array(self.dispatch_latency_us) if self.dispatch_latency_us else np.zeros(1)
+        return {
+            'symbols': len(self.symbols),
+            'streaming': len(self.contracts),
+            'ticks': self.ticks,
+            'batches': self.batches,
+            'ns_per_tick': round(self.batch_ns_total / self.ticks) if self.ticks else 0,
+            'max_batch_us': round(self.batch_ns_max / 1000, 1),
+            'signals': self.signals,
+            'dispatched': self.dispatched,
+            'signal_p50_us': round(float(np.percentile(signal_latency, 50)), 1),
+            'signal_p99_us': round(float(np.percentile(signal_latency, 99)), 1),
+            'dispatch_p50_us': round(float(np.percentile(dispatch_latency, 50)), 1),
+            'dispatch_p99_us': round(float(np.percentile(dispatch_latency, 99)), 1),
+        }
+
+
+class AmendmentStats:
+    """Counts order amendments and the round trips they save over cancel/replace"""
+    
+    def __init__(self):
+        self.amendments = 0
+        self.parks = 0
+        self.reactivations = 0
+        self.round_trips_saved = 0
+        self.order_ids_saved = 0
+        self.ack_latency_total = 0.0
+        self.ack_count = 0
+    
+    def record_ack(self, latency: float):
+        """Record how long an order placement or cancel took to acknowledge"""
+        self.ack_latency_total += latency
+        self.ack_count += 1
+    
+    def mean_ack_latency(self) -> float:
+        return self.ack_latency_total / self.ack_count if self.ack_count else 0.0
+    
+    def summary(self) -> str:
+        saved_seconds = self.round_trips_saved * self.mean_ack_latency()
+        return (
+            f"{self.amendments} amendments ({self.parks} parked, {self.reactivations} reactivated), "
+            f"{self.round_trips_saved} round trips saved (~{saved_seconds:.2f}s), "
+            f"{self.order_ids_saved} order IDs saved"
+        )
+
+
+class EntryStats:
+    """Per-signal entry outcomes by entry mode: fill rate, slippage and time to fill"""
+    
+    def __init__(self):
+        self.signals: Dict[str, list] = {}   # mode -> [(requested, filled, slippage %, seconds, reprices)]
+    
+    def record(self, mode: str, requested: int, filled: int, slippage_pct: float, seconds: float,
+               reprices: int = 0):
+        self.signals.setdefault(mode, []).append((requested, filled, slippage_pct, seconds, reprices))
+    
+    def summary(self, mode: str) -> dict:
+        """Aggregate statistics for one mode"""
+        records = self.signals.get(mode, [])
+        filled = [r for r in records if r[1]]
+        requested = sum(r[0] for r in records)
+        seconds = sorted(r[3] for r in filled)
+        return {
+            'signals': len(records),
+            'filled_signals': len(filled),
+            'fill_rate': round(sum(r[1] for r in records) / requested, 3) if requested else None,
+            'mean_slippage_pct': round(sum(r[2] for r in filled) / len(filled), 3) if filled else None,
+            'max_slippage_pct': round(max(r[2] for r in filled), 3) if filled else None,
+            'median_time_to_fill': round(seconds[len(seconds) // 2], 2) if seconds else None,
+            'mean_reprices': round(sum(r[4] for r in records) / len(records), 1) if records else None,
+        }
+
+
+class StressCalculator:
+    """
+    What an instant price gap would do to every open position at once
+    
+    collect() copies each active trader's position, fill, mark, stop,
+    take-profit and reentry orders into NumPy arrays; evaluate() applies
+    every shock in STRESS_SHOCKS to all of them in one broadcast. A gap
+    jumps over prices, so resting orders fill at the gapped price: a stop
+    limit fills only if the gap lands between its stop and limit, and
+    otherwise leaves the shares open. Missing orders are NaN and never fill.
+    """
+    def __init__(self, shocks=None):
+        self.shocks = np.asarray(shocks or Config.STRESS_SHOCKS, dtype=np.float64)
+        self.result = None   # last refresh()
+        self._task = None
+        
+        # Stats
+        self.refreshes = 0
+        self.collect_ns_total = 0
+        self.evaluate_ns_total = 0
+        self.evaluate_ns_max = 0
+    
+    COLUMNS = ('position', 'fill', 'mark', 'stop_trigger', 'stop_limit', 'stop_qty',
+               'reentry_trigger', 'reentry_limit', 'reentry_qty',
+               'tp33_price', 'tp33_limit', 'tp33_qty', 'tp66_price', 'tp66_limit', 'tp66_qty',
+               'tp99_price', 'tp99_limit', 'tp99_qty')
+    NO_ORDER = (np.nan, np.nan, 0.0)
+    
+    def collect(self, traders) -> dict:
+        """Array view of every trader's book: one contiguous row per column"""
+        no_order = self.NO_ORDER
+        slots = (StockTrader.ORDER_STOP_LOSS, StockTrader.ORDER_REENTRY,
+                 StockTrader.ORDER_TP33, StockTrader.ORDER_TP66, StockTrader.ORDER_TP99)
+        rows = []
+        append = rows.append
+        for trader in traders:
+            orders = trader._orders
+            fill = trader.fill_price or trader.entry_price
+            row = [trader.live_position, fill, fill * (1 + trader.unrealized_pnl_pct / 100)]
+            for slot in slots:
+                trade = orders[slot]
+                if trade is None or trade.orderStatus.status not in ('PreSubmitted', 'Submitted'):
+                    row += no_order
+                    continue
+                order = trade.order
+                # Trigger, limit and open quantity; a plain limit triggers at its limit
+                row += (order.auxPrice if order.orderType == 'STP LMT' else order.lmtPrice,
+                        order.lmtPrice, order.totalQuantity - trade.orderStatus.filled)
+            append(row)
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.COLUMNS)).T.copy()
+        book = dict(zip(self.COLUMNS, table))
+        book['symbols'] = [trader.symbol for trader in traders]
+        return book
+    
+    def evaluate(self, book: dict) -> dict:
+        """Apply every shock to every position; one row per shock, summed across positions"""
+        mark = book['mark']
+        position = book['position']
+        gapped = (1 + self.shocks)[:, None] * mark                           # (shocks, n)
+        out = np.empty((7,) + gapped.shape)
+        change, open_pnl, stopped, gapped_through, take_profit, reentered, exposure = out
+        
+        np.multiply(gapped - mark, position, out=change)
+        np.multiply(gapped - book['fill'], position, out=open_pnl)
+        
+        stop_qty = np.minimum(book['stop_qty'], position)
+        triggered = gapped <= book['stop_trigger']
+        fills = gapped >= book['stop_limit']
+        np.multiply(triggered & fills, stop_qty, out=stopped)
+        np.multiply(triggered & ~fills, stop_qty, out=gapped_through)
+        
+        take_profit[:] = 0.0
+        for level in ('tp33', 'tp66', 'tp99'):
+            take_profit += (book[level + '_price'] <= gapped) * book[level + '_qty']
+        np.minimum(take_profit, position, out=take_profit)
+        
+        np.multiply((gapped >= book['reentry_trigger']) & (gapped <= book['reentry_limit']),
+                    book['reentry_qty'], out=reentered)
+        np.multiply(position - stopped - take_profit + reentered, gapped, out=exposure)
+        
+        totals = out.sum(axis=2).round(2).tolist()
+        worst = change.argmin(axis=1).tolist() if len(mark) else []
+        return {
+            'positions': len(mark),
+            'shocks': self.shocks.tolist(),
+            'pnl_change': totals[0],
+            'open_pnl': totals[1],
+            'stopped_shares': totals[2],
+            'gapped_through_stop_shares': totals[3],
+            'take_profit_shares': totals[4],
+            'reentry_shares': totals[5],
+            'exposure_after': totals[6],
+            'worst_symbol': [book['symbols'][i] for i in worst],
+        }
+    
+    def refresh(self, traders=None) -> dict:
+        """Collect and evaluate the current book"""
+        if traders is None:
+            traders = list(order_manager.active_traders.values())
+        t0 = time.perf_counter_ns()
+        book = self.collect(traders)
+        t1 = time.perf_counter_ns()
+        self.result = self.evaluate(book)
+        t2 = time.perf_counter_ns()
+        
+        self.refreshes += 1
+        self.collect_ns_total += t1 - t0
+        self.evaluate_ns_total += t2 - t1
+        if t2 - t1 > self.evaluate_ns_max:
+            self.evaluate_ns_max = t2 - t1
+        self.result['evaluate_us'] = round((t2 - t1) / 1000, 1)
+        self.result['collect_us'] = round((t1 - t0) / 1000, 1)
+        self.result['time'] = clock.time()
+        return self.result
+    
+    def start(self):
+        """Re-evaluate in the background every STRESS_REFRESH_SECONDS"""
+        if Config.STRESS_REFRESH_SECONDS > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_refresher())
+    
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def run_refresher(self):
+        """Keep result current while traders are active"""
+        while True:
+            await clock.sleep(Config.STRESS_REFRESH_SECONDS)
+            if order_manager.active_traders:
+                self.refresh()
+    
+    def report(self) -> str:
+        """Latest result (refreshed now) as a table"""
+        result = self.refresh()
+        lines = [
+            f"\t=== Stress test: {result['positions']} positions ({result['evaluate_us']} us) ===",
+            f"\t{'Gap':>6}{'P&L change':>12}{'Open P&L':>12}{'Stopped':>9}{'Gapped':>8}"
+            f"{'TP sold':>9}{'Reentry':>9}{'Exposure':>12}  Worst",
+        ]
+        for i, shock in enumerate(result['shocks']):
+            lines.append(
+                f"\t{shock * 100:>+5.0f}%{result['pnl_change'][i]:>12.2f}{result['open_pnl'][i]:>12.2f}"
+                f"{result['stopped_shares'][i]:>9.0f}{result['gapped_through_stop_shares'][i]:>8.0f}"
+                f"{result['take_profit_shares'][i]:>9.0f}{result['reentry_shares'][i]:>9.0f}"
+                f"{result['exposure_after'][i]:>12.2f}  "
+                f"{result['worst_symbol'][i] if result['worst_symbol'] else '-'}"
+            )
+        return "\n".join(lines)
+    
+    def print_report(self):
+        """Hotkey handler: print the stress table"""
+        print(self.report())
+
+
+# Shadow variant phases
+SHADOW_ENTRY, SHADOW_UNDER_5, SHADOW_OVER_5, SHADOW_REENTRY, SHADOW_DONE = range(5)
+
+
+class ShadowBook:
+    """
+    Virtual parameter variants of the StockTrader state machine on real signals
+    
+    Every signal the bot trades is also run, without orders, under each
+    combination in SHADOW_GRID. State is one (signal, variant) row in 2-D
+    NumPy arrays and a pass moves every row at once against the lowest,
+    highest and last price each symbol streamed since the previous pass,
+    so no tick between passes is missed. Passes are spaced so they use at
+    most SHADOW_MAX_CPU_PCT of the event loop.
+    
+    The model follows the live rules: the entry limit fills once price
+    trades at or under it (given up after TIMEOUT_MINUTES), the stop limit
+    sells when triggered and price is at or above its limit, take profits
+    for thirds of the position rest at the fill times each scaled
+    multiplier while PnL is over PNL_THRESHOLD_5 (the stop parked at
+    PARKED_STOP_PCT), a full stop-out re-enters with a stop limit at the
+    fill price until max_reentries or TIMEOUT_MINUTES, and PnL over
+    PNL_THRESHOLD_99 ends the trade. Every variant trades the live
+    position size; open shares are marked at the last price.
+    """
+    
+    COLUMNS = ('stop_loss_pct', 'entry_limit_pct', 'tp_scale', 'max_reentries')
+    TOTALS = ('pnl', 'filled', 'stop_outs', 'reentries', 'wins')
+    
+    def __init__(self, grid: dict = None):
+        grid = grid or Config.SHADOW_GRID
+        variants = np.array(list(itertools.product(*(grid[name] for name in self.COLUMNS))), dtype=np.float64)
+        self.variants = variants
+        self.stop_pct = variants[:, 0]
+        self.stop_limit_pct = variants[:, 0] - Config.STOP_LIMIT_GAP_PCT
+        self.entry_limit_pct = variants[:, 1]
+        self.tp_mult = np.stack([
+            1 + (multiplier - 1) * variants[:, 2]
+            for multiplier in (Config.TP_33_MULTIPLIER, Config.TP_66_MULTIPLIER, Config.TP_99_MULTIPLIER)
+        ])   # (3, variants)
+        self.max_reentries = variants[:, 3]
+        
+        # Per-variant totals of finished signals, one row per TOTALS name
+        self.done = np.zeros((len(self.TOTALS), len(variants)))
+        self.signals_done = 0
+        
+        self.ib = None
+        self.contracts: List[Contract] = []
+        self.symbols: List[str] = []
+        self._slots_by_con_id: Dict[int, list] = {}
+        self._task = None
+        self._reset_rows()
+        
+        # Stats
+        self.passes = 0
+        self.pass_ns_total = 0
+        self.pass_ns_max = 0
+        self.ticks = 0
+        self.skipped = 0
+    
+    def _reset_rows(self):
+        """Empty per-signal vectors and (signal, variant) state"""
+        count = len(self.variants)
+        self.entry = np.zeros(0)
+        self.qty = np.zeros(0)
+        self.thirds = np.zeros((3, 0))
+        self.start_time = np.zeros(0)
+        self.last = np.zeros(0)
+        self.low = np.zeros(0)
+        self.high = np.zeros(0)
+        self.phase = np.zeros((0, count), dtype=np.int8)
+        self.held = np.zeros((0, count))
+        self.fill = np.zeros((0, count))
+        self.cash = np.zeros((0, count))
+        self.taken = np.zeros((0, count), dtype=np.int8)   # bit k: take profit k filled
+        self.stop_hit = np.zeros((0, count), dtype=bool)   # stop triggered, waiting for its limit
+        self.reentered = np.zeros((0, count), dtype=np.int16)
+        self.stopped = np.zeros((0, count), dtype=np.int16)
+    
+    @property
+    def active(self) -> bool:
+        return self._task is not None
+    
+    def start(self, ib):
+        """Listen for quotes and run passes in the background"""
+        if self._task is not None:
+            return
+        self.ib = ib
+        ib.pendingTickersEvent += self.on_pending_tickers
+        self._task = asyncio.create_task(self.run())
+        logging.info(f"Shadow strategies: {len(self.variants)} variants per signal")
+        print(f"\tShadowing every signal with {len(self.variants)} parameter variants")
+    
+    def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self.ib.pendingTickersEvent -= self.on_pending_tickers
+    
+    def track(self, trader, position: int = None):
+        """Shadow a trader's signal (its contract must be qualified)"""
+        if self._task is None:
+            return
+        if len(self.symbols) >= Config.SHADOW_MAX_SIGNALS:
+            self.skipped += 1
+            logging.warning(f"[{trader.symbol}] Not shadowed: {len(self.symbols)} signals already shadowed")
+            return
+        ticker = subscriptions.acquire_mkt_data(trader.ib, trader.contract)
+        if ticker is None:
+            self.skipped += 1
+            logging.warning(f"[{trader.symbol}] Not shadowed: no market data line available")
+            return
+        price = ticker.marketPrice()
+        self.add(trader.symbol, trader.contract, trader.entry_price, position or trader.position_size,
+                 price if price > 0 else np.nan)
+    
+    def add(self, symbol: str, contract: Contract, entry_price: float, position: int, price: float = np.nan):
+        """Start every variant of one signal at `price` (NaN: nothing moves until the first quote)"""
+        count = len(self.variants)
+        first = max(1, position // 3)
+        second = max(1, (position - first) // 2)
+        slot = len(self.symbols)
+        self.symbols.append(symbol)
+        self.contracts.append(contract)
+        self._slots_by_con_id.setdefault(contract.conId, []).append(slot)
+        self.entry = np.append(self.entry, entry_price)
+        self.qty = np.append(self.qty, position)
+        self.thirds = np.concatenate([self.thirds, [[first], [second], [position - first - second]]], axis=1)
+        self.start_time = np.append(self.start_time, clock.time())
+        self.last = np.append(self.last, price)
+        self.low = np.append(self.low, price)
+        self.high = np.append(self.high, price)
+        for name, dtype in (('phase', np.int8), ('held', np.float64), ('fill', np.float64),
+                            ('cash', np.float64), ('taken', np.int8), ('stop_hit', bool),
+                            ('reentered', np.int16), ('stopped', np.int16)):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros((1, count), dtype=dtype)]))
+        logging.info(f"[{symbol}] Shadowing {count} variants at {entry_price}")
+    
+    def on_pending_tickers(self, tickers):
+        """ib.pendingTickersEvent handler - widen each shadowed symbol's range since the last pass"""
+        for ticker in tickers:
+            slots = self._slots_by_con_id.get(ticker.contract.conId) if ticker.contract else None
+            if not slots:
+                continue
+            price = ticker.marketPrice()
+            if not (price == price and price > 0):
+                continue
+            self.ticks += 1
+            for slot in slots:
+                self.last[slot] = price
+                if not price >= self.low[slot]:   # also replaces NaN
+                    self.low[slot] = price
+                if not price <= self.high[slot]:
+                    self.high[slot] = price
+    
+    def step(self, now: float):
+        """Move every (signal, variant) row one pass against the prices since the last pass"""
+        low, high, last = self.low[:, None], self.high[:, None], self.last[:, None]
+        phase, fill, held = self.phase, self.fill, self.held
+        expired = (now - self.start_time > Config.TIMEOUT_MINUTES * 60)[:, None]
+        # Masks come from the phase at the start of the pass: one transition per row per pass
+        entering = phase == SHADOW_ENTRY
+        under = phase == SHADOW_UNDER_5
+        over = phase == SHADOW_OVER_5
+        reentering = phase == SHADOW_REENTRY
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pnl_pct = np.where(held > 0, (last / fill - 1) * 100, 0.0)
+        
+        # Entry limit
+        limit = self.entry[:, None] * self.entry_limit_pct
+        bought = entering & (low <= limit)
+        price = np.minimum(limit, last)
+        self._buy(bought, price)
+        phase[entering & ~bought & expired] = SHADOW_DONE
+        
+        # Stop limit (live under PNL_THRESHOLD_5)
+        self.stop_hit |= under & (low <= fill * self.stop_pct)
+        stop_limit = fill * self.stop_limit_pct
+        sold = under & self.stop_hit & (high >= stop_limit)
+        price = np.clip(last, stop_limit, fill * self.stop_pct)
+        self.cash += np.where(sold, held * price, 0.0)
+        self.stopped += sold
+        kept_tp = sold & (held < self.qty[:, None])
+        out_of_reentries = sold & (self.reentered >= self.max_reentries)
+        held[sold] = 0
+        self.stop_hit[sold] = False
+        phase[sold] = np.where(kept_tp | out_of_reentries, SHADOW_DONE, SHADOW_REENTRY)[sold]
+        phase[under & ~self.stop_hit & ~sold & (pnl_pct > Config.PNL_THRESHOLD_5)] = SHADOW_OVER_5
+        
+        # Take profits and the parked stop (live over PNL_THRESHOLD_5)
+        for level in range(3):
+            tp_price = fill * self.tp_mult[level]
+            hit = over & (self.taken & (1 << level) == 0) & (high >= tp_price) & (held > 0)
+            shares = np.minimum(self.thirds[level][:, None], held)
+            self.cash += np.where(hit, shares * tp_price, 0.0)
+            held -= np.where(hit, shares, 0.0)
+            self.taken |= np.where(hit, 1 << level, 0).astype(np.int8)
+        parked = over & (held > 0) & (low <= fill * Config.PARKED_STOP_PCT)
+        self.cash += np.where(parked, held * last, 0.0)
+        held[parked] = 0
+        phase[over & ((held <= 0) | (pnl_pct > Config.PNL_THRESHOLD_99))] = SHADOW_DONE
+        phase[over & (held > 0) & (pnl_pct < Config.PNL_THRESHOLD_5)] = SHADOW_UNDER_5
+        
+        # Reentry stop limit at the last fill price
+        reentry_limit = fill * 1.04
+        rebought = reentering & ~expired & (high >= fill) & (low <= reentry_limit)
+        price = np.clip(last, fill, reentry_limit)
+        self.reentered += rebought
+        self.taken[rebought] = 0
+        self._buy(rebought, price)
+        phase[reentering & ~rebought & expired] = SHADOW_DONE
+        
+        self.low[:] = self.last
+        self.high[:] = self.last
+    
+    def _buy(self, mask, price):
+        """Fill the whole signal position on the rows in mask"""
+        shares = np.broadcast_to(self.qty[:, None], mask.shape)
+        self.held[mask] = shares[mask]
+        self.fill[mask] = price[mask]
+        self.cash -= np.where(mask, shares * price, 0.0)
+        self.phase[mask] = SHADOW_UNDER_5
+    
+    @staticmethod
+    def marked(held, last):
+        """Value of open shares at the last price"""
+        return np.where(held > 0, held * last[:, None], 0.0)
+    
+    def signal_totals(self, slots) -> np.ndarray:
+        """TOTALS per variant over some signals, open shares marked at the last price"""
+        pnl = self.cash[slots] + self.marked(self.held[slots], self.last[slots])
+        filled = self.fill[slots] > 0
+        return np.stack([
+            pnl.sum(axis=0), filled.sum(axis=0), self.stopped[slots].sum(axis=0),
+            self.reentered[slots].sum(axis=0), (filled & (pnl > 0)).sum(axis=0),
+        ])
+    
+    def fold(self, slots: list):
+        """Add finished signals to the per-variant totals and stop streaming them"""
+        if not slots:
+            return
+        slots = sorted(slots)
+        self.done += self.signal_totals(slots)
+        self.signals_done += len(slots)
+        for slot in slots:
+            if self.ib is not None:
+                subscriptions.release_mkt_data(self.ib, self.contracts[slot])
+        
+        keep = np.setdiff1d(np.arange(len(self.symbols)), slots)
+        self.symbols = [self.symbols[i] for i in keep]
+        self.contracts = [self.contracts[i] for i in keep]
+        for name in ('entry', 'qty', 'start_time', 'last', 'low', 'high', 'phase', 'held', 'fill',
+                     'cash', 'taken', 'stop_hit', 'reentered', 'stopped'):
+            setattr(self, name, getattr(self, name)[keep])
+        self.thirds = self.thirds[:, keep]
+        self._slots_by_con_id = {}
+        for slot, contract in enumerate(self.contracts):
+            self._slots_by_con_id.setdefault(contract.conId, []).append(slot)
+    
+    def run_pass(self, now: float = None):
+        """One timed pass; signals whose variants are all done are folded"""
+        t0 = time.perf_counter_ns()
+        self.step(clock.time() if now is None else now)
+        finished = np.flatnonzero((self.phase == SHADOW_DONE).all(axis=1))
+        self.fold(finished.tolist())
+        elapsed = time.perf_counter_ns() - t0
+        self.passes += 1
+        self.pass_ns_total += elapsed
+        if elapsed > self.pass_ns_max:
+            self.pass_ns_max = elapsed
+        return elapsed
+    
+    async def run(self):
+        """Pass after pass, idle long enough to stay under SHADOW_MAX_CPU_PCT"""
+        idle_ratio = 100 / Config.SHADOW_MAX_CPU_PCT - 1
+        delay = Config.SHADOW_MIN_INTERVAL
+        while True:
+            await clock.sleep(delay)
+            if not self.symbols:
+                delay = Config.SHADOW_MIN_INTERVAL
+                continue
+            elapsed = self.run_pass() / 1e9
+            delay = max(Config.SHADOW_MIN_INTERVAL, elapsed * idle_ratio)
+    
+    def totals(self) -> np.ndarray:
+        """TOTALS per variant including the signals still running"""
+        if not self.symbols:
+            return self.done.copy()
+        return self.done + self.signal_totals(slice(None))
+    
+    def results(self) -> List[dict]:
+        """Per-variant totals, best P&L first"""
+        totals = self.totals()
+        rows = []
+        for i in np.argsort(-totals[0], kind='stable'):
+            row = dict(zip(self.COLUMNS, self.variants[i].tolist()))
+            row['max_reentries'] = int(row['max_reentries'])
+            row['pnl'] = round(float(totals[0, i]), 2)
+            row.update((name, int(totals[k, i])) for k, name in enumerate(self.TOTALS[1:], 1))
+            rows.append(row)
+        return rows
+    
+    def live_variant(self, rows: List[dict]):
+        """Rank and row of the variant matching the live Config, if it is in the grid"""
+        live = (Config.STOP_LOSS_PCT, Config.ENTRY_LIMIT_PCT, 1.0, Config.MAX_REENTRIES)
+        for rank, row in enumerate(rows, 1):
+            if all(abs(row[name] - value) < 1e-9 for name, value in zip(self.COLUMNS, live)):
+                return rank, row
+        return None, None
+    
+    def stats(self) -> dict:
+        return {
+            'variants': len(self.variants),
+            'signals_open': len(self.symbols),
+            'signals_done': self.signals_done,
+            'signals_skipped': self.skipped,
+            'ticks': self.ticks,
+            'passes': self.passes,
+            'avg_pass_us': round(self.pass_ns_total / self.passes / 1000, 1) if self.passes else 0,
+            'max_pass_us': round(self.pass_ns_max / 1000, 1),
+        }
+    
+    def report(self, suffix: str = "", top: int = 10) -> str:
+        """End-of-day table of the best variants; every variant is written to SHADOW_DIR"""
+        rows = self.results()
+        os.makedirs(Config.SHADOW_DIR, exist_ok=True)
+        path = os.path.join(Config.SHADOW_DIR, f"shadow_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}.csv")
+        with open(path, 'w') as f:
+            f.write(",".join(rows[0]) + "\n")
+            for row in rows:
+                f.write(",".join(str(value) for value in row.values()) + "\n")
+        
+        signals = self.signals_done + len(self.symbols)
+        lines = [
+            f"\t=== Shadow strategies: {len(rows)} variants over {signals} signals ===",
+            f"\t{'Rank':>5}{'Stop':>8}{'Entry':>7}{'TP x':>6}{'Reent':>6}{'P&L':>11}{'Filled':>8}"
+            f"{'Stops':>7}{'Wins':>6}",
+        ]
+        rank, live = self.live_variant(rows)
+        shown = list(enumerate(rows[:top], 1))
+        if live is not None and rank > top:
+            shown.append((rank, live))
+        for i, row in shown:
+            lines.append(
+                f"\t{i:>5}{row['stop_loss_pct']:>8.3f}{row['entry_limit_pct']:>7.2f}{row['tp_scale']:>6.2f}"
+                f"{row['max_reentries']:>6}{row['pnl']:>11.2f}{row['filled']:>8}{row['stop_outs']:>7}"
+                f"{row['wins']:>6}" + ("  <- live settings" if i == rank else "")
+            )
+        lines.append(f"\tAll variants: {path}")
+        return "\n".join(lines)
+    
+    def close(self, suffix: str = ""):
+        """Stop shadowing and report the day"""
+        if self._task is None:
+            return
+        self.stop()
+        if self.signals_done or self.symbols:
+            report = self.report(suffix)
+            logging.info(f"Shadow strategies {self.stats()}\n{report}")
+            print(report)
+        for contract in self.contracts:
+            subscriptions.release_mkt_data(self.ib, contract)
+
+
+class Profiler:
+    """
+    Low-overhead profiler for the trading event loop
+    
+    Two views are collected while active:
+    - Per (symbol, state): time each trader coroutine spent running on the
+      loop, wall-clock time spent in the state, and step count. Handlers are
+      wrapped in a coroutine driver that times every send() into them; PnL
+      callbacks are timed per symbol.
+    - A sampling thread that snapshots the loop thread's stack every
+      PROFILE_SAMPLE_INTERVAL seconds, giving folded stacks for
+      flamegraph.pl / speedscope (clipboard poll, logging, ib_insync
+      decoding and idle time all show up here).
+    """
+    
+    def __init__(self, interval: float = None):
+        self.interval = interval or Config.PROFILE_SAMPLE_INTERVAL
+        self.active = False
+        self._reset()
+    
+    def _reset(self):
+        self.states: Dict[tuple, list] = {}   # (symbol, state) -> [loop seconds, wall seconds, steps]
+        self.stacks: Dict[tuple, int] = {}    # folded stack -> samples
+        self.samples = 0
+        self.sampler_seconds = 0.0
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+    
+    def start(self):
+        """Start profiling the calling thread's event loop"""
+        if self.active:
+            return
+        self._reset()
+        self.active = True
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), name="profiler", daemon=True
+        )
+        self._thread.start()
+        logging.info("Profiler started")
+        print("\t[PROFILE] Profiling started")
+    
+    def stop(self) -> str:
+        """Stop profiling, write the folded stacks and return the summary"""
+        if not self.active:
+            return ""
+        self.active = False
+        self._stop.set()
+        self._thread.join()
+        
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        folded_path = os.path.join(Config.PROFILE_DIR, f"profile_{stamp}.folded")
+        with open(folded_path, 'w') as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{';'.join(stack)} {count}\n")
+        summary = self.summary()
+        with open(os.path.join(Config.PROFILE_DIR, f"profile_{stamp}.txt"), 'w') as f:
+            f.write(summary + "\n")
+        
+        logging.info(f"Profile written to {folded_path}\n{summary}")
+        print(summary)
+        print(f"\t[PROFILE] Flamegraph stacks: {folded_path}")
+        return summary
+    
+    def toggle(self):
+        """Start or stop profiling (SIGUSR1 / clipboard command)"""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+    
+    def _sample(self, thread_id: int):
+        """Sampling thread: fold the loop thread's current stack"""
+        while not self._stop.wait(self.interval):
+            begin = time.perf_counter()
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+            self.sampler_seconds += time.perf_counter() - begin
     
-    # Position Sizing (customize based on your risk tolerance)
-    MIN_POSITION_SIZE = 3
-    POSITION_CAPITAL = 30  # Dollar amount to use for position sizing
+    def timed(self, coro, symbol: str, state):
+        """Wrap a trader coroutine so its loop and wall time count toward (symbol, state)"""
+        if not self.active:
+            return coro
+        return self._drive(coro, (symbol, state.name))
     
-    # Take Profit Levels
-    TP_33_MULTIPLIER = 1.33  # 33% profit target
-    TP_66_MULTIPLIER = 1.66  # 66% profit target
-    TP_99_MULTIPLIER = 1.99  # 99% profit target
+    @types.coroutine
+    def _drive(self, coro, key: tuple):
+        stats = self.states.setdefault(key, [0.0, 0.0, 0])
+        wall_start = clock.time()
+        value, error = None, None
+        try:
+            while True:
+                step_start = time.perf_counter()
+                try:
+                    yielded = coro.throw(error) if error is not None else coro.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    stats[0] += time.perf_counter() - step_start
+                    stats[2] += 1
+                value, error = None, None
+                try:
+                    value = yield yielded
+                except GeneratorExit:
+                    coro.close()
+                    raise
+                except BaseException as e:
+                    error = e
+        finally:
+            stats[1] += clock.time() - wall_start
     
-    # PnL Thresholds (%)
-    PNL_THRESHOLD_5 = 5
-    PNL_THRESHOLD_33 = 33
-    PNL_THRESHOLD_66 = 66
-    PNL_THRESHOLD_99 = 99
-
-
-# Setup logging
-os.makedirs(Config.LOG_DIR, exist_ok=True)
-log_path = os.path.join(Config.LOG_DIR, Config.LOG_FILE)
-logging.basicConfig(
-    filename=log_path,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-
-def splash_screen():
-    """Display startup banner"""
-    os.system('cls' if os.name == 'nt' else 'clear')
-    print("\033[31m" + r"""
-    -----------------------------------------------------------------------------------------------------
-    |                                                                                                   |
-    |    ██████╗    ███████╗   █████╗   ██████╗   ██╗  ██╗   █████╗   ███╗   ██╗  ██████╗     ███████║  |
-    |    ██╔══██╗   ██╔════╝  ██╔══██╗  ██╔══██╗  ██║  ██║  ██╔══██╗  ████╗  ██║  ██╔══██╗    ╚════██║  |
-    |    ██║  ██║   █████╗    ███████║  ██║  ██║  ███████║  ███████║  ██╔██╗ ██║  ██║  ██║    ███████║  |
-    |    ██║  ██║   ██╔══╝    ██╔══██║  ██║  ██║  ██╔══██║  ██╔══██║  ██║╚██╗██║  ██║  ██║    ██╔════╝  |
-    |    ██████╔╝   ███████╗  ██║  ██║  ██████╔╝  ██║  ██║  ██║  ██║  ██║ ╚████║  ██████╔╝    ███████╗  |
-    |    ╚═════╝    ╚══════╝  ╚═╝  ╚═╝  ╚═════╝   ╚═╝  ╚═╝  ╚═╝  ╚═╝  ╚═╝  ╚═══╝  ╚═════╝     ╚══════╝  |
-    |                                                                                                   |
-    |                                       D E A D H A N D  v2.0                                       |
-    |                                Tactical Execution Interface Launched!!                            |
-    -----------------------------------------------------------------------------------------------------
-    """ + "\033[0m")
-    time.sleep(0.01)
+    def time_callback(self, callback, *args):
+        """Run an event callback, charging its time to the owning trader's symbol"""
+        start = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            owner = getattr(callback, '__self__', None)
+            key = (getattr(owner, 'symbol', '-'), callback.__name__)
+            stats = self.states.setdefault(key, [0.0, 0.0, 0])
+            stats[0] += time.perf_counter() - start
+            stats[2] += 1
+    
+    def summary(self, top: int = None) -> str:
+        """Top-N (symbol, state) rows and hottest functions"""
+        top = top or Config.PROFILE_TOP_N
+        duration = time.perf_counter() - self.started_at if self.started_at else 0.0
+        overhead = self.sampler_seconds / duration * 100 if duration else 0.0
+        lines = [
+            f"\t=== Profile: {duration:.1f}s, {self.samples} samples "
+            f"(sampler overhead {overhead:.2f}%) ===",
+            f"\t{'Symbol':<10}{'State':<20}{'Loop ms':>10}{'Wait s':>10}{'Steps':>8}"
+        ]
+        rows = sorted(self.states.items(), key=lambda item: -item[1][0])[:top]
+        for (symbol, state), (loop_seconds, wall_seconds, steps) in rows:
+            wait = max(0.0, wall_seconds - loop_seconds)
+            lines.append(f"\t{symbol:<10}{state:<20}{loop_seconds * 1000:>10.2f}{wait:>10.1f}{steps:>8}")
+        
+        leaf_counts: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            leaf_counts[stack[-1]] = leaf_counts.get(stack[-1], 0) + count
+        lines.append("\tTop functions (share of samples):")
+        for name, count in sorted(leaf_counts.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"\t  {count / self.samples * 100:5.1f}%  {name}")
+        return "\n".join(lines)
 
 
-class ClipboardClearedException(Exception):
-    """Exception raised when clipboard is cleared during input"""
-    pass
+class LoopWatchdog:
+    """
+    Event loop lag measurement with the callbacks that caused it
+    
+    A heartbeat task sleeps WATCHDOG_INTERVAL and records how late it wakes
+    up. With WATCHDOG_ATTRIBUTE the loop runs in asyncio debug mode with
+    slow_callback_duration set to WATCHDOG_SLOW_CALLBACK, so asyncio times
+    every callback itself and reports the ones that overrun; each report is
+    attributed from the handle's callback to the trader it belongs to (the
+    first 'self' with a symbol and state on the task's coroutine chain) and
+    the coroutine it ran.
+    
+    Lag over LAG_SAFETY_LIMIT pauses new signals ('pause') or also
+    flattens every trader ('flatten'); signals resume once lag has stayed
+    under half the limit for LAG_RESUME_SECONDS.
+    """
+    
+    SLOW_MESSAGE = 'Executing %s took %.3f seconds'   # asyncio's debug-mode report
+    
+    def __init__(self):
+        self.lags = array('d', [0.0]) * Config.WATCHDOG_SAMPLES   # ring buffer, seconds
+        self.lag_count = 0
+        self.max_lag = 0.0
+        self.slow = deque(maxlen=Config.WATCHDOG_SLOW_KEEP)
+        self.slow_by_owner: Dict[tuple, list] = {}   # (symbol, state, where) -> [count, total s, max s]
+        self.paused = False
+        self.trips = 0
+        self.active = False
+        self._loop = None
+        self._saved_debug = None   # (debug, slow_callback_duration) before start
+        self._task = None
+        self._calm_since = None
+    
+    def start(self):
+        """Start the heartbeat and, with WATCHDOG_ATTRIBUTE, slow callback reports (loop thread)"""
+        if self.active:
+            return
+        self.active = True
+        self._loop = loop = asyncio.get_running_loop()
+        if Config.WATCHDOG_ATTRIBUTE:
+            self._saved_debug = (loop.get_debug(), loop.slow_callback_duration)
+            loop.slow_callback_duration = Config.WATCHDOG_SLOW_CALLBACK
+            loop.set_debug(True)
+            logging.getLogger('asyncio').addFilter(self._on_asyncio_record)
+        self._task = asyncio.create_task(self.run_heartbeat())
+        logging.info("Loop watchdog started")
+    
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        if self._saved_debug is not None:
+            logging.getLogger('asyncio').removeFilter(self._on_asyncio_record)
+            if not self._loop.is_closed():
+                self._loop.set_debug(self._saved_debug[0])
+                self._loop.slow_callback_duration = self._saved_debug[1]
+            self._saved_debug = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        logging.info(f"Loop watchdog stopped - {self.stats()}")
+    
+    def _on_asyncio_record(self, record: logging.LogRecord) -> bool:
+        """asyncio logger filter: take over its slow callback reports, pass everything else"""
+        if record.msg != self.SLOW_MESSAGE:
+            return True
+        # Logged on the loop thread right after the callback, which is still the current handle
+        handle = getattr(self._loop, '_current_handle', None)
+        self.record_slow(handle, record.args[1])
+        return False
+    
+    @staticmethod
+    def owner(handle) -> tuple:
+        """(symbol, state, where) for a callback: the trader and coroutine it ran"""
+        callback = getattr(handle, '_callback', None)
+        task = getattr(callback, '__self__', None)
+        if isinstance(task, asyncio.Task):
+            symbol = state = None
+            coro = task.get_coro()
+            where = getattr(coro, '__qualname__', task.get_name())
+            while coro is not None and symbol is None:
+                frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+                if frame is not None:
+                    # The trader's own coroutine, else the innermost one
+                    where = frame.f_code.co_name
+                    owner = frame.f_locals.get('self')
+                    if hasattr(owner, 'symbol') and hasattr(owner, 'state'):
+                        symbol, state = owner.symbol, owner.state.name
+                coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+            return symbol or '-', state or '-', where
+        owner = getattr(callback, '__self__', None)
+        return (getattr(owner, 'symbol', '-'), getattr(getattr(owner, 'state', None), 'name', '-'),
+                getattr(callback, '__qualname__', repr(callback)))
+    
+    def record_slow(self, handle, elapsed: float):
+        """Attribute one overrunning callback"""
+        key = self.owner(handle)
+        stats = self.slow_by_owner.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        self.slow.append((time.time(), round(elapsed * 1000, 1), *key))
+        logging.warning(f"[{key[0]}] Slow loop callback: {elapsed * 1000:.0f} ms in {key[2]} ({key[1]})")
+    
+    async def run_heartbeat(self):
+        """Measure lag every WATCHDOG_INTERVAL and apply the safety action"""
+        interval = Config.WATCHDOG_INTERVAL
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - start - interval)
+            self.lags[self.lag_count % len(self.lags)] = lag
+            self.lag_count += 1
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.check_safety(lag)
+    
+    def check_safety(self, lag: float):
+        """Trip LAG_SAFETY_ACTION above the limit; resume after a calm period"""
+        if Config.LAG_SAFETY_ACTION == 'none':
+            return
+        if lag > Config.LAG_SAFETY_LIMIT:
+            self._calm_since = None
+            if not self.paused:
+                self.trip(lag)
+        elif self.paused:
+            if lag > Config.LAG_SAFETY_LIMIT / 2:
+                self._calm_since = None
+            elif self._calm_since is None:
+                self._calm_since = time.perf_counter()
+            elif time.perf_counter() - self._calm_since >= Config.LAG_RESUME_SECONDS:
+                self.paused = False
+                self._calm_since = None
+                logging.info("Loop lag back to normal - accepting signals again")
+                print("\t[+] Loop lag back to normal - accepting signals again")
+    
+    def trip(self, lag: float):
+        self.paused = True
+        self.trips += 1
+        logging.error(f"Loop lag {lag:.2f}s over safety limit - {Config.LAG_SAFETY_ACTION}")
+        print(f"\n\t[!] Event loop lag {lag:.2f}s over {Config.LAG_SAFETY_LIMIT}s - new signals paused")
+        if Config.LAG_SAFETY_ACTION == 'flatten':
+            print("\t[!] Flattening every position")
+            for trader in list(order_manager.active_traders.values()):
+                asyncio.ensure_future(trader.abort())
+    
+    def percentiles(self) -> dict:
+        """Lag percentiles over the retained samples, in milliseconds"""
+        count = min(self.lag_count, len(self.lags))
+        if not count:
+            return {}
+        samples = np.sort(np.frombuffer(self.lags, dtype=np.float64)[:count]) * 1000
+        return {
+            'p50_ms': round(float(samples[count // 2]), 2),
+            'p90_ms': round(float(samples[int(count * 0.9)]), 2),
+            'p99_ms': round(float(samples[min(count - 1, int(count * 0.99))]), 2),
+            'max_ms': round(self.max_lag * 1000, 2),
+        }
+    
+    def stats(self) -> dict:
+        worst = sorted(self.slow_by_owner.items(), key=lambda item: -item[1][1])[:10]
+        return {
+            'lag': self.percentiles(),
+            'samples': self.lag_count,
+            'attributing': self._saved_debug is not None,
+            'slow_callbacks': sum(stats[0] for stats in self.slow_by_owner.values()),
+            'paused': self.paused,
+            'trips': self.trips,
+            'slowest': [
+                {'symbol': symbol, 'state': state, 'where': where, 'count': count,
+                 'total_ms': round(total * 1000, 1), 'max_ms': round(longest * 1000, 1)}
+                for (symbol, state, where), (count, total, longest) in worst
+            ],
+            'recent': [
+                {'time': t, 'ms': ms, 'symbol': symbol, 'state': state, 'where': where}
+                for t, ms, symbol, state, where in list(self.slow)[-10:]
+            ],
+        }
 
 
-class TradeState:
-    """Trading state machine states"""
-    IN_TRADE_PNL_U5 = "IN_TRADE_PNL_U5"      # In trade, PnL under 5%
-    STOPPED_OUT = "STOPPED_OUT"               # Stop loss hit
-    WAITING_REENTRY = "WAITING_REENTRY"       # Waiting for reentry trigger
-    IN_TRADE_PNL_O5 = "IN_TRADE_PNL_O5"      # In trade, PnL over 5%
-    IN_TRADE_PNL_O33 = "IN_TRADE_PNL_O33"    # In trade, PnL over 33%
-    IN_TRADE_PNL_O66 = "IN_TRADE_PNL_O66"    # In trade, PnL over 66%
-    IN_TRADE_PNL_O99 = "IN_TRADE_PNL_O99"    # In trade, PnL over 99%
-    TRADE_COMPLETE = "TRADE_COMPLETE"         # Trade finished
+class _StatusClient:
+    """One connected status stream and the delta it has not been sent yet"""
+    __slots__ = ('writer', 'pending', 'shared', 'wakeup', 'coalesced')
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.pending: Dict[str, dict] = {}
+        self.shared = False   # pending is the published delta itself (copied before modifying)
+        self.wakeup = asyncio.Event()
+        self.coalesced = 0
+    
+    def merge(self, delta: Dict[str, dict]):
+        """Fold a published delta into the unsent one (later values win)"""
+        if not self.pending:
+            self.pending = delta
+            self.shared = True
+            self.wakeup.set()
+            return
+        if self.shared:
+            self.pending = {key: dict(fields) if fields is not None else None
+                            for key, fields in self.pending.items()}
+            self.shared = False
+        pending = self.pending
+        self.coalesced += 1
+        for key, fields in delta.items():
+            existing = pending.get(key)
+            if fields is None or existing is None:
+                pending[key] = dict(fields) if fields is not None else None
+            else:
+                existing.update(fields)
+        self.wakeup.set()
 
 
-class OrderManager:
-    """Global order manager for emergency operations"""
+class StatusServer:
+    """
+    Loopback Server-Sent Events feed of every trader in order_manager
     
-    def __init__(self):
-        self.active_traders: Dict[str, 'StockTrader'] = {}
-        self.hotkey_active = False
+    GET /events sends a 'snapshot' event with every trader's fields, then
+    'delta' events with only the fields that changed (null removes a
+    trader). GET /snapshot returns the current view as plain JSON, GET
+    /stress a fresh StressCalculator result and GET /health the loop
+    watchdog's lag percentiles and slowest callbacks.
     
-    def register_trader(self, trader: 'StockTrader'):
-        """Register active trader"""
-        self.active_traders[trader.symbol] = trader
+    Every interval the loop diffs the traders against the last published
+    view and merges the delta into each client's pending dict. A task per
+    client writes whatever is pending once its socket has drained, so a
+    slow client gets fewer, coalesced deltas and never blocks the loop.
+    """
     
-    def unregister_trader(self, symbol: str):
-        """Unregister completed trader"""
-        if symbol in self.active_traders:
-            del self.active_traders[symbol]
+    def __init__(self, interval: float = None, send_buffer: int = None):
+        self.interval = interval or Config.STATUS_INTERVAL
+        self.send_buffer = send_buffer or Config.STATUS_SEND_BUFFER
+        self.server = None
+        self.port = None
+        self.view: Dict[str, dict] = {}   # trade_id -> fields, as last published
+        self.clients = set()
+        self._task = None
+        self._delta = None   # last published delta and its encoding, shared by up-to-date clients
+        self._delta_payload = None
+        
+        # Stats
+        self.publishes = 0
+        self.publish_ns_total = 0
+        self.publish_ns_max = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
     
-    def setup_emergency_hotkeys(self):
-        """Setup keyboard hotkeys for emergency operations"""
-        keyboard.add_hotkey('ctrl+shift+x', self.clear_clipboard_symbol)
+    async def start(self, host: str = None, port: int = None):
+        """Listen for status clients and start publishing"""
+        host = host or Config.STATUS_HOST
+        port = Config.STATUS_PORT if port is None else port
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._task = asyncio.create_task(self.run_publisher())
+        logging.info(f"Status API listening on http://{host}:{self.port}/events")
+        print(f"\tStatus API: http://{host}:{self.port}/events")
     
-    def clear_clipboard_symbol(self):
-        """Emergency clipboard clear to stop processing current symbol"""
-        if self.hotkey_active:
-            return
-        self.hotkey_active = True
+    def stop(self):
+        """Stop publishing and disconnect every client"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        for client in list(self.clients):
+            client.writer.close()
+        self.clients.clear()
+    
+    @staticmethod
+    def trader_fields(trader: 'StockTrader') -> dict:
+        """The fields published for one trader"""
+        return {
+            'symbol': trader.symbol,
+            'account': trader.account,
+            'state': trader.state.name,
+            'position': trader.live_position,
+            'fill_price': trader.fill_price,
+            'pnl_pct': round(trader.unrealized_pnl_pct, 2),
+            'reentries': trader.reentry_count,
+            'orders': [
+                [trade.order.orderId, trade.order.orderType, trade.order.action, trade.order.totalQuantity,
+                 trade.order.auxPrice if trade.order.orderType == 'STP LMT' else trade.order.lmtPrice,
+                 trade.order.orderId in trader.parked_orders]
+                for trade in trader.get_live_orders()
+            ],
+        }
+    
+    def current_view(self) -> Dict[str, dict]:
+        """Fields of every active trader, keyed by trade_id"""
+        return {
+            str(trader.trade_id): self.trader_fields(trader)
+            for trader in list(order_manager.active_traders.values())
+        }
+    
+    def publish(self):
+        """Diff the traders against the published view and queue the delta for every client"""
+        t0 = time.perf_counter_ns()
+        current = self.current_view()
+        previous = self.view
+        delta = {}
+        for key, fields in current.items():
+            old = previous.get(key)
+            if old is None:
+                delta[key] = fields
+                continue
+            if old == fields:
+                continue
+            changed = {name: value for name, value in fields.items() if old[name] != value}
+            if changed:
+                delta[key] = changed
+        for key in previous.keys() - current.keys():
+            delta[key] = None
+        self.view = current
+        if delta:
+            self._delta, self._delta_payload = delta, None
+            for client in self.clients:
+                client.merge(delta)
+        
+        elapsed = time.perf_counter_ns() - t0
+        self.publishes += 1
+        self.publish_ns_total += elapsed
+        if elapsed > self.publish_ns_max:
+            self.publish_ns_max = elapsed
+    
+    async def run_publisher(self):
+        """Publish deltas every interval while anyone is listening"""
+        while True:
+            await clock.sleep(self.interval)
+            if self.clients:
+                self.publish()
+    
+    @staticmethod
+    def _encode(event: str, data) -> bytes:
+        return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+    
+    def _send(self, client: _StatusClient, event: str, data) -> None:
+        if data is self._delta:
+            if self._delta_payload is None:
+                self._delta_payload = self._encode(event, data)
+            payload = self._delta_payload
+        else:
+            payload = self._encode(event, data)
+        client.writer.write(payload)
+        self.events_sent += 1
+        self.bytes_sent += len(payload)
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one HTTP request"""
+        client = None
         try:
-            print("\n\t=== CLEARING CLIPBOARD SYMBOL ===")
-            pyperclip.copy("")
-            print("\tClipboard cleared - waiting for new symbol...")
+            request = await clock.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            parts = request.split(b' ', 2)
+            path = parts[1] if len(parts) > 1 else b''
+            if path == b'/snapshot':
+                body = json.dumps(self.view if self.clients else self.current_view()).encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body
+                )
+                await writer.drain()
+                return
+            if path in (b'/stress', b'/health'):
+                result = stress_calculator.refresh() if path == b'/stress' else loop_watchdog.stats()
+                body = json.dumps(result).encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body
+                )
+                await writer.drain()
+                return
+            if path != b'/events':
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+            if len(self.clients) >= Config.STATUS_MAX_CLIENTS:
+                writer.write(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+            
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n'
+            )
+            # Keep little in flight so a slow reader's deltas coalesce here instead of queueing
+            writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+            writer.transport.set_write_buffer_limits(high=self.send_buffer)
+            if not self.clients:
+                self.view = self.current_view()   # not kept up to date while nobody listens
+            client = _StatusClient(writer)
+            self._send(client, 'snapshot', self.view)
+            self.clients.add(client)
+            logging.info(f"Status client connected ({len(self.clients)} total)")
+            
+            while True:
+                await writer.drain()
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                pending, client.pending, client.shared = client.pending, {}, False
+                if pending:
+                    self._send(client, 'delta', pending)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
         except Exception as e:
-            print(f"\tClipboard clear error: {e}")
+            logging.error(f"Status client error: {e}")
         finally:
-            self.hotkey_active = False
+            if client is not None:
+                self.clients.discard(client)
+                logging.info(f"Status client disconnected ({len(self.clients)} remaining)")
+            writer.close()
+    
+    def stats(self) -> dict:
+        """Publication cost and traffic"""
+        return {
+            'clients': len(self.clients),
+            'publishes': self.publishes,
+            'mean_publish_us': round(self.publish_ns_total / self.publishes / 1000, 1) if self.publishes else 0,
+            'max_publish_us': round(self.publish_ns_max / 1000, 1),
+            'events_sent': self.events_sent,
+            'bytes_sent': self.bytes_sent,
+        }
 
 
 # Global instances
 order_manager = OrderManager()
-tracked_symbols = set()
+signal_index = SignalIndex()
+tick_engine = TickSizeEngine(os.path.join(Config.CACHE_DIR, Config.MARKET_RULE_CACHE_FILE))
+amend_stats = AmendmentStats()
+entry_stats = EntryStats()
+subscriptions = SubscriptionManager()
+account_state = AccountState()
+connection_supervisor = ConnectionSupervisor()
+profiler = Profiler()
+loop_watchdog = LoopWatchdog()
+stress_calculator = StressCalculator()
+shadow_book = ShadowBook()
+quote_table = QuoteTable(Config.MARKET_DATA_LINES)
+bar_store = BarStore(os.path.join(Config.CACHE_DIR, Config.BAR_DIR), Config.BAR_CAPACITY)
+momentum_scanner = MomentumScanner()
+session_recorder = SessionRecorder(Config.RECORDER_BATCH_SIZE, Config.RECORDER_FLUSH_SECONDS)
+blotter = TradeBlotter(Config.BLOTTER_BATCH_SIZE, Config.BLOTTER_FLUSH_SECONDS)
+signal_leases = SignalLeases()
+status_server = StatusServer()
+
+
+def cap_to_buying_power(position: int, entry_price: float) -> int:
+    """Shrink a position to what the cached buying power covers (unchanged before it arrives)"""
+    buying_power = account_state.buying_power()
+    if buying_power is None or position * entry_price <= buying_power:
+        return position
+    return max(0, int(buying_power // entry_price))
+
+
+def compute_position_size(symbol: str, entry_price: float) -> tuple:
+    """
+    Shares and stop level for a signal
+    
+    With ATR sizing and cached bars, the stop sits ATR_STOP_MULTIPLIER ATRs
+    below entry and the position loses RISK_PER_TRADE dollars if it is hit
+    (capped at MAX_POSITION_CAPITAL). Otherwise the flat
+    POSITION_CAPITAL // entry_price size and STOP_LOSS_PCT are used.
+    Either way the position never exceeds the account's buying power.
+    
+    Returns:
+        (position, stop_loss_pct) - stop_loss_pct multiplies the fill price
+    """
+    atr_pct = bar_store.atr_pct(symbol) if Config.ATR_SIZING else None
+    if atr_pct is None:
+        position = max(Config.MIN_POSITION_SIZE, int(Config.POSITION_CAPITAL // entry_price))
+        return cap_to_buying_power(position, entry_price), Config.STOP_LOSS_PCT
+    stop_distance = min(
+        max(Config.ATR_STOP_MULTIPLIER * atr_pct, Config.MIN_STOP_DISTANCE_PCT),
+        Config.MAX_STOP_DISTANCE_PCT
+    )
+    position = min(
+        int(Config.RISK_PER_TRADE / (entry_price * stop_distance)),
+        int(Config.MAX_POSITION_CAPITAL // entry_price)
+    )
+    position = cap_to_buying_power(max(Config.MIN_POSITION_SIZE, position), entry_price)
+    return position, round(1 - stop_distance, 4)
+
+
+def allocate_position(position: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """Shares per account: the signal's position scaled by each account's weight"""
+    return {
+        account: max(Config.MIN_POSITION_SIZE, int(round(position * weight)))
+        for account, weight in weights.items() if weight > 0
+    }
+
+
+def _order_property(index: int, doc: str) -> property:
+    """Property backed by one entry of StockTrader._orders"""
+    def getter(self):
+        return self._orders[index]
+    
+    def setter(self, trade):
+        self._orders[index] = trade
+    
+    return property(getter, setter, doc=doc)
 
 
 class StockTrader:
@@ -159,8 +4450,31 @@ class StockTrader:
     - Real-time P&L monitoring
     """
     
+    __slots__ = (
+        'ib', 'symbol', 'entry_price', 'capital', 'contract',
+        'state', 'state_counts', '_history', '_history_count',
+        'position_size', 'live_position', 'fill_price', 'exit_fill_price', 'total_exit_filled',
+        'unrealized_pnl', 'unrealized_pnl_pct', 'last_pnl_update_time', 'pnl_obj', 'account',
+        '_orders', 'parked_orders',
+        'tp33_filled_handled', 'tp66_filled_handled', 'tp99_filled_handled',
+        'start_time', 'entry_placed_at', 'timeout_duration', 'reentry_count', 'max_reentries',
+        'price_precision', 'stop_loss_pct', 'signal_id', 'order_futures', 'state_future',
+        'trade_id', 'tag',
+    )
+    
+    # Order handles live in a fixed array; index order is also get_live_orders() order
+    ORDER_INITIAL, ORDER_STOP_LOSS, ORDER_REENTRY, ORDER_TP33, ORDER_TP66, ORDER_TP99 = range(6)
+    
+    initial_order = _order_property(ORDER_INITIAL, "Entry order trade")
+    stop_loss_order = _order_property(ORDER_STOP_LOSS, "Stop loss trade")
+    reentry_order = _order_property(ORDER_REENTRY, "Reentry order trade")
+    take_profit_33 = _order_property(ORDER_TP33, "33% take profit trade")
+    take_profit_66 = _order_property(ORDER_TP66, "66% take profit trade")
+    take_profit_99 = _order_property(ORDER_TP99, "99% take profit trade")
+    
     def __init__(self, ib: IB, symbol: str, entry_price: float, capital: float, 
-                 price_precision: int, position: int):
+                 price_precision: int, position: int, stop_loss_pct: float = None,
+                 account: str = None):
         self.ib = ib
         self.symbol = symbol
         self.entry_price = entry_price
@@ -168,8 +4482,10 @@ class StockTrader:
         self.contract = Stock(symbol, 'SMART', 'USD')
         
         # State management
-        self.state = None
-        self.previous_states = []
+        self.state = TradeState.NEW
+        self.state_counts = array('I', [0]) * len(TradeState)   # Entries per state
+        self._history = array('B', [0]) * Config.STATE_HISTORY_SIZE   # Ring buffer of previous states
+        self._history_count = 0
         
         # Position tracking
         self.position_size = position
@@ -183,15 +4499,12 @@ class StockTrader:
         self.unrealized_pnl_pct = 0
         self.last_pnl_update_time = None
         self.pnl_obj = None
-        self.account = None
+        self.account = account or (ib.wrapper.accounts[0] if ib is not None and ib.wrapper.accounts else None)
         
         # Orders
-        self.initial_order = None
-        self.stop_loss_order = None
-        self.reentry_order = None
-        self.take_profit_33 = None
-        self.take_profit_66 = None
-        self.take_profit_99 = None
+        self._orders = [None] * 6
+        
+        self.parked_orders = set()   # orderIds parked instead of cancelled
         
         # Take profit fill tracking
         self.tp33_filled_handled = False
@@ -199,7 +4512,8 @@ class StockTrader:
         self.tp99_filled_handled = False
         
         # Timing
-        self.start_time = datetime.now()
+        self.start_time = clock.now()
+        self.entry_placed_at = None   # clock time the entry order was sent
         self.timeout_duration = timedelta(minutes=Config.TIMEOUT_MINUTES)
         
         # Reentry management
@@ -209,8 +4523,14 @@ class StockTrader:
         # Precision
         self.price_precision = price_precision
         
-        # Tracking key
-        self.symbol_price_key = (symbol, entry_price)
+        # Stop level as a multiple of the fill price
+        self.stop_loss_pct = stop_loss_pct or Config.STOP_LOSS_PCT
+        
+        # SignalIndex entry this trader releases when it finishes (None if spawned without one)
+        self.signal_id = None
+        self.trade_id = blotter.next_trade_id()
+        # Log prefix; the trade id tells apart traders of the same symbol in the log
+        self.tag = f"{symbol}#{self.trade_id}"
         
         # Futures for async coordination
         self.order_futures = {}
@@ -219,26 +4539,57 @@ class StockTrader:
         # Register with global manager
         order_manager.register_trader(self)
         
-        logging.info(f"StockTrader initialized for {symbol} at {entry_price}")
+        logging.info(f"StockTrader initialized for {self.tag} at {entry_price}")
         print(f"\t[{symbol}] Initialized trader - Position size: {self.position_size}")
     
     def round_price(self, price: float) -> float:
-        """Round price based on value (2 decimals for > $1, 4 for < $1)"""
+        """Round price to the contract's market rule tick size"""
+        ticked = tick_engine.round_price(self.contract.conId, price)
+        if ticked is not None:
+            return ticked
+        
+        # Fallback: 2 decimals for > $1, 4 for < $1
         if price >= 1.0:
             return round(price, 2)
         else:
             return round(price, 4)
     
+    async def prepare(self):
+        """Qualify the contract and load its tick-size rules"""
+        await self.ib.qualifyContractsAsync(self.contract)
+        await self.load_market_rules()
+    
+    def place_order(self, order: Order) -> Trade:
+        """Place a new order on this trader's contract and account"""
+        if self.account:
+            order.account = self.account
+        trade = self.ib.placeOrder(self.contract, order)
+        blotter.record_order(self.trade_id, self.account, trade)
+        return trade
+    
+    async def load_market_rules(self):
+        """Load tick-size rules for the contract (cached after first fetch)"""
+        try:
+            if await tick_engine.ensure_rules(self.ib, self.contract):
+                return True
+            logging.warning(f"[{self.tag}] No market rule available - using default rounding")
+        except Exception as e:
+            logging.error(f"[{self.tag}] Market rule error: {e}")
+        print(f"\t[{self.symbol}] Market rule unavailable - using default price rounding")
+        return False
+    
     def get_live_orders(self) -> List[Order]:
         """Get all currently active orders"""
         live_orders = []
-        orders = [self.initial_order, self.stop_loss_order, self.reentry_order,
-                 self.take_profit_33, self.take_profit_66, self.take_profit_99]
-        for order in orders:
+        for order in self._orders:
             if order and order.orderStatus.status in ['PreSubmitted', 'Submitted']:
                 live_orders.append(order)
         return live_orders
     
+    def tracked_orders(self) -> List[Trade]:
+        """All order handles held by this trader, live or not"""
+        return [order for order in self._orders if order is not None]
+    
     def is_order_cancelled(self, order) -> bool:
         """Check if order was cancelled"""
         return order and order.orderStatus.status == 'Cancelled'
@@ -247,24 +4598,156 @@ class StockTrader:
         """Check if order is currently active"""
         return order and order.orderStatus.status in ['PreSubmitted', 'Submitted']
     
+    async def wait_for_order_ack(self, order):
+        """Wait until an order is acknowledged (or already done)"""
+        start = clock.time()
+        while order.orderStatus.status not in ('PreSubmitted', 'Submitted', 'Filled'):
+            if order.isDone():
+                return
+            await clock.sleep(0.11)
+        amend_stats.record_ack(clock.time() - start)
+    
+    # ==================== ORDER AMENDMENT ====================
+    
+    def amend_order(self, order, **changes) -> bool:
+        """Re-submit a live order under the same orderId with changed fields"""
+        if not self.is_order_live(order):
+            return False
+        try:
+            for field, value in changes.items():
+                setattr(order.order, field, value)
+            self.ib.placeOrder(self.contract, order.order)
+            blotter.record_order(self.trade_id, self.account, order)
+            amend_stats.amendments += 1
+            logging.info(
+                f"[{self.tag}] Order {order.order.orderId} amended: "
+                + ", ".join(f"{field}={value}" for field, value in changes.items())
+            )
+            return True
+        except Exception as e:
+            logging.error(f"[{self.tag}] Amend order error: {e}")
+            print(f"\t[{self.symbol}] Amend order error: {e}")
+            return False
+    
+    def park_order(self, order, **changes) -> bool:
+        """Move a live order to a level where it cannot trigger, instead of cancelling it"""
+        if not Config.AMEND_ORDERS or not self.amend_order(order, **changes):
+            return False
+        self.parked_orders.add(order.order.orderId)
+        amend_stats.parks += 1
+        amend_stats.round_trips_saved += 1   # no cancel acknowledgement to wait for
+        return True
+    
+    def reactivate_order(self, order, **changes) -> bool:
+        """Bring a parked order back to a live level, instead of placing a new one"""
+        if (not Config.AMEND_ORDERS or not order
+                or order.order.orderId not in self.parked_orders
+                or not self.amend_order(order, **changes)):
+            return False
+        self.parked_orders.discard(order.order.orderId)
+        amend_stats.reactivations += 1
+        amend_stats.round_trips_saved += 1   # no new-order acknowledgement to wait for
+        amend_stats.order_ids_saved += 1
+        return True
+    
+    async def park_stop_loss(self):
+        """Park the stop loss far below the market (falls back to cancel)"""
+        if self.is_order_live(self.stop_loss_order):
+            parked_stop = self.round_price(self.fill_price * Config.PARKED_STOP_PCT)
+            if self.park_order(
+                self.stop_loss_order,
+                auxPrice=parked_stop,
+                lmtPrice=self.round_price(parked_stop * 0.97)
+            ):
+                print(f"\t[{self.symbol}] Stop loss parked @ {parked_stop}")
+                return True
+        return await self.cancel_order(self.stop_loss_order)
+    
+    async def reactivate_stop_loss(self) -> bool:
+        """Move a parked stop loss back to the protective level"""
+        if self.live_position <= 0:
+            return False
+        stop_price = self.round_price(self.fill_price * self.stop_loss_pct)
+        if self.reactivate_order(
+            self.stop_loss_order,
+            auxPrice=stop_price,
+            lmtPrice=self.round_price(self.fill_price * (self.stop_loss_pct - Config.STOP_LIMIT_GAP_PCT)),
+            totalQuantity=self.live_position
+        ):
+            logging.info(
+                f"[{self.tag}] Stop loss reactivated: "
+                f"{self.live_position} @ {stop_price}"
+            )
+            print(f"\t[{self.symbol}] STOP LOSS set @ {stop_price}")
+            return True
+        return False
+    
+    async def cancel_stop_loss(self):
+        """Cancel the current stop loss, live or parked, so a fresh one cannot oversell next to it"""
+        order = self.stop_loss_order
+        if order is None or order.isDone():
+            return
+        if self.is_order_live(order):
+            await self.cancel_order(order)
+        else:
+            try:
+                self.ib.cancelOrder(order.order)   # not acknowledged yet
+            except Exception as e:
+                logging.error(f"[{self.tag}] Cancel order error: {e}")
+        self.parked_orders.discard(order.order.orderId)
+    
+    def unhandled_take_profit_shares(self) -> float:
+        """Shares sold by take profits whose fill the state handlers have not counted yet"""
+        shares = 0
+        for order, handled in ((self.take_profit_33, self.tp33_filled_handled),
+                               (self.take_profit_66, self.tp66_filled_handled),
+                               (self.take_profit_99, self.tp99_filled_handled)):
+            if order and not handled:
+                shares += sum(fill.execution.shares for fill in order.fills)
+        return shares
+    
+    def sync_parked_stop_quantity(self):
+        """Keep a parked stop loss no larger than the remaining position"""
+        order = self.stop_loss_order
+        remaining = self.live_position - self.unhandled_take_profit_shares()
+        if remaining > 0 and self.is_order_live(order) and order.order.totalQuantity != remaining:
+            self.amend_order(order, totalQuantity=remaining)
+    
+    def on_fill(self, trade: Trade):
+        """Resize the stop loss the moment a take profit fills (even partially), not when a handler polls"""
+        if any(trade is order for order in (self.take_profit_33, self.take_profit_66, self.take_profit_99)):
+            self.sync_parked_stop_quantity()
+    
+    async def park_take_profits(self):
+        """Park all take profit orders far above the market (falls back to cancel)"""
+        parked_price = self.round_price(self.fill_price * Config.PARKED_TP_MULTIPLIER)
+        for order in [self.take_profit_33, self.take_profit_66, self.take_profit_99]:
+            if self.is_order_live(order) and self.park_order(order, lmtPrice=parked_price):
+                continue
+            await self.cancel_order(order)
+    
+    async def cancel_parked_orders(self):
+        """Cancel any orders still parked (nothing left to protect or take)"""
+        for order in [self.stop_loss_order, self.take_profit_33, self.take_profit_66, self.take_profit_99]:
+            if order and order.order.orderId in self.parked_orders:
+                await self.cancel_order(order)
+                self.parked_orders.discard(order.order.orderId)
+    
     async def setup_pnl_monitoring(self):
         """Setup real-time P&L monitoring for the position"""
         try:
-            self.account = self.ib.wrapper.accounts[0]
-            self.pnl_obj = self.ib.reqPnLSingle(
-                self.account, 
-                modelCode='', 
-                conId=self.contract.conId
+            self.account = self.account or self.ib.wrapper.accounts[0]
+            self.pnl_obj = subscriptions.acquire_pnl(
+                self.ib, self.account, self.contract.conId, self.on_pnl_update
             )
-            self.ib.pnlSingleEvent += self.on_pnl_update
             
-            logging.info(f"[{self.symbol}] PnL monitoring requested")
+            logging.info(f"[{self.tag}] PnL monitoring requested")
             print(f"\t[{self.symbol}] Waiting for PnL data...")
             
             pnl_received = await self.wait_for_valid_pnl_data(timeout=60)
             if pnl_received:
                 logging.info(
-                    f"[{self.symbol}] PnL monitoring setup complete - "
+                    f"[{self.tag}] PnL monitoring setup complete - "
                     f"Initial PnL: ${self.unrealized_pnl:.2f} ({self.unrealized_pnl_pct:.2f}%)"
                 )
                 print(
@@ -273,19 +4756,25 @@ class StockTrader:
                 )
                 return True
             else:
-                logging.error(f"[{self.symbol}] PnL monitoring setup failed - no data received")
+                logging.error(f"[{self.tag}] PnL monitoring setup failed - no data received")
                 print(f"\t[{self.symbol}] PnL monitoring failed - no data received")
                 return False
         except Exception as e:
-            logging.error(f"[{self.symbol}] PnL monitoring setup error: {e}")
+            logging.error(f"[{self.tag}] PnL monitoring setup error: {e}")
             print(f"\t[{self.symbol}] PnL monitoring error: {e}")
             return False
     
+    def release_pnl_monitoring(self):
+        """Release the PnL subscription and handler (safe to call twice)"""
+        if self.pnl_obj is not None:
+            subscriptions.release_pnl(self.account, self.contract.conId, self.on_pnl_update)
+            self.pnl_obj = None
+    
     async def wait_for_valid_pnl_data(self, timeout: int = 60) -> bool:
         """Wait for initial P&L data to arrive"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            await asyncio.sleep(0.5)
+        start_time = clock.time()
+        while clock.time() - start_time < timeout:
+            await clock.sleep(0.5)
             if self.last_pnl_update_time and self.unrealized_pnl is not None:
                 if await self.validate_pnl_data():
                     return True
@@ -304,20 +4793,23 @@ class StockTrader:
             calculated_pct = (self.unrealized_pnl / cost_basis) * 100
             if abs(calculated_pct - self.unrealized_pnl_pct) > 5:
                 logging.warning(
-                    f"[{self.symbol}] PnL mismatch - "
+                    f"[{self.tag}] PnL mismatch - "
                     f"Reported: {self.unrealized_pnl_pct:.2f}%, "
                     f"Calculated: {calculated_pct:.2f}%"
                 )
             return True
         except Exception as e:
-            logging.error(f"[{self.symbol}] PnL validation error: {e}")
+            logging.error(f"[{self.tag}] PnL validation error: {e}")
             return False
     
     def on_pnl_update(self, pnl):
         """Callback for P&L updates"""
         if pnl.conId == self.contract.conId:
             self.unrealized_pnl = pnl.unrealizedPnL or 0
-            self.last_pnl_update_time = time.time()
+            if pnl.position and pnl.value == pnl.value and len(order_manager.sharing(self)) > 1:
+                # One PnLSingle covers every trader on this position; take this trader's shares
+                self.unrealized_pnl = self.live_position * (pnl.value / pnl.position - (self.fill_price or 0))
+            self.last_pnl_update_time = clock.time()
             
             if self.live_position > 0 and self.fill_price:
                 cost_basis = self.live_position * self.fill_price
@@ -326,8 +4818,12 @@ class StockTrader:
                     if cost_basis > 0 else 0
                 )
             
+            session_recorder.record_pnl(
+                self.symbol, self.unrealized_pnl, self.unrealized_pnl_pct, pnl.dailyPnL
+            )
+            
             logging.debug(
-                f"[{self.symbol}] PnL update: "
+                f"[{self.tag}] PnL update: "
                 f"${self.unrealized_pnl:.2f} ({self.unrealized_pnl_pct:.2f}%)"
             )
             
@@ -337,100 +4833,186 @@ class StockTrader:
     
     async def get_actual_position(self) -> int:
         """Get actual position from broker"""
+        await connection_supervisor.wait_ready()
         try:
-            positions = self.ib.positions()
+            positions = self.ib.positions(self.account or '')
             for pos in positions:
                 if pos.contract.symbol == self.symbol:
                     return int(pos.position)
             return 0
         except Exception as e:
-            logging.error(f"[{self.symbol}] Error getting actual position: {e}")
+            logging.error(f"[{self.tag}] Error getting actual position: {e}")
             print(f"\t[{self.symbol}] Error getting actual position: {e}")
             return 0
     
     async def check_position_integrity(self) -> bool:
         """Verify tracked position matches broker position"""
         actual_pos = await self.get_actual_position()
-        position_discrepancy = abs(actual_pos - self.live_position)
+        sharing = order_manager.sharing(self)
+        tracked = sum(trader.live_position for trader in sharing) if len(sharing) > 1 else self.live_position
+        position_discrepancy = abs(actual_pos - tracked)
         
         if position_discrepancy > 0 and actual_pos == 0:
             logging.info(
-                f"[{self.symbol}] Position manually closed - "
+                f"[{self.tag}] Position manually closed - "
                 f"tracked: {self.live_position}, actual: {actual_pos}"
             )
             print(f"\t[{self.symbol}] Position manually closed - ending trade")
             self.live_position = 0
             await self.set_state(TradeState.TRADE_COMPLETE)
             return False
-        elif position_discrepancy > self.live_position * 0.1:
+        elif position_discrepancy > tracked * 0.1:
             logging.warning(
-                f"[{self.symbol}] Position discrepancy - "
-                f"tracked: {self.live_position}, actual: {actual_pos}"
+                f"[{self.tag}] Position discrepancy - "
+                f"tracked: {tracked}, actual: {actual_pos}"
             )
             print(
                 f"\t[{self.symbol}] Position discrepancy detected - "
-                f"tracked: {self.live_position}, actual: {actual_pos}"
+                f"tracked: {tracked}, actual: {actual_pos}"
             )
-            self.live_position = actual_pos
+            # With several traders on the position the difference cannot be attributed
+            if len(sharing) <= 1:
+                self.live_position = actual_pos
         
         return True
     
+    def peg_price(self, ticker) -> float:
+        """Pegged entry limit: the ask (plus offset), capped at the maximum slippage"""
+        cap = self.entry_price * (1 + Config.ENTRY_MAX_SLIPPAGE_PCT / 100)
+        reference = self.entry_price
+        if ticker is not None:
+            for price in (ticker.ask, ticker.last):
+                if price and price > 0 and price == price:
+                    reference = price * (1 + Config.ENTRY_PEG_OFFSET_PCT / 100)
+                    break
+        return self.round_price(min(reference, cap))
+    
+    def place_initial_buy(self) -> Trade:
+        """Send the entry limit order (no awaits, so allocated entries go out back to back)"""
+        if Config.ENTRY_MODE == 'pegged':
+            limit_price = self.peg_price(subscriptions.ticker(self.contract.conId))
+        else:
+            limit_price = self.round_price(self.entry_price * Config.ENTRY_LIMIT_PCT)
+        initial_order = LimitOrder(
+            action='BUY',
+            totalQuantity=self.position_size,
+            lmtPrice=limit_price,
+            tif='DAY' if Config.ENTRY_MODE == 'pegged' else 'GTC',
+            outsideRth=True
+        )
+        
+        self.initial_order = self.place_order(initial_order)
+        self.entry_placed_at = clock.time()
+        
+        logging.info(
+            f"[{self.tag}] Initial buy order placed: "
+            f"{self.position_size} @ {limit_price}" + (f" ({self.account})" if self.account else "")
+        )
+        print(f"\t[{self.symbol}] BUY order placed: {self.position_size} @ {limit_price}")
+        return self.initial_order
+    
     async def submit_initial_buy(self):
         """Submit initial buy order"""
         try:
-            limit_price = self.round_price(self.entry_price * Config.ENTRY_LIMIT_PCT)
-            initial_order = LimitOrder(
-                action='BUY',
-                totalQuantity=self.position_size,
-                lmtPrice=limit_price,
-                tif='GTC',
-                outsideRth=True
-            )
-            
-            self.initial_order = self.ib.placeOrder(self.contract, initial_order)
-            trade = self.initial_order
-            
-            logging.info(
-                f"[{self.symbol}] Initial buy order placed: "
-                f"{self.position_size} @ {limit_price}"
-            )
-            print(f"\t[{self.symbol}] BUY order placed: {self.position_size} @ {limit_price}")
-            
+            if Config.ENTRY_MODE == 'pegged':
+                await self.pegged_entry()
+                return
+            trade = self.initial_order or self.place_initial_buy()
             await self.wait_for_fill(trade)
         except Exception as e:
-            logging.error(f"[{self.symbol}] Initial buy error: {e}")
+            logging.error(f"[{self.tag}] Initial buy error: {e}")
             print(f"\t[{self.symbol}] Initial buy failed: {e}")
             await self.set_state(TradeState.TRADE_COMPLETE)
     
+    async def pegged_entry(self):
+        """
+        Enter at the live ask and re-peg to it until filled or out of time
+        
+        The limit follows the streaming ask (plus ENTRY_PEG_OFFSET_PCT) but
+        never exceeds entry price + ENTRY_MAX_SLIPPAGE_PCT. It is amended in
+        place at most once per ENTRY_REPRICE_INTERVAL, and the remainder is
+        cancelled ENTRY_TIME_BUDGET seconds after the order was placed;
+        partial fills are kept.
+        """
+        ticker = subscriptions.acquire_mkt_data(self.ib, self.contract)
+        if ticker is None:
+            logging.warning(f"[{self.tag}] No market data line - entry limit not pegged")
+        reprices = 0
+        try:
+            if self.initial_order is None:
+                waited = 0.0
+                while ticker is not None and not (ticker.ask and ticker.ask > 0) and waited < Config.QUOTE_WAIT_SECONDS:
+                    await clock.sleep(0.05)
+                    waited += 0.05
+                self.place_initial_buy()
+            trade = self.initial_order
+            # The budget runs from the order, not the signal (quote wait, qualification)
+            deadline = (self.entry_placed_at or clock.time()) + Config.ENTRY_TIME_BUDGET
+            while not trade.isDone() and clock.time() < deadline:
+                await clock.sleep(Config.ENTRY_REPRICE_INTERVAL)
+                target = self.peg_price(ticker)
+                if not trade.isDone() and target != trade.order.lmtPrice:
+                    if self.amend_order(trade, lmtPrice=target):
+                        reprices += 1
+            if not trade.isDone():
+                logging.info(f"[{self.tag}] Pegged entry out of time after {reprices} reprices - cancelling")
+                print(f"\t[{self.symbol}] Entry not filled within {Config.ENTRY_TIME_BUDGET}s - cancelling")
+                await self.cancel_order(trade)
+                start = clock.time()
+                while not trade.isDone() and clock.time() - start < 5:
+                    await clock.sleep(0.1)
+        finally:
+            if ticker is not None:
+                subscriptions.release_mkt_data(self.ib, self.contract)
+        await self.enter_position(trade, reprices)
+    
     async def wait_for_fill(self, trade):
         """Wait for order to fill"""
         while not trade.isDone():
-            await asyncio.sleep(0.1)
-        
-        if trade.orderStatus.status == 'Filled':
-            fills = trade.fills
-            if fills:
-                total_filled = sum(fill.execution.shares for fill in fills)
-                avg_price = sum(
-                    fill.execution.price * fill.execution.shares 
-                    for fill in fills
-                ) / total_filled
-                
-                self.live_position = total_filled
-                self.fill_price = self.round_price(avg_price)
-                
-                logging.info(f"[{self.symbol}] Order filled: {total_filled} @ {self.fill_price}")
-                print(f"\t[{self.symbol}] FILLED: {total_filled} @ {self.fill_price}")
-                
-                pnl_ready = await self.setup_pnl_monitoring()
-                if pnl_ready:
-                    await self.set_state(TradeState.IN_TRADE_PNL_U5)
-                else:
-                    logging.error(f"[{self.symbol}] PnL monitoring failed - cannot proceed")
-                    print(f"\t[{self.symbol}] PnL monitoring failed - trade aborted")
-                    await self.set_state(TradeState.TRADE_COMPLETE)
+            await clock.sleep(0.1)
+        await self.enter_position(trade)
+    
+    def record_entry(self, trade, reprices: int = 0):
+        """Add this signal's entry outcome to entry_stats"""
+        filled = sum(fill.execution.shares for fill in trade.fills)
+        if filled:
+            avg_price = sum(fill.execution.price * fill.execution.shares for fill in trade.fills) / filled
+            slippage_pct = (avg_price - self.entry_price) / self.entry_price * 100
+            seconds = trade.fills[-1].time.timestamp() - self.start_time.timestamp()
+        else:
+            slippage_pct = seconds = 0.0
+        entry_stats.record(Config.ENTRY_MODE, self.position_size, int(filled), slippage_pct, seconds, reprices)
+        logging.info(
+            f"[{self.tag}] Entry ({Config.ENTRY_MODE}): {int(filled)}/{self.position_size} filled, "
+            f"slippage {slippage_pct:+.3f}%, {seconds:.2f}s, {reprices} reprices"
+        )
+    
+    async def enter_position(self, trade, reprices: int = 0):
+        """Start managing whatever the finished entry order filled"""
+        self.record_entry(trade, reprices)
+        fills = trade.fills
+        if fills:
+            total_filled = sum(fill.execution.shares for fill in fills)
+            avg_price = sum(
+                fill.execution.price * fill.execution.shares 
+                for fill in fills
+            ) / total_filled
+            
+            self.live_position = total_filled
+            self.fill_price = self.round_price(avg_price)
+            
+            logging.info(f"[{self.tag}] Order filled: {total_filled} @ {self.fill_price}")
+            print(f"\t[{self.symbol}] FILLED: {total_filled} @ {self.fill_price}")
+            
+            pnl_ready = await self.setup_pnl_monitoring()
+            if pnl_ready:
+                await self.set_state(TradeState.IN_TRADE_PNL_U5)
+            else:
+                logging.error(f"[{self.tag}] PnL monitoring failed - cannot proceed")
+                print(f"\t[{self.symbol}] PnL monitoring failed - trade aborted")
+                await self.set_state(TradeState.TRADE_COMPLETE)
         else:
-            logging.warning(f"[{self.symbol}] Order not filled: {trade.orderStatus.status}")
+            logging.warning(f"[{self.tag}] Order not filled: {trade.orderStatus.status}")
             print(f"\t[{self.symbol}] Order failed: {trade.orderStatus.status}")
             await self.set_state(TradeState.TRADE_COMPLETE)
     
@@ -438,8 +5020,8 @@ class StockTrader:
         """Place stop loss order"""
         if self.live_position > 0:
             try:
-                stop_price = self.round_price(self.fill_price * Config.STOP_LOSS_PCT)
-                lmt_price = self.round_price(self.fill_price * 0.95)
+                stop_price = self.round_price(self.fill_price * self.stop_loss_pct)
+                lmt_price = self.round_price(self.fill_price * (self.stop_loss_pct - Config.STOP_LIMIT_GAP_PCT))
                 
                 stop_loss_order = StopLimitOrder(
                     action='SELL',
@@ -450,38 +5032,41 @@ class StockTrader:
                     outsideRth=True
                 )
                 
-                self.stop_loss_order = self.ib.placeOrder(self.contract, stop_loss_order)
-                await asyncio.sleep(0.22)
+                self.stop_loss_order = self.place_order(stop_loss_order)
+                await clock.sleep(0.22)
                 
-                while self.stop_loss_order.orderStatus.status not in ('PreSubmitted', 'Submitted', 'Filled'):
-                    await asyncio.sleep(0.11)
+                await self.wait_for_order_ack(self.stop_loss_order)
                 
                 if self.stop_loss_order.orderStatus.status in ['PreSubmitted', 'Submitted']:
                     logging.info(
-                        f"[{self.symbol}] Stop loss placed: "
+                        f"[{self.tag}] Stop loss placed: "
                         f"{self.live_position} @ {stop_price}"
                     )
                     print(f"\t[{self.symbol}] STOP LOSS set @ {stop_price}")
                     return True
                 else:
                     logging.error(
-                        f"[{self.symbol}] Stop loss failed: "
+                        f"[{self.tag}] Stop loss failed: "
                         f"{self.stop_loss_order.orderStatus.status}"
                     )
                     print(f"\t[{self.symbol}] Stop loss failed")
                     return False
             except Exception as e:
-                logging.error(f"[{self.symbol}] Stop loss error: {e}")
+                logging.error(f"[{self.tag}] Stop loss error: {e}")
                 print(f"\t[{self.symbol}] Stop loss error: {e}")
                 return False
         return True
     
     async def place_take_profit_33(self):
         """Place 33% take profit order"""
+        tp_price = self.round_price(self.fill_price * Config.TP_33_MULTIPLIER)
+        if self.reactivate_order(self.take_profit_33, lmtPrice=tp_price):
+            logging.info(f"[{self.tag}] Take profit 33% reactivated @ {tp_price}")
+            print(f"\t[{self.symbol}] TP 33% set @ {tp_price}")
+            return True
         if not self.is_order_live(self.take_profit_33):
             if self.live_position > self.position_size * 0.96:
                 try:
-                    tp_price = self.round_price(self.fill_price * Config.TP_33_MULTIPLIER)
                     tp_size = max(1, self.position_size // 3)
                     
                     take_profit_33 = LimitOrder(
@@ -492,29 +5077,32 @@ class StockTrader:
                         outsideRth=True
                     )
                     
-                    self.take_profit_33 = self.ib.placeOrder(self.contract, take_profit_33)
+                    self.take_profit_33 = self.place_order(take_profit_33)
                     
-                    while self.take_profit_33.orderStatus.status not in ('PreSubmitted', 'Submitted', 'Filled'):
-                        await asyncio.sleep(0.11)
+                    await self.wait_for_order_ack(self.take_profit_33)
                     
                     logging.info(
-                        f"[{self.symbol}] Take profit 33% placed: "
+                        f"[{self.tag}] Take profit 33% placed: "
                         f"{tp_size} @ {tp_price}"
                     )
                     print(f"\t[{self.symbol}] TP 33% set: {tp_size} @ {tp_price}")
                     return True
                 except Exception as e:
-                    logging.error(f"[{self.symbol}] TP 33% error: {e}")
+                    logging.error(f"[{self.tag}] TP 33% error: {e}")
                     print(f"\t[{self.symbol}] TP 33% error: {e}")
                     return False
         return True
     
     async def place_take_profit_66(self):
         """Place 66% take profit order"""
+        tp_price = self.round_price(self.fill_price * Config.TP_66_MULTIPLIER)
+        if self.reactivate_order(self.take_profit_66, lmtPrice=tp_price):
+            logging.info(f"[{self.tag}] Take profit 66% reactivated @ {tp_price}")
+            print(f"\t[{self.symbol}] TP 66% set @ {tp_price}")
+            return True
         if not self.is_order_live(self.take_profit_66):
             if self.live_position > self.position_size * 0.63:
                 try:
-                    tp_price = self.round_price(self.fill_price * Config.TP_66_MULTIPLIER)
                     first_third = max(1, self.position_size // 3)
                     tp_size = max(1, (self.position_size - first_third) // 2)
                     
@@ -526,29 +5114,32 @@ class StockTrader:
                         outsideRth=True
                     )
                     
-                    self.take_profit_66 = self.ib.placeOrder(self.contract, take_profit_66)
+                    self.take_profit_66 = self.place_order(take_profit_66)
                     
-                    while self.take_profit_66.orderStatus.status not in ('PreSubmitted', 'Submitted', 'Filled'):
-                        await asyncio.sleep(0.11)
+                    await self.wait_for_order_ack(self.take_profit_66)
                     
                     logging.info(
-                        f"[{self.symbol}] Take profit 66% placed: "
+                        f"[{self.tag}] Take profit 66% placed: "
                         f"{tp_size} @ {tp_price}"
                     )
                     print(f"\t[{self.symbol}] TP 66% set: {tp_size} @ {tp_price}")
                     return True
                 except Exception as e:
-                    logging.error(f"[{self.symbol}] TP 66% error: {e}")
+                    logging.error(f"[{self.tag}] TP 66% error: {e}")
                     print(f"\t[{self.symbol}] TP 66% error: {e}")
                     return False
         return True
     
     async def place_take_profit_99(self):
         """Place 99% take profit order"""
+        tp_price = self.round_price(self.fill_price * Config.TP_99_MULTIPLIER)
+        if self.reactivate_order(self.take_profit_99, lmtPrice=tp_price):
+            logging.info(f"[{self.tag}] Take profit 99% reactivated @ {tp_price}")
+            print(f"\t[{self.symbol}] TP 99% set @ {tp_price}")
+            return True
         if not self.is_order_live(self.take_profit_99):
             if self.live_position > self.position_size * 0.30:
                 try:
-                    tp_price = self.round_price(self.fill_price * Config.TP_99_MULTIPLIER)
                     first_third = max(1, self.position_size // 3)
                     second_third = max(1, (self.position_size - first_third) // 2)
                     tp_size = self.position_size - first_third - second_third
@@ -561,19 +5152,18 @@ class StockTrader:
                         outsideRth=True
                     )
                     
-                    self.take_profit_99 = self.ib.placeOrder(self.contract, take_profit_99)
+                    self.take_profit_99 = self.place_order(take_profit_99)
                     
-                    while self.take_profit_99.orderStatus.status not in ('PreSubmitted', 'Submitted', 'Filled'):
-                        await asyncio.sleep(0.11)
+                    await self.wait_for_order_ack(self.take_profit_99)
                     
                     logging.info(
-                        f"[{self.symbol}] Take profit 99% placed: "
+                        f"[{self.tag}] Take profit 99% placed: "
                         f"{tp_size} @ {tp_price}"
                     )
                     print(f"\t[{self.symbol}] TP 99% set: {tp_size} @ {tp_price}")
                     return True
                 except Exception as e:
-                    logging.error(f"[{self.symbol}] TP 99% error: {e}")
+                    logging.error(f"[{self.tag}] TP 99% error: {e}")
                     print(f"\t[{self.symbol}] TP 99% error: {e}")
                     return False
         return True
@@ -581,8 +5171,8 @@ class StockTrader:
     async def place_reentry_order(self):
         """Place reentry order after stop-out"""
         if not self.is_order_live(self.reentry_order):
-            if datetime.now() - self.start_time > self.timeout_duration:
-                logging.info(f"[{self.symbol}] Reentry timeout elapsed")
+            if clock.now() - self.start_time > self.timeout_duration:
+                logging.info(f"[{self.tag}] Reentry timeout elapsed")
                 print(f"\t[{self.symbol}] Reentry timeout - trade complete")
                 await self.set_state(TradeState.TRADE_COMPLETE)
                 return False
@@ -600,19 +5190,18 @@ class StockTrader:
                     outsideRth=True
                 )
                 
-                self.reentry_order = self.ib.placeOrder(self.contract, reentry_order)
+                self.reentry_order = self.place_order(reentry_order)
                 
-                while self.reentry_order.orderStatus.status not in ('PreSubmitted', 'Submitted', 'Filled'):
-                    await asyncio.sleep(0.11)
+                await self.wait_for_order_ack(self.reentry_order)
                 
                 logging.info(
-                    f"[{self.symbol}] Reentry order placed: "
+                    f"[{self.tag}] Reentry order placed: "
                     f"{self.position_size} @ {stop_price}"
                 )
                 print(f"\t[{self.symbol}] REENTRY order set: {self.position_size} @ {stop_price}")
                 return True
             except Exception as e:
-                logging.error(f"[{self.symbol}] Reentry order error: {e}")
+                logging.error(f"[{self.tag}] Reentry order error: {e}")
                 print(f"\t[{self.symbol}] Reentry order error: {e}")
                 return False
         return True
@@ -623,21 +5212,22 @@ class StockTrader:
             try:
                 self.ib.cancelOrder(order.order)
                 timeout = 5
-                start = time.time()
+                start = clock.time()
                 
-                while self.is_order_live(order) and (time.time() - start) < timeout:
-                    await asyncio.sleep(0.1)
+                while self.is_order_live(order) and (clock.time() - start) < timeout:
+                    await clock.sleep(0.1)
                 
                 if not self.is_order_live(order):
-                    logging.info(f"[{self.symbol}] Order cancelled successfully")
+                    amend_stats.record_ack(clock.time() - start)
+                    logging.info(f"[{self.tag}] Order cancelled successfully")
                     print(f"\t[{self.symbol}] Order cancelled")
                     return True
                 else:
-                    logging.warning(f"[{self.symbol}] Order cancellation timeout")
+                    logging.warning(f"[{self.tag}] Order cancellation timeout")
                     print(f"\t[{self.symbol}] Order cancellation timeout")
                     return False
             except Exception as e:
-                logging.error(f"[{self.symbol}] Cancel order error: {e}")
+                logging.error(f"[{self.tag}] Cancel order error: {e}")
                 print(f"\t[{self.symbol}] Cancel order error: {e}")
                 return False
         return True
@@ -660,42 +5250,82 @@ class StockTrader:
                     totalQuantity=self.live_position
                 )
                 
-                trade = self.ib.placeOrder(self.contract, market_order)
+                trade = self.place_order(market_order)
                 
-                logging.info(f"[{self.symbol}] Emergency close order placed")
+                logging.info(f"[{self.tag}] Emergency close order placed")
                 print(f"\t[{self.symbol}] EMERGENCY CLOSE - Market sell {self.live_position}")
                 
                 await self.set_state(TradeState.TRADE_COMPLETE)
             except Exception as e:
-                logging.error(f"[{self.symbol}] Emergency close error: {e}")
+                logging.error(f"[{self.tag}] Emergency close error: {e}")
                 print(f"\t[{self.symbol}] Emergency close error: {e}")
     
-    async def set_state(self, new_state: str):
+    async def abort(self):
+        """Stop the trader: flatten any position, otherwise cancel its pending orders"""
+        if self.live_position > 0:
+            await self.emergency_close_position()
+            return
+        for order in self.get_live_orders():
+            await self.cancel_order(order)
+        await self.set_state(TradeState.TRADE_COMPLETE)
+    
+    def _record_transition(self, new_state: TradeState) -> bool:
+        """Validate a state change against STATE_TRANSITIONS and record it"""
+        old_state = self.state
+        if not (STATE_TRANSITIONS[old_state] >> new_state) & 1:
+            return False
+        if old_state:
+            self._history[self._history_count % len(self._history)] = old_state
+            self._history_count += 1
+        self.state = new_state
+        self.state_counts[new_state] += 1
+        return True
+    
+    async def set_state(self, new_state: TradeState):
         """Change trading state"""
-        if self.state != new_state:
-            if self.state:
-                self.previous_states.append(self.state)
-            old_state = self.state
-            self.state = new_state
-            
-            logging.info(f"[{self.symbol}] State change: {old_state} -> {new_state}")
-            print(f"\n\t[{self.symbol}] STATE: {new_state}")
-            
-            if self.state_future and not self.state_future.done():
-                self.state_future.set_result(True)
+        if self.state == new_state:
+            return
+        old_state = self.state
+        if not self._record_transition(new_state):
+            logging.error(f"[{self.tag}] Illegal state change: {old_state.name} -> {new_state.name}")
+            print(f"\t[{self.symbol}] Illegal state change: {old_state} -> {new_state}")
+            return
+        session_recorder.record_state(self.symbol, old_state, new_state)
+        blotter.record_transition(self.trade_id, self.symbol, self.account, old_state, new_state)
+        
+        logging.info(f"[{self.tag}] State change: {old_state.name} -> {new_state.name}")
+        print(f"\n\t[{self.symbol}] STATE: {new_state}")
+        
+        if self.state_future and not self.state_future.done():
+            self.state_future.set_result(True)
+    
+    @property
+    def previous_states(self) -> List[TradeState]:
+        """Most recent previous states, oldest first (bounded by STATE_HISTORY_SIZE)"""
+        size = len(self._history)
+        count = min(self._history_count, size)
+        return [TradeState(self._history[i % size])
+                for i in range(self._history_count - count, self._history_count)]
+    
+    @property
+    def previous_state(self) -> TradeState:
+        """State before the current one"""
+        if not self._history_count:
+            return TradeState.NEW
+        return TradeState(self._history[(self._history_count - 1) % len(self._history)])
+    
+    async def wait_for_update(self, timeout: float = 1.0):
+        """Wait for a state change or the next poll, and while the connection is recovering"""
+        self.state_future = asyncio.Future()
+        try:
+            await clock.wait_for(self.state_future, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        await connection_supervisor.wait_ready()
     
     def came_from_higher_state(self) -> bool:
         """Check if previous state was a higher profit state"""
-        if not self.previous_states:
-            return False
-        last_state = self.previous_states[-1]
-        higher_states = [
-            TradeState.IN_TRADE_PNL_O5,
-            TradeState.IN_TRADE_PNL_O33,
-            TradeState.IN_TRADE_PNL_O66,
-            TradeState.IN_TRADE_PNL_O99
-        ]
-        return last_state in higher_states
+        return bool((HIGHER_STATES_MASK >> self.previous_state) & 1)
     
     # ==================== STATE HANDLERS ====================
     
@@ -704,17 +5334,15 @@ class StockTrader:
         print(f"\t[{self.symbol}] Managing position - PnL: {self.unrealized_pnl_pct:.2f}%")
         
         if self.came_from_higher_state():
-            await self.cancel_take_profits()
-            await self.place_stop_loss()
+            await self.park_take_profits()
+            if not await self.reactivate_stop_loss():
+                await self.cancel_stop_loss()
+                await self.place_stop_loss()
         else:
             await self.place_stop_loss()
         
         while self.state == TradeState.IN_TRADE_PNL_U5:
-            self.state_future = asyncio.Future()
-            try:
-                await asyncio.wait_for(self.state_future, timeout=1.0)
-            except asyncio.TimeoutError:
-                pass
+            await self.wait_for_update()
             
             # Check if stop loss filled
             if self.stop_loss_order and self.stop_loss_order.orderStatus.status == 'Filled':
@@ -728,7 +5356,7 @@ class StockTrader:
                     self.exit_fill_price = self.round_price(avg_exit_price)
                     
                     logging.info(
-                        f"[{self.symbol}] Stop Loss filled: "
+                        f"[{self.tag}] Stop Loss filled: "
                         f"{self.total_exit_filled} @ {self.exit_fill_price}"
                     )
                     print(
@@ -745,7 +5373,7 @@ class StockTrader:
             
             # Check for manual cancellation
             if self.is_order_cancelled(self.stop_loss_order):
-                logging.info(f"[{self.symbol}] Stop loss manually cancelled - trade complete")
+                logging.info(f"[{self.tag}] Stop loss manually cancelled - trade complete")
                 print(f"\t[{self.symbol}] Stop loss manually cancelled - ending trade")
                 await self.set_state(TradeState.TRADE_COMPLETE)
                 break
@@ -759,6 +5387,8 @@ class StockTrader:
         """Handle state: Stopped out"""
         print(f"\t[{self.symbol}] TOTAL EXIT FILLED: {self.total_exit_filled} @ {self.exit_fill_price}")
         
+        await self.cancel_parked_orders()
+        
         if self.total_exit_filled < self.position_size:
             print(
                 f"\tTotal exit filled: {self.total_exit_filled} "
@@ -772,7 +5402,7 @@ class StockTrader:
                     f"\t[{self.symbol}] Maximum reentries ({self.max_reentries}) "
                     f"reached - trade complete"
                 )
-                logging.info(f"[{self.symbol}] Maximum reentries reached, ending trade")
+                logging.info(f"[{self.tag}] Maximum reentries reached, ending trade")
                 await self.set_state(TradeState.TRADE_COMPLETE)
                 return
             
@@ -781,7 +5411,7 @@ class StockTrader:
                 f"(attempt {self.reentry_count + 1}/{self.max_reentries})"
             )
             logging.info(
-                f"[{self.symbol}] Position stopped out - "
+                f"[{self.tag}] Position stopped out - "
                 f"reentry attempt {self.reentry_count + 1}"
             )
             
@@ -798,15 +5428,17 @@ class StockTrader:
         )
         
         while self.state == TradeState.WAITING_REENTRY:
+            await connection_supervisor.wait_ready()
+            
             # Check timeout
-            if datetime.now() - self.start_time > self.timeout_duration:
+            if clock.now() - self.start_time > self.timeout_duration:
                 await self.cancel_order(self.reentry_order)
                 await self.set_state(TradeState.TRADE_COMPLETE)
                 break
             
             # Check manual cancellation
             if self.is_order_cancelled(self.reentry_order):
-                logging.info(f"[{self.symbol}] Reentry order manually cancelled - trade complete")
+                logging.info(f"[{self.tag}] Reentry order manually cancelled - trade complete")
                 print(f"\t[{self.symbol}] Reentry order manually cancelled - ending trade")
                 await self.set_state(TradeState.TRADE_COMPLETE)
                 break
@@ -831,7 +5463,7 @@ class StockTrader:
                         self.fill_price = self.round_price(avg_price)
                         
                         logging.info(
-                            f"[{self.symbol}] Reentry #{self.reentry_count} filled: "
+                            f"[{self.tag}] Reentry #{self.reentry_count} filled: "
                             f"{total_filled} @ {self.fill_price}"
                         )
                         print(
@@ -843,23 +5475,19 @@ class StockTrader:
                         await self.set_state(TradeState.IN_TRADE_PNL_U5)
                         break
             
-            await asyncio.sleep(0.22)
+            await clock.sleep(0.22)
     
     async def handle_in_trade_pnl_o5(self):
         """Handle state: PnL over 5%"""
         print(f"\t[{self.symbol}] Above 5% profit - setting take profits")
         
-        await self.cancel_order(self.stop_loss_order)
+        await self.park_stop_loss()
         await self.place_take_profit_33()
         await self.place_take_profit_66()
         await self.place_take_profit_99()
         
         while self.state == TradeState.IN_TRADE_PNL_O5:
-            self.state_future = asyncio.Future()
-            try:
-                await asyncio.wait_for(self.state_future, timeout=1.0)
-            except asyncio.TimeoutError:
-                pass
+            await self.wait_for_update()
             
             # Check TP33 fill
             if (not self.tp33_filled_handled and 
@@ -870,6 +5498,8 @@ class StockTrader:
                     filled_shares = sum(fill.execution.shares for fill in fills[0].fills)
                     self.live_position -= filled_shares
                     self.tp33_filled_handled = True
+                    self.log_take_profit_fill(33, fills[0].fills)
+                    self.sync_parked_stop_quantity()
             
             if self.unrealized_pnl_pct > Config.PNL_THRESHOLD_33:
                 await self.set_state(TradeState.IN_TRADE_PNL_O33)
@@ -882,6 +5512,12 @@ class StockTrader:
                 await self.set_state(TradeState.IN_TRADE_PNL_U5)
                 break
     
+    def log_take_profit_fill(self, level: int, fills):
+        """Log a take profit fill (read back by --analyze-log)"""
+        shares = sum(fill.execution.shares for fill in fills)
+        price = sum(fill.execution.price * fill.execution.shares for fill in fills) / shares
+        logging.info(f"[{self.tag}] Take profit {level}% filled: {shares} @ {self.round_price(price)}")
+    
     async def handle_in_trade_pnl_o33(self):
         """Handle state: PnL over 33%"""
         print(
@@ -890,11 +5526,7 @@ class StockTrader:
         )
         
         while self.state == TradeState.IN_TRADE_PNL_O33:
-            self.state_future = asyncio.Future()
-            try:
-                await asyncio.wait_for(self.state_future, timeout=1.0)
-            except asyncio.TimeoutError:
-                pass
+            await self.wait_for_update()
             
             # Check TP66 fill
             if (not self.tp66_filled_handled and 
@@ -905,6 +5537,8 @@ class StockTrader:
                     filled_shares = sum(fill.execution.shares for fill in fills[0].fills)
                     self.live_position -= filled_shares
                     self.tp66_filled_handled = True
+                    self.log_take_profit_fill(66, fills[0].fills)
+                    self.sync_parked_stop_quantity()
             
             if not await self.check_position_integrity():
                 break
@@ -925,11 +5559,7 @@ class StockTrader:
         )
         
         while self.state == TradeState.IN_TRADE_PNL_O66:
-            self.state_future = asyncio.Future()
-            try:
-                await asyncio.wait_for(self.state_future, timeout=1.0)
-            except asyncio.TimeoutError:
-                pass
+            await self.wait_for_update()
             
             # Check TP99 fill
             if (not self.tp99_filled_handled and 
@@ -940,6 +5570,8 @@ class StockTrader:
                     filled_shares = sum(fill.execution.shares for fill in fills[0].fills)
                     self.live_position -= filled_shares
                     self.tp99_filled_handled = True
+                    self.log_take_profit_fill(99, fills[0].fills)
+                    self.sync_parked_stop_quantity()
             
             if not await self.check_position_integrity():
                 break
@@ -955,81 +5587,1727 @@ class StockTrader:
     async def handle_in_trade_pnl_o99(self):
         """Handle state: PnL over 99%"""
         print(f"\t[{self.symbol}] 99% take profit hit - trade complete!")
-        logging.info(f"[{self.symbol}] Trade completed successfully")
+        logging.info(f"[{self.tag}] Trade completed successfully")
         await self.set_state(TradeState.TRADE_COMPLETE)
     
-    async def handle_trade_complete(self):
-        """Handle state: Trade complete"""
-        print(f"\t[{self.symbol}] Trade complete - cleaning up")
-        logging.info(f"[{self.symbol}] Trade completed - final position: {self.live_position}")
+    async def handle_trade_complete(self):
+        """Handle state: Trade complete"""
+        print(f"\t[{self.symbol}] Trade complete - cleaning up")
+        logging.info(f"[{self.tag}] Trade completed - final position: {self.live_position}")
+        
+        # Cancel all orders
+        orders = [
+            self.initial_order, self.stop_loss_order, self.reentry_order,
+            self.take_profit_33, self.take_profit_66, self.take_profit_99
+        ]
+        for order in orders:
+            await self.cancel_order(order)
+        
+        if amend_stats.amendments:
+            logging.info(f"[{self.tag}] Order amendments (session): {amend_stats.summary()}")
+        
+        self.release_pnl_monitoring()
+        
+        # Unregister from global manager
+        order_manager.unregister_trader(self)
+        
+        # Release the signal (and its lease, once its last trader is done)
+        if self.signal_id is not None:
+            signal_index.release(self.signal_id)
+            logging.info(f"[{self.tag}] Released signal {self.signal_id}")
+            print(f"\t[{self.symbol}] Signal cleared from tracking")
+            self.signal_id = None
+        
+        print(f"\t[{self.symbol}] Trader shutdown complete")
+    
+    # Indexed by TradeState
+    STATE_HANDLERS = (
+        None,                       # NEW
+        handle_in_trade_pnl_u5,
+        handle_stopped_out,
+        handle_waiting_reentry,
+        handle_in_trade_pnl_o5,
+        handle_in_trade_pnl_o33,
+        handle_in_trade_pnl_o66,
+        handle_in_trade_pnl_o99,
+        handle_trade_complete,
+    )
+    
+    async def run_state_machine(self):
+        """Run the trading state machine"""
+        while self.state != TradeState.TRADE_COMPLETE:
+            handler = self.STATE_HANDLERS[self.state]
+            if handler is not None:
+                try:
+                    await profiler.timed(handler(self), self.symbol, self.state)
+                except Exception as e:
+                    logging.error(f"[{self.tag}] State handler error in {self.state}: {e}")
+                    print(f"\t[{self.symbol}] Error in {self.state}: {e}")
+                    await self.set_state(TradeState.TRADE_COMPLETE)
+            else:
+                logging.error(f"[{self.tag}] Unknown state: {self.state}")
+                print(f"\t[{self.symbol}] Unknown state: {self.state}")
+                await self.set_state(TradeState.TRADE_COMPLETE)
+        
+        # The loop exits as soon as TRADE_COMPLETE is set, so clean up here
+        try:
+            await self.handle_trade_complete()
+        except Exception as e:
+            logging.error(f"[{self.tag}] Trade complete cleanup error: {e}")
+            print(f"\t[{self.symbol}] Cleanup error: {e}")
+        
+        logging.info(f"[{self.tag}] State machine completed")
+    
+    async def run(self, lifetime: float = None, prepared: bool = False):
+        """Start the trader; abort it if it is still running after `lifetime` seconds"""
+        if lifetime is None:
+            await self.start(prepared)
+            return
+        task = asyncio.ensure_future(self.start(prepared))
+        try:
+            await clock.wait_for(asyncio.shield(task), timeout=lifetime)
+        except asyncio.TimeoutError:
+            await self.abort()
+            await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+    
+    async def start(self, prepared: bool = False):
+        """Start the trader (prepared: contract qualified and entry possibly sent by an AllocatedTrader)"""
+        try:
+            if not prepared:
+                await self.prepare()
+                shadow_book.track(self)
+            await profiler.timed(self.submit_initial_buy(), self.symbol, self.state)
+            await self.run_state_machine()
+        except Exception as e:
+            logging.error(f"[{self.tag}] Start error: {e}")
+            print(f"\t[{self.symbol}] Start error: {e}")
+        finally:
+            self.release_pnl_monitoring()
+            order_manager.unregister_trader(self)
+            blotter.record_round_trip(self)
+            if self.signal_id is not None:
+                signal_index.release(self.signal_id)
+                logging.info(f"[{self.tag}] Emergency cleanup: Released signal {self.signal_id}")
+                print(f"\t[{self.symbol}] Emergency cleanup: Signal cleared from tracking")
+                self.signal_id = None
+
+
+class AllocatedTrader:
+    """
+    One logical trader fanned out across Config.ACCOUNTS
+    
+    The signal's position is scaled per account (by its ACCOUNTS ratio, or
+    by its NetLiquidation relative to the accounts' mean) and each account
+    gets its own StockTrader - its own PnL subscription, position check and
+    exit ladder. The contract and market rules are resolved once, then
+    every entry order is sent back to back without yielding to the event
+    loop; the spread between the first and last submission is the skew.
+    """
+    
+    def __init__(self, ib: IB, symbol: str, entry_price: float, capital: float, price_precision: int,
+                 position: int, stop_loss_pct: float = None):
+        self.ib = ib
+        self.symbol = symbol
+        self.entry_price = entry_price
+        self.capital = capital
+        self.price_precision = price_precision
+        self.position = position
+        self.stop_loss_pct = stop_loss_pct
+        self.signal_id = None   # released once, by the logical trader
+        self.children: Dict[str, StockTrader] = {}
+        self.submit_skew_us = None
+    
+    @property
+    def live_position(self) -> int:
+        """Shares held across all accounts"""
+        return sum(child.live_position for child in self.children.values())
+    
+    @property
+    def unrealized_pnl(self) -> float:
+        """Unrealized PnL across all accounts"""
+        return sum(child.unrealized_pnl for child in self.children.values())
+    
+    def positions(self) -> Dict[str, tuple]:
+        """Per-account (state, live position, unrealized PnL)"""
+        return {
+            account: (child.state, child.live_position, child.unrealized_pnl)
+            for account, child in self.children.items()
+        }
+    
+    async def account_weights(self) -> Dict[str, float]:
+        """Allocation weight per account for the configured ALLOCATION_MODE"""
+        if Config.ALLOCATION_MODE != 'capital':
+            return dict(Config.ACCOUNTS)
+        capital = {account: account_state.net_liquidation(account) for account in Config.ACCOUNTS}
+        if None in capital.values():
+            summary = await self.ib.accountSummaryAsync()
+            capital = {
+                value.account: float(value.value) for value in summary
+                if value.tag == 'NetLiquidation' and value.account in Config.ACCOUNTS
+            }
+        if not capital:
+            raise ValueError("no NetLiquidation for the configured accounts")
+        mean = sum(capital.values()) / len(capital)
+        return {account: value / mean for account, value in capital.items()}
+    
+    async def allocate(self):
+        """Create one StockTrader per account and resolve the shared contract"""
+        allocation = allocate_position(self.position, await self.account_weights())
+        for account, shares in allocation.items():
+            child = StockTrader(self.ib, self.symbol, self.entry_price, self.capital,
+                                self.price_precision, shares, self.stop_loss_pct, account)
+            self.children[account] = child
+        
+        first = next(iter(self.children.values()))
+        await first.prepare()
+        for child in self.children.values():
+            child.contract = first.contract
+        shadow_book.track(first, self.position)
+        
+        logging.info(f"[{self.symbol}] Allocated {self.position} base shares: {allocation}")
+        print(f"\t[{self.symbol}] Allocation: " + ", ".join(f"{a} {n}" for a, n in allocation.items()))
+    
+    def place_entries(self):
+        """Send every account's entry order without yielding; records the submission skew"""
+        stamps = []
+        for child in self.children.values():
+            try:
+                child.place_initial_buy()
+            except Exception as e:
+                logging.error(f"[{self.symbol}] Entry for {child.account} failed: {e}")
+                print(f"\t[{self.symbol}] Entry for {child.account} failed: {e}")
+            stamps.append(time.perf_counter_ns())
+        self.submit_skew_us = round((stamps[-1] - stamps[0]) / 1000, 1)
+        logging.info(
+            f"[{self.symbol}] {len(stamps)} account entries sent, skew {self.submit_skew_us} us"
+        )
+        print(f"\t[{self.symbol}] {len(stamps)} account entries sent (skew {self.submit_skew_us} us)")
+    
+    async def abort(self):
+        """Abort every account's trader"""
+        await asyncio.gather(*(child.abort() for child in self.children.values()))
+    
+    async def run(self, lifetime: float = None):
+        """Allocate, enter all accounts at once, then run the per-account traders"""
+        try:
+            await self.allocate()
+            self.place_entries()
+            await asyncio.gather(*(
+                child.run(lifetime, prepared=True) for child in self.children.values()
+            ))
+            for account, (state, position, pnl) in self.positions().items():
+                logging.info(f"[{self.symbol}] {account}: {state}, position {position}, PnL {pnl:.2f}")
+        except Exception as e:
+            logging.error(f"[{self.symbol}] Allocation error: {e}")
+            print(f"\t[{self.symbol}] Allocation error: {e}")
+        finally:
+            for child in self.children.values():
+                order_manager.unregister_trader(child)
+            if self.signal_id is not None:
+                signal_index.release(self.signal_id)
+                self.signal_id = None
+                print(f"\t[{self.symbol}] Signal cleared from tracking")
+
+
+# Strong references to running trader tasks (the event loop only keeps weak ones)
+trader_tasks = set()
+
+
+def spawn_trader(ib: IB, symbol: str, entry_price: float, capital: float, price_precision: int,
+                 position: int, on_done=None, lifetime: float = None,
+                 stop_loss_pct: float = None, signal_id: int = None):
+    """Create a StockTrader (an AllocatedTrader with several ACCOUNTS) and run it as a task"""
+    if len(Config.ACCOUNTS) > 1:
+        trader = AllocatedTrader(ib, symbol, entry_price, capital, price_precision, position, stop_loss_pct)
+    else:
+        trader = StockTrader(ib, symbol, entry_price, capital, price_precision, position, stop_loss_pct)
+    trader.signal_id = signal_id
+    task = asyncio.ensure_future(trader.run(lifetime))
+    trader_tasks.add(task)
+    task.add_done_callback(trader_tasks.discard)
+    if on_done is not None:
+        task.add_done_callback(lambda _: on_done(trader))
+    logging.info(f"Spawned coroutine for {symbol} at {entry_price}")
+    return trader
+
+
+def benchmark_traders(count: int = 10000, rounds: int = 10) -> dict:
+    """Measure memory per trader and state transition cost"""
+    traders = []
+    logging.disable(logging.INFO)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            gc.collect()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            traders.extend(StockTrader(None, f"BENCH{i}", 10.0, 100000.0, 2, 10) for i in range(count))
+            footprint = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+            
+            for trader in traders:
+                trader._record_transition(TradeState.IN_TRADE_PNL_U5)
+            targets = (TradeState.IN_TRADE_PNL_O5, TradeState.IN_TRADE_PNL_U5)
+            start = time.perf_counter()
+            for i in range(rounds):
+                target = targets[i % 2]
+                for trader in traders:
+                    trader._record_transition(target)
+            elapsed = time.perf_counter() - start
+    finally:
+        logging.disable(logging.NOTSET)
+        for trader in traders:
+            order_manager.unregister_trader(trader)
+    
+    return {
+        'traders': count,
+        'bytes_per_trader': round(footprint / count),
+        'transitions': count * rounds,
+        'ns_per_transition': round(elapsed / (count * rounds) * 1e9),
+        'history_len': len(traders[0].previous_states),
+    }
+
+
+def benchmark_stress(count: int = 1000, rounds: int = 200, seed: int = 5) -> dict:
+    """Stress-test latency for a synthetic book"""
+    rng = random.Random(seed)
+    
+    def live(order):
+        return Trade(Stock('X', 'SMART', 'USD'), order, OrderStatus(status='Submitted'), [], [])
+    
+    traders = []
+    logging.disable(logging.INFO)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        traders.extend(StockTrader(None, f"STRESS{i}", 10.0, 100000.0, 2, 99) for i in range(count))
+    logging.disable(logging.NOTSET)
+    for i, trader in enumerate(traders):
+        trader.fill_price = round(rng.uniform(2, 50), 2)
+        if i % 5 == 4:
+            # Stopped out, waiting to buy back in
+            trader.reentry_order = live(StopLimitOrder('BUY', 99, trader.fill_price * 1.04, trader.fill_price))
+        else:
+            trader.live_position = 99
+            trader.unrealized_pnl_pct = rng.uniform(-2, 40)
+            trader.stop_loss_order = live(StopLimitOrder(
+                'SELL', 99, trader.fill_price * (Config.STOP_LOSS_PCT - Config.STOP_LIMIT_GAP_PCT),
+                trader.fill_price * Config.STOP_LOSS_PCT
+            ))
+            trader.take_profit_33 = live(LimitOrder('SELL', 33, trader.fill_price * Config.TP_33_MULTIPLIER))
+            trader.take_profit_66 = live(LimitOrder('SELL', 33, trader.fill_price * Config.TP_66_MULTIPLIER))
+    
+    calculator = StressCalculator()
+    collect_ns, evaluate_ns = [], []
+    for _ in range(rounds):
+        calculator.refresh(traders)
+        collect_ns.append(calculator.result['collect_us'])
+        evaluate_ns.append(calculator.result['evaluate_us'])
+    result = calculator.result
+    for trader in traders:
+        order_manager.unregister_trader(trader)
+    
+    collect_ns.sort()
+    evaluate_ns.sort()
+    return {
+        'positions': count,
+        'shocks': result['shocks'],
+        'pnl_change': result['pnl_change'],
+        'gapped_through_stop_shares': result['gapped_through_stop_shares'],
+        'median_collect_us': collect_ns[rounds // 2],
+        'median_evaluate_us': evaluate_ns[rounds // 2],
+        'p99_evaluate_us': evaluate_ns[int(rounds * 0.99)],
+    }
+
+
+def benchmark_watchdog(steps: int = 50000, block: float = 0.2) -> dict:
+    """Per-callback cost of the heartbeat and of attribution, slow-callback attribution and the lag pause"""
+    
+    class Blocked:
+        symbol = 'WDOG'
+        state = TradeState.IN_TRADE_PNL_U5
+        
+        async def manage_orders(self):
+            await asyncio.sleep(0)
+            time.sleep(block)   # a synchronous call stalling the loop
+            await asyncio.sleep(0)
+    
+    async def spin():
+        for _ in range(steps):
+            await asyncio.sleep(0)
+    
+    async def timed_spin() -> float:
+        start = time.perf_counter()
+        await spin()
+        return (time.perf_counter() - start) / steps * 1e9
+    
+    async def session(watchdog: LoopWatchdog) -> dict:
+        plain_ns = await timed_spin()
+        Config.WATCHDOG_ATTRIBUTE = False
+        watchdog.start()
+        heartbeat_ns = await timed_spin()
+        watchdog.stop()
+        Config.WATCHDOG_ATTRIBUTE = True
+        watchdog.start()
+        attributing_ns = await timed_spin()
+        
+        await asyncio.create_task(Blocked().manage_orders())
+        await asyncio.sleep(Config.WATCHDOG_INTERVAL * 3)
+        paused = watchdog.paused
+        await asyncio.sleep(Config.LAG_RESUME_SECONDS + Config.WATCHDOG_INTERVAL * 4)
+        resumed = not watchdog.paused
+        watchdog.stop()
+        return {'plain_ns': plain_ns, 'heartbeat_ns': heartbeat_ns, 'attributing_ns': attributing_ns,
+                'paused': paused, 'resumed': resumed}
+    
+    saved = (Config.LAG_SAFETY_LIMIT, Config.LAG_SAFETY_ACTION, Config.LAG_RESUME_SECONDS, Config.WATCHDOG_ATTRIBUTE)
+    Config.LAG_SAFETY_LIMIT, Config.LAG_SAFETY_ACTION, Config.LAG_RESUME_SECONDS = block / 2, 'pause', 0.3
+    watchdog = LoopWatchdog()
+    logging.disable(logging.INFO)   # asyncio's slow callback reports are warnings
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            run = asyncio.run(session(watchdog))
+    finally:
+        logging.disable(logging.NOTSET)
+        (Config.LAG_SAFETY_LIMIT, Config.LAG_SAFETY_ACTION, Config.LAG_RESUME_SECONDS,
+         Config.WATCHDOG_ATTRIBUTE) = saved
+    
+    stats = watchdog.stats()
+    return {
+        'plain_ns_per_step': round(run['plain_ns']),
+        'heartbeat_ns_per_step': round(run['heartbeat_ns']),
+        'attributing_ns_per_step': round(run['attributing_ns']),
+        'lag': stats['lag'],
+        'slowest': stats['slowest'][0] if stats['slowest'] else {},
+        'paused_on_lag': run['paused'],
+        'resumed': run['resumed'],
+    }
+
+
+def _shadow_reference(passes: List[tuple], entry: float, qty: int, variant) -> float:
+    """One variant of one signal, one pass at a time in plain Python (checks ShadowBook.step)"""
+    stop_pct, entry_limit_pct, tp_scale, max_reentries = variant
+    tps = [1 + (m - 1) * tp_scale for m in (Config.TP_33_MULTIPLIER, Config.TP_66_MULTIPLIER, Config.TP_99_MULTIPLIER)]
+    first = max(1, qty // 3)
+    second = max(1, (qty - first) // 2)
+    thirds = (first, second, qty - first - second)
+    phase, held, fill, cash, taken, stop_hit, reentered = SHADOW_ENTRY, 0, 0.0, 0.0, 0, False, 0
+    last = entry
+    for now, low, high, last in passes:
+        expired = now > Config.TIMEOUT_MINUTES * 60
+        pnl_pct = (last / fill - 1) * 100 if held > 0 else 0.0
+        if phase == SHADOW_ENTRY:
+            limit = entry * entry_limit_pct
+            if low <= limit:
+                phase, held, fill = SHADOW_UNDER_5, qty, min(limit, last)
+                cash -= qty * fill
+            elif expired:
+                phase = SHADOW_DONE
+        elif phase == SHADOW_UNDER_5:
+            stop_hit = stop_hit or low <= fill * stop_pct
+            stop_limit = fill * (stop_pct - Config.STOP_LIMIT_GAP_PCT)
+            if stop_hit and high >= stop_limit:
+                cash += held * min(max(last, stop_limit), fill * stop_pct)
+                phase = SHADOW_DONE if held < qty or reentered >= max_reentries else SHADOW_REENTRY
+                held, stop_hit = 0, False
+            elif not stop_hit and pnl_pct > Config.PNL_THRESHOLD_5:
+                phase = SHADOW_OVER_5
+        elif phase == SHADOW_OVER_5:
+            for level in range(3):
+                if not taken & (1 << level) and held > 0 and high >= fill * tps[level]:
+                    shares = min(thirds[level], held)
+                    cash += shares * fill * tps[level]
+                    held -= shares
+                    taken |= 1 << level
+            if held > 0 and low <= fill * Config.PARKED_STOP_PCT:
+                cash += held * last
+                held = 0
+            if held <= 0 or pnl_pct > Config.PNL_THRESHOLD_99:
+                phase = SHADOW_DONE
+            elif pnl_pct < Config.PNL_THRESHOLD_5:
+                phase = SHADOW_UNDER_5
+        elif phase == SHADOW_REENTRY:
+            if not expired and high >= fill and low <= fill * 1.04:
+                fill = min(max(last, fill), fill * 1.04)
+                phase, held, taken = SHADOW_UNDER_5, qty, 0
+                reentered += 1
+                cash -= qty * fill
+            elif expired:
+                phase = SHADOW_DONE
+    return cash + (held * last if held > 0 else 0.0)
+
+
+def _shadow_paths(signals: int, seconds: int, ticks_per_pass: int, seed: int) -> List[list]:
+    """Synthetic last prices for shadow signals, ticks_per_pass ticks per second"""
+    rng = random.Random(seed)
+    return [
+        [price for _, price in synthetic_price_path(
+            10.0, seconds, 1.0 / ticks_per_pass, volatility=0.002,
+            drift=rng.uniform(-0.00002, 0.00004), seed=seed * 1000 + i)]
+        for i in range(signals)
+    ]
+
+
+def _shadow_tickers(prices: list, slots) -> list:
+    return [Ticker(contract=Contract(conId=i + 1), last=prices[i], bid=prices[i] - 0.005,
+                   ask=prices[i] + 0.005) for i in slots]
+
+
+def shadow_replay(book: ShadowBook, paths: List[list], slots, seconds: int, ticks_per_pass: int) -> list:
+    """Feed paths[slots] to a ShadowBook with one pass per second; returns each pass's ns"""
+    for i in slots:
+        book.add(f"SHADOW{i}", Contract(conId=i + 1), 10.0, 90, paths[i][0])
+    book.start_time[:] = 0.0
+    pass_ns = []
+    for step in range(1, seconds + 1):
+        for tick in range((step - 1) * ticks_per_pass + 1, step * ticks_per_pass + 1):
+            book.on_pending_tickers(_shadow_tickers([path[tick] for path in paths], slots))
+        pass_ns.append(book.run_pass(float(step)))
+    return pass_ns
+
+
+def benchmark_shadow(signals: int = 50, seconds: int = 1800, ticks_per_pass: int = 4, seed: int = 3) -> dict:
+    """Shadow pass latency for a day of signals and its CPU share"""
+    paths = _shadow_paths(signals, seconds, ticks_per_pass, seed)
+    saved = Config.TIMEOUT_MINUTES
+    Config.TIMEOUT_MINUTES = 10
+    logging.disable(logging.INFO)
+    try:
+        book = ShadowBook()
+        pass_ns = shadow_replay(book, paths, range(signals), seconds, ticks_per_pass)
+        
+        # CPU share of the background runner on a real loop
+        async def busy_session() -> float:
+            runner = ShadowBook()
+            for i in range(signals):
+                runner.add(f"SHADOW{i}", Contract(conId=i + 1), 10.0, 90, paths[i][0])
+            runner.start_time[:] = time.time() + 3600   # nothing times out
+            task = asyncio.create_task(runner.run())
+            start = time.perf_counter()
+            step = 0
+            while time.perf_counter() - start < 2.0:
+                step = step % (len(paths[0]) - 1) + 1
+                runner.on_pending_tickers(_shadow_tickers([path[step] for path in paths], range(signals)))
+                await asyncio.sleep(0.001)
+            task.cancel()
+            return runner.pass_ns_total / 1e9 / (time.perf_counter() - start) * 100
+        
+        cpu_pct = asyncio.run(busy_session())
+    finally:
+        logging.disable(logging.NOTSET)
+        Config.TIMEOUT_MINUTES = saved
+    
+    rows = book.results()
+    rank, live = book.live_variant(rows)
+    pass_ns.sort()
+    return {
+        'signals': signals,
+        'variants': len(book.variants),
+        'rows_per_pass': signals * len(book.variants),
+        'median_pass_us': round(pass_ns[len(pass_ns) // 2] / 1000, 1),
+        'p99_pass_us': round(pass_ns[int(len(pass_ns) * 0.99)] / 1000, 1),
+        'signals_folded': book.signals_done,
+        'best': rows[0],
+        'live_rank': rank,
+        'live_pnl': live['pnl'] if live else None,
+        'cpu_pct': round(cpu_pct, 2),
+    }
+
+
+def _status_clients(port: int, client_count: int, slow_clients: int, stop, results):
+    """Status stream readers in their own process (slow ones read ~20 KB/s)"""
+    views = [dict() for _ in range(client_count)]
+    received = [0] * client_count
+    
+    async def client(index: int, slow: bool):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8192)
+        sock.connect(('127.0.0.1', port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=8192)
+        writer.write(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        view = views[index]
+        buffer = b''
+        try:
+            while not stop.is_set():
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                buffer += chunk
+                while b'\n\n' in buffer:
+                    event, buffer = buffer.split(b'\n\n', 1)
+                    if not event.startswith(b'event: '):
+                        event = event[event.index(b'event: '):]   # after the HTTP headers
+                    name, data = event.decode().split('\n')[:2]
+                    for key, fields in json.loads(data[len('data: '):]).items():
+                        if fields is None:
+                            view.pop(key, None)
+                        elif key in view and name == 'event: delta':
+                            view[key].update(fields)
+                        else:
+                            view[key] = fields
+                    received[index] += 1
+                if slow:
+                    await asyncio.sleep(0.2)
+        finally:
+            writer.close()
+    
+    async def run_clients():
+        tasks = [asyncio.ensure_future(client(i, i < slow_clients)) for i in range(client_count)]
+        while not stop.is_set():
+            await asyncio.sleep(0.05)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    asyncio.run(run_clients())
+    results.put((views, received))
+
+
+async def status_fanout_session(client_count: int, slow_clients: int, trader_count: int,
+                                seconds: float, seed: int) -> dict:
+    """Stream to many clients (some slow) while traders change, then compare their views"""
+    server = StatusServer(interval=0.05, send_buffer=16384)
+    await server.start(port=0)
+    rng = random.Random(seed)
+    traders = [StockTrader(None, f"STAT{i}", 10.0, 100000.0, 2, 10) for i in range(trader_count)]
+    context = multiprocessing.get_context('spawn')
+    stop, results = context.Event(), context.Queue()
+    readers = context.Process(
+        target=_status_clients, args=(server.port, client_count, slow_clients, stop, results), daemon=True
+    )
+    readers.start()
+    while len(server.clients) < client_count:
+        await asyncio.sleep(0.05)
+    
+    lag_max = 0.0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lag_max = max(lag_max, time.perf_counter() - t0 - 0.01)
+        for trader in rng.sample(traders, 20):
+            trader.unrealized_pnl_pct = rng.uniform(-5, 40)
+            trader.live_position = rng.choice((0, 10, 7, 4))
+        if rng.random() < 0.2:
+            retired = traders.pop(rng.randrange(len(traders)))
+            order_manager.unregister_trader(retired)
+            traders.append(StockTrader(None, f"STAT{rng.randrange(10000)}", 10.0, 100000.0, 2, 10))
+    
+    await asyncio.sleep(6)   # slow clients drain their backlog and last coalesced delta
+    stats = server.stats()
+    coalesced = sum(client.coalesced for client in server.clients)
+    stop.set()
+    views, received = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    readers.join(timeout=5)
+    in_sync = sum(view == server.view for view in views)
+    server.stop()
+    for trader in traders:
+        order_manager.unregister_trader(trader)
+    
+    return {
+        'clients': client_count,
+        'slow_clients': slow_clients,
+        'traders': trader_count,
+        'clients_in_sync': in_sync,
+        'fast_client_events': min(received[slow_clients:]),
+        'slow_client_events': max(received[:slow_clients]) if slow_clients else None,
+        'coalesced_merges': coalesced,
+        'mean_publish_us': stats['mean_publish_us'],
+        'max_publish_us': stats['max_publish_us'],
+        'max_loop_lag_ms': round(lag_max * 1000, 2),
+        'bytes_sent': stats['bytes_sent'],
+    }
+
+
+def benchmark_status(clients: int = 50, slow_clients: int = 10, traders: int = 200,
+                     seconds: float = 3.0, seed: int = 7) -> dict:
+    """Fan-out of the status stream to 50 clients, 10 of them slow readers"""
+    logging.disable(logging.INFO)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return asyncio.run(status_fanout_session(clients, slow_clients, traders, seconds, seed))
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def benchmark_bars(symbols: int = 100, bars: int = 3000, chunk: int = 12, lookups: int = 100000) -> dict:
+    """Measure incremental bar appends and signal-time ATR sizing"""
+    global bar_store
+    directory = os.path.join(Config.CACHE_DIR, f"bench_bars_{os.getpid()}")
+    store = BarStore(directory, Config.BAR_CAPACITY)
+    saved_store = bar_store
+    bar_store = store
+    rng = np.random.default_rng(7)
+    names = [f"BENCH{i}" for i in range(symbols)]
+    try:
+        append_ns = 0
+        appends = 0
+        for name in names:
+            close = 10.0 * np.exp(np.cumsum(rng.normal(0, 0.004, bars)))
+            rows = np.zeros(bars, dtype=BAR_DTYPE)
+            rows['time'] = 1700000000 + np.arange(bars) * Config.BAR_SECONDS
+            rows['open'] = np.roll(close, 1)
+            rows['high'] = close * (1 + rng.uniform(0, 0.006, bars))
+            rows['low'] = close * (1 - rng.uniform(0, 0.006, bars))
+            rows['close'] = close
+            rows['volume'] = rng.integers(1000, 50000, bars)
+            for start in range(0, bars, chunk):
+                t0 = time.perf_counter_ns()
+                store.append(name, rows[start:start + chunk])
+                append_ns += time.perf_counter_ns() - t0
+                appends += 1
+        stored = store.count(names[0])
+        store.stop()
+        
+        # Reopen from disk, as a restarted bot would
+        reopened = BarStore(directory, Config.BAR_CAPACITY)
+        reopened_count = reopened.count(names[0])
+        
+        t0 = time.perf_counter()
+        for i in range(lookups):
+            position, stop_loss_pct = compute_position_size(names[i % symbols], 10.0)
+        elapsed = time.perf_counter() - t0
+        sample = compute_position_size(names[0], 10.0)
+    finally:
+        bar_store = saved_store
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    
+    return {
+        'symbols': symbols,
+        'bars_per_symbol': stored,
+        'reopened_bars': reopened_count,
+        'file_kb_per_symbol': round((BarStore.HEADER.size + Config.BAR_CAPACITY * BAR_DTYPE.itemsize) / 1024),
+        'append_us': round(append_ns / appends / 1000, 1),
+        'sizing_us': round(elapsed / lookups * 1e6, 3),
+        'atr_lookup_us': store.stats()['mean_lookup_us'],
+        'sample_size_and_stop': sample,
+    }
+
+
+# ==================== SIMULATION ====================
+
+class SimulatedIB:
+    """
+    In-process stand-in for ib_insync.IB used for simulation and benchmarks
+    
+    Implements the subset of the IB API that StockTrader uses. Orders are
+    acknowledged after `ack_delay` seconds (on the event loop clock) and
+    matched against prices pushed with set_price(); PnLSingle updates are
+    emitted on every price change for subscribed contracts. Positions are
+    kept per account (order.account, defaulting to the first account).
+    
+    drop_connection() behaves like a gateway outage: the client side is
+    reset the way ib_insync resets its wrapper (new Trade objects, no
+    subscriptions, empty positions), orders keep matching on the "server"
+    without events reaching the client, and connectAsync() is refused
+    until the outage is over.
+    """
+    
+    def __init__(self, account: str = 'SIM', net_liquidation: float = 100000.0,
+                 ack_delay: float = 0.05, accounts: Dict[str, float] = None):
+        self.accounts = accounts or {account: net_liquidation}   # account -> NetLiquidation
+        self.account = next(iter(self.accounts))
+        self.net_liquidation = self.accounts[self.account]
+        self.ack_delay = ack_delay
+        self.connected = True
+        self._down_until = 0.0
+        
+        self.connectedEvent = Event('connectedEvent')
+        self.pnlSingleEvent = Event('pnlSingleEvent')
+        self.orderStatusEvent = Event('orderStatusEvent')
+        self.execDetailsEvent = Event('execDetailsEvent')
+        self.disconnectedEvent = Event('disconnectedEvent')
+        self.pendingTickersEvent = Event('pendingTickersEvent')
+        self.accountValueEvent = Event('accountValueEvent')
+        self.accountSummaryEvent = Event('accountSummaryEvent')
+        self.pnlEvent = Event('pnlEvent')
+        
+        self._next_con_id = 900000001
+        self._next_order_id = 1
+        self._next_exec_id = 1
+        self._con_ids: Dict[str, int] = {}
+        self._contracts: Dict[int, Contract] = {}
+        self._prices: Dict[int, float] = {}
+        self._trades: Dict[int, Trade] = {}   # orderId -> Trade (the client's registry)
+        self._triggered = set()
+        self._positions: Dict[tuple, list] = {}   # (account, conId) -> [position, avgCost]
+        self._pnl_subs: Dict[tuple, PnLSingle] = {}
+        self._tickers: Dict[int, Ticker] = {}
+        self._done_at: Dict[int, float] = {}   # orderId -> time the trade finished
+        self._open: Dict[int, Dict[int, None]] = {}   # conId -> orderIds of open trades
+        self.spread = 0.01
+        self.wrapper = types.SimpleNamespace(
+            accounts=list(self.accounts), trades=self._trades, permId2Trade={},
+            orderKey=lambda clientId, orderId, permId: orderId
+        )
+        
+        self.realized_pnl = 0.0
+        self.messages_sent = 0
+    
+    def isConnected(self) -> bool:
+        return self.connected
+    
+    def disconnect(self):
+        if not self.connected:
+            return
+        self.connected = False
+        for order_id, trade in list(self._trades.items()):
+            self._trades[order_id] = dataclasses.replace(
+                trade, order=copy.copy(trade.order), orderStatus=copy.copy(trade.orderStatus),
+                fills=list(trade.fills), log=list(trade.log)
+            )
+        self._pnl_subs.clear()
+        self._tickers.clear()
+        self.disconnectedEvent.emit()
+    
+    def drop_connection(self, downtime: float):
+        """Simulate a gateway outage lasting `downtime` seconds"""
+        self._down_until = clock.time() + downtime
+        self.disconnect()
+    
+    async def connectAsync(self, host: str = '127.0.0.1', port: int = 7497,
+                           clientId: int = 1, timeout: float = 4):
+        await clock.sleep(self.ack_delay)
+        if clock.time() < self._down_until:
+            raise ConnectionRefusedError(f"Connect call failed ('{host}', {port})")
+        await clock.sleep(self.ack_delay * 4)   # startup sync round trips
+        self.connected = True
+        self.connectedEvent.emit()
+        return self
+    
+    def _check_connected(self):
+        if not self.connected:
+            raise ConnectionError('Not connected')
+    
+    def _emit(self, event: Event, *args):
+        """Deliver an event to the client (dropped while disconnected)"""
+        if self.connected:
+            event.emit(*args)
+    
+    def con_id(self, symbol: str) -> int:
+        """Stable simulated conId for a symbol"""
+        if symbol not in self._con_ids:
+            self._con_ids[symbol] = self._next_con_id
+            self._next_con_id += 1
+        return self._con_ids[symbol]
+    
+    async def qualifyContractsAsync(self, *contracts):
+        for contract in contracts:
+            contract.conId = self.con_id(contract.symbol)
+            self._contracts[contract.conId] = contract
+        return list(contracts)
+    
+    async def reqContractDetailsAsync(self, contract):
+        return [ContractDetails(contract=contract, marketRuleIds='26', validExchanges='SMART')]
+    
+    async def reqMarketRuleAsync(self, marketRuleId: int):
+        return [PriceIncrement(0.0, 0.0001), PriceIncrement(1.0, 0.01)]
+    
+    def accountValues(self, account: str = ''):
+        return [AccountValue(self.account, 'NetLiquidation', str(self.net_liquidation), 'USD', '')]
+    
+    async def reqAccountSummaryAsync(self):
+        self.messages_sent += 1
+        for name, value in self.accounts.items():
+            for tag, amount in (('NetLiquidation', value), ('BuyingPower', value * 4), ('ExcessLiquidity', value)):
+                self._emit(self.accountSummaryEvent, AccountValue(name, tag, str(amount), 'USD', ''))
+    
+    def reqPnL(self, account: str, modelCode: str = '') -> PnL:
+        self.messages_sent += 1
+        pnl = PnL(account=account, modelCode=modelCode, dailyPnL=self.realized_pnl)
+        self._emit(self.pnlEvent, pnl)
+        return pnl
+    
+    def cancelPnL(self, account: str, modelCode: str = ''):
+        self.messages_sent += 1
+    
+    async def accountSummaryAsync(self, account: str = ''):
+        return [
+            AccountValue(name, 'NetLiquidation', str(value), 'USD', '')
+            for name, value in self.accounts.items() if not account or name == account
+        ]
+    
+    def positions(self, account: str = ''):
+        if not self.connected:
+            return []
+        return [
+            Position(holder, self._contracts[con_id], qty, avg_cost)
+            for (holder, con_id), (qty, avg_cost) in self._positions.items()
+            if qty and (not account or holder == account)
+        ]
+    
+    def trades(self):
+        return list(self._trades.values())
+    
+    def openTrades(self):
+        return [trade for trade in self._trades.values() if not trade.isDone()]
+    
+    def reqPnLSingle(self, account: str, modelCode: str, conId: int) -> PnLSingle:
+        self._check_connected()
+        key = (account, modelCode, conId)
+        self._pnl_subs[key] = PnLSingle(account, modelCode, conId)
+        self.messages_sent += 1
+        return self._pnl_subs[key]
+    
+    def cancelPnLSingle(self, account: str, modelCode: str, conId: int):
+        self._pnl_subs.pop((account, modelCode, conId), None)
+        self.messages_sent += 1
+    
+    def reqMktData(self, contract: Contract, genericTickList: str = '', snapshot: bool = False,
+                   regulatorySnapshot: bool = False, mktDataOptions=None) -> Ticker:
+        self._check_connected()
+        self.messages_sent += 1
+        ticker = self._tickers.setdefault(contract.conId, Ticker(contract=contract))
+        price = self._prices.get(contract.conId)
+        if price is not None:
+            self._update_ticker(ticker, price)
+        return ticker
+    
+    def cancelMktData(self, contract: Contract):
+        self.messages_sent += 1
+        self._tickers.pop(contract.conId, None)
+    
+    def _update_ticker(self, ticker: Ticker, price: float):
+        ticker.last = price
+        ticker.bid = round(price - self.spread / 2, 4)
+        ticker.ask = round(price + self.spread / 2, 4)
+        ticker.time = datetime.fromtimestamp(clock.time())
+        self._emit(self.pendingTickersEvent, {ticker})
+    
+    def placeOrder(self, contract: Contract, order: Order) -> Trade:
+        self._check_connected()
+        self.messages_sent += 1
+        loop = asyncio.get_event_loop()
+        trade = self._trades.get(order.orderId)
+        if trade:
+            # Modification of an existing order
+            assert not trade.isDone()
+            trade.order = order
+            self._triggered.discard(order.orderId)
+        else:
+            order.orderId = self._next_order_id
+            self._next_order_id += 1
+            trade = Trade(contract, order, OrderStatus(orderId=order.orderId, status='PendingSubmit'), [], [])
+            self._trades[order.orderId] = trade
+            self._open.setdefault(contract.conId, {})[order.orderId] = None
+        loop.call_later(self.ack_delay, self._ack, order.orderId)
+        return trade
+    
+    def cancelOrder(self, order: Order):
+        self._check_connected()
+        self.messages_sent += 1
+        trade = self._trades.get(order.orderId)
+        if trade and not trade.isDone():
+            trade.orderStatus.status = 'PendingCancel'
+            asyncio.get_event_loop().call_later(self.ack_delay, self._cancelled, order.orderId)
+        return trade
+    
+    def _ack(self, order_id: int):
+        trade = self._trades.get(order_id)
+        if trade is None or trade.isDone() or trade.orderStatus.status == 'PendingCancel':
+            return
+        trade.orderStatus.status = 'Submitted'
+        trade.orderStatus.remaining = trade.order.totalQuantity - trade.orderStatus.filled
+        self._emit(self.orderStatusEvent, trade)
+        price = self._prices.get(trade.contract.conId)
+        if price is not None:
+            self._match(trade, price)
+    
+    def _cancelled(self, order_id: int):
+        trade = self._trades.get(order_id)
+        if trade is None or trade.isDone():
+            return
+        trade.orderStatus.status = 'Cancelled'
+        self._finished(trade)
+        self._emit(self.orderStatusEvent, trade)
+    
+    def _marketable(self, trade: Trade, price: float) -> bool:
+        order = trade.order
+        buy = order.action == 'BUY'
+        if order.orderType == 'MKT':
+            return True
+        if order.orderType == 'STP LMT' and order.orderId not in self._triggered:
+            if not (price >= order.auxPrice if buy else price <= order.auxPrice):
+                return False
+            self._triggered.add(order.orderId)
+        return price <= order.lmtPrice if buy else price >= order.lmtPrice
+    
+    def _match(self, trade: Trade, price: float):
+        if trade.orderStatus.status not in ('Submitted', 'PreSubmitted') or not self._marketable(trade, price):
+            return
+        order = trade.order
+        con_id = trade.contract.conId
+        account = order.account or self.account
+        shares = order.totalQuantity - trade.orderStatus.filled
+        position, avg_cost = self._positions.get((account, con_id), [0, 0.0])
+        signed = shares if order.action == 'BUY' else -shares
+        if position == 0 or (position > 0) == (signed > 0):
+            avg_cost = (abs(position) * avg_cost + shares * price) / (abs(position) + shares)
+        else:
+            closed = min(shares, abs(position))
+            self.realized_pnl += closed * (price - avg_cost) * (1 if position > 0 else -1)
+            if shares > abs(position):
+                avg_cost = price
+        position += signed
+        if position == 0:
+            avg_cost = 0.0
+        self._positions[(account, con_id)] = [position, avg_cost]
+        
+        execution = Execution(
+            execId=f"SIM{self._next_exec_id}", time=datetime.fromtimestamp(clock.time()),
+            acctNumber=account, side='BOT' if order.action == 'BUY' else 'SLD',
+            shares=shares, price=price, orderId=order.orderId, cumQty=order.totalQuantity,
+            avgPrice=price
+        )
+        self._next_exec_id += 1
+        fill = Fill(trade.contract, execution, CommissionReport(), execution.time)
+        trade.fills.append(fill)
+        trade.orderStatus.status = 'Filled'
+        self._finished(trade)
+        trade.orderStatus.filled = order.totalQuantity
+        trade.orderStatus.remaining = 0
+        trade.orderStatus.avgFillPrice = price
+        self._emit(self.execDetailsEvent, trade, fill)
+        self._emit(self.orderStatusEvent, trade)
+    
+    def _finished(self, trade: Trade):
+        self._done_at[trade.order.orderId] = clock.time()
+        self._open.get(trade.contract.conId, {}).pop(trade.order.orderId, None)
+    
+    def prune_done_trades(self, older_than: float):
+        """Forget trades that finished more than `older_than` seconds ago"""
+        cutoff = clock.time() - older_than
+        for order_id, done_at in list(self._done_at.items()):
+            if done_at < cutoff:
+                del self._done_at[order_id]
+                self._trades.pop(order_id, None)
+                self._triggered.discard(order_id)
+    
+    def last_price(self, symbol: str) -> float:
+        """Last price pushed with set_price()"""
+        return self._prices.get(self.con_id(symbol))
+    
+    async def random_walk(self, symbols: List[str], rng: random.Random, volatility: float = 0.01,
+                          prune_after: float = 120):
+        """Move every symbol by a gaussian step each second (runs until cancelled)"""
+        prices = {symbol: self.last_price(symbol) or 10.0 for symbol in symbols}
+        tick = 0
+        while True:
+            await clock.sleep(1)
+            tick += 1
+            for symbol in symbols:
+                prices[symbol] = max(1.0, prices[symbol] * (1 + rng.gauss(0, volatility)))
+                self.set_price(symbol, round(prices[symbol], 2))
+            if tick % 60 == 0:
+                self.prune_done_trades(older_than=prune_after)
+    
+    def set_price(self, symbol: str, price: float):
+        """Push a new last price: match resting orders and emit PnL"""
+        con_id = self.con_id(symbol)
+        self._prices[con_id] = price
+        ticker = self._tickers.get(con_id)
+        if ticker is not None:
+            self._update_ticker(ticker, price)
+        for order_id in list(self._open.get(con_id, ())):
+            self._match(self._trades[order_id], price)
+        
+        for (account, model_code, sub_con_id), pnl in self._pnl_subs.items():
+            if sub_con_id == con_id:
+                position, avg_cost = self._positions.get((account, con_id), [0, 0.0])
+                pnl.position = position
+                pnl.unrealizedPnL = position * (price - avg_cost)
+                pnl.value = position * price
+                self._emit(self.pnlSingleEvent, pnl)
+    
+    async def replay(self, symbol: str, price_path: List[tuple]):
+        """Feed a (seconds, price) path using the clock"""
+        start = clock.time()
+        for seconds, price in price_path:
+            delay = start + seconds - clock.time()
+            if delay > 0:
+                await clock.sleep(delay)
+            self.set_price(symbol, price)
+
+
+def load_price_path(path: str) -> List[tuple]:
+    """Load a 'seconds,price' CSV file (header line optional)"""
+    price_path = []
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.strip().split(',')
+            if len(parts) < 2:
+                continue
+            try:
+                price_path.append((float(parts[0]), float(parts[1])))
+            except ValueError:
+                continue
+    return price_path
+
+
+def synthetic_price_path(start_price: float, seconds: int = 1800, step: float = 1.0,
+                         volatility: float = 0.004, drift: float = 0.0002, seed: int = 7) -> List[tuple]:
+    """Deterministic random-walk price path"""
+    rng = random.Random(seed)
+    price = start_price
+    price_path = [(0.0, price)]
+    for i in range(1, int(seconds / step) + 1):
+        price = max(0.0001, price * (1 + drift + rng.gauss(0, volatility)))
+        price_path.append((i * step, round(price, 4)))
+    return price_path
+
+
+async def simulate_session(symbol: str, entry_price: float, price_path: List[tuple],
+                           position: int = None, tail_seconds: float = 60) -> dict:
+    """Run one StockTrader against a simulated broker and price path"""
+    ib = SimulatedIB()
+    if position is None:
+        position = max(Config.MIN_POSITION_SIZE, int(Config.POSITION_CAPITAL // entry_price))
+    
+    ib.set_price(symbol, price_path[0][1])
+    trader = StockTrader(ib, symbol, entry_price, ib.net_liquidation, 2, position)
+    trader_task = asyncio.create_task(trader.start())
+    feed_task = asyncio.create_task(ib.replay(symbol, price_path))
+    
+    await asyncio.wait([trader_task, feed_task], return_when=asyncio.FIRST_COMPLETED)
+    if not trader_task.done():
+        try:
+            await clock.wait_for(asyncio.shield(trader_task), timeout=tail_seconds)
+        except asyncio.TimeoutError:
+            await trader.abort()
+            await trader_task
+    feed_task.cancel()
+    
+    return {
+        'symbol': symbol,
+        'states': [str(s) for s in trader.previous_states] + [str(trader.state)],
+        'state_counts': {state.name: n for state, n in zip(TradeState, trader.state_counts) if n},
+        'reentries': trader.reentry_count,
+        'realized_pnl': round(ib.realized_pnl, 2),
+        'orders_sent': ib.messages_sent,
+        'amendments': amend_stats.summary()
+    }
+
+
+@contextlib.contextmanager
+def virtual_session(config: dict = None, quiet: bool = True, **singletons):
+    """
+    A fresh VirtualTimeEventLoop (yielded) with the clock and module singletons swapped out
+    
+    tick_engine (rules in memory only), amend_stats and subscriptions always
+    start empty; any other module global can be replaced by keyword, e.g.
+    virtual_session(connection_supervisor=ConnectionSupervisor()). Config
+    attributes in config are overridden. quiet silences INFO logging and
+    stdout. Everything is restored and the loop closed on exit.
+    """
+    module = globals()
+    fresh = {'tick_engine': TickSizeEngine(None), 'amend_stats': AmendmentStats(),
+             'subscriptions': SubscriptionManager(), **singletons}
+    config = config or {}
+    saved_clock = clock
+    saved_globals = {name: module[name] for name in fresh}
+    saved_config = {name: getattr(Config, name) for name in config}
+    loop = VirtualTimeEventLoop()
+    set_clock(VirtualClock(loop))
+    module.update(fresh)
+    for name, value in config.items():
+        setattr(Config, name, value)
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                logging.disable(logging.INFO)
+                stack.callback(logging.disable, logging.NOTSET)
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            yield loop
+    finally:
+        loop.close()
+        set_clock(saved_clock)
+        module.update(saved_globals)
+        for name, value in saved_config.items():
+            setattr(Config, name, value)
+
+
+def run_simulation(symbol: str, entry_price: float, price_path: List[tuple], **kwargs) -> dict:
+    """Run simulate_session on a virtual-time event loop and report the speedup"""
+    real_start = time.perf_counter()
+    with virtual_session(quiet=False) as loop:
+        result = loop.run_until_complete(simulate_session(symbol, entry_price, price_path, **kwargs))
+        virtual_seconds = loop.time()
+    
+    real_seconds = time.perf_counter() - real_start
+    result['virtual_seconds'] = round(virtual_seconds, 2)
+    result['real_seconds'] = round(real_seconds, 3)
+    result['speedup'] = round(virtual_seconds / real_seconds, 1) if real_seconds else None
+    return result
+
+
+async def soak_session(lifecycles: int, concurrency: int, symbol_count: int,
+                       trader_lifetime: float, seed: int) -> dict:
+    """Run many trader lifecycles and sample memory, handler and subscription counts"""
+    ib = SimulatedIB()
+    rng = random.Random(seed)
+    symbols = [f"SOAK{i}" for i in range(symbol_count)]
+    for symbol in symbols:
+        ib.set_price(symbol, 10.0)
+    
+    async def lifecycle(index: int):
+        symbol = symbols[index % symbol_count]
+        entry_price = round(ib.last_price(symbol), 2)
+        trader = StockTrader(ib, symbol, entry_price, ib.net_liquidation, 2, 10)
+        await trader.run(trader_lifetime)
+    
+    driver = asyncio.create_task(ib.random_walk(symbols, rng))
+    samples = []
+    max_ib_handlers = 0
+    sample_every = max(1, lifecycles // 10)
+    tracemalloc.start()
+    try:
+        pending = set()
+        started = 0
+        completed = 0
+        while completed < lifecycles:
+            while started < lifecycles and len(pending) < concurrency:
+                pending.add(asyncio.create_task(lifecycle(started)))
+                started += 1
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if driver.done():
+                driver.result()
+            for task in done:
+                task.result()
+                completed += 1
+                max_ib_handlers = max(max_ib_handlers, len(ib.pnlSingleEvent))
+                if completed % sample_every == 0:
+                    gc.collect()
+                    samples.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        driver.cancel()
+        tracemalloc.stop()
+    
+    final_counts = subscriptions.counts()
+    final_counts['broker_pnl_subscriptions'] = len(ib._pnl_subs)
+    final_counts['broker_mkt_data'] = len(ib._tickers)
+    final_counts['active_traders'] = len(order_manager.active_traders)
+    
+    baseline = samples[min(1, len(samples) - 1)]
+    growth = samples[-1] - baseline
+    failures = []
+    if growth > max(512 * 1024, baseline * 0.10):
+        failures.append(f"memory grew {growth / 1024:.0f} KB after warmup")
+    if max_ib_handlers > 1:
+        failures.append(f"{max_ib_handlers} pnlSingleEvent handlers on the IB client")
+    for key in ('pnl_subscriptions', 'pnl_handlers', 'mkt_data_subscriptions',
+                'broker_pnl_subscriptions', 'active_traders'):
+        if final_counts[key]:
+            failures.append(f"{key} = {final_counts[key]} after all traders finished")
+    
+    return {
+        'lifecycles': completed,
+        'memory_kb': [round(sample / 1024) for sample in samples],
+        'memory_growth_kb': round(growth / 1024),
+        'max_ib_pnl_handlers': max_ib_handlers,
+        'final_counts': final_counts,
+        'passed': not failures,
+        'failures': failures
+    }
+
+
+def run_soak_test(lifecycles: int = 2000, concurrency: int = 50, symbol_count: int = 20,
+                  trader_lifetime: float = 180, seed: int = 7) -> dict:
+    """Run soak_session on virtual time with trader output silenced"""
+    real_start = time.perf_counter()
+    with virtual_session() as loop:
+        result = loop.run_until_complete(
+            soak_session(lifecycles, concurrency, symbol_count, trader_lifetime, seed)
+        )
+        virtual_seconds = loop.time()
+    
+    result['virtual_hours'] = round(virtual_seconds / 3600, 2)
+    result['real_seconds'] = round(time.perf_counter() - real_start, 1)
+    return result
+
+
+async def reconnect_session(trader_count: int, downtime: float, seed: int) -> dict:
+    """Drop the connection under live traders and count the ones that did not recover"""
+    ib = SimulatedIB()
+    connection_supervisor.start(ib, Config.IB_CLIENT_ID)
+    symbols = [f"RECON{i}" for i in range(trader_count)]
+    for symbol in symbols:
+        ib.set_price(symbol, 10.0)
+    traders = [StockTrader(ib, symbol, 10.0, ib.net_liquidation, 2, 10) for symbol in symbols]
+    tasks = [asyncio.ensure_future(trader.run()) for trader in traders]
+    driver = asyncio.ensure_future(ib.random_walk(symbols, random.Random(seed), volatility=0.002))
+    try:
+        deadline = clock.time() + 120
+        while any(trader.state == TradeState.NEW for trader in traders) and clock.time() < deadline:
+            await clock.sleep(1)
+        live = [trader for trader in traders if trader.state != TradeState.TRADE_COMPLETE]
+        orders = sum(len(trader.tracked_orders()) for trader in live)
         
-        # Cancel all orders
-        orders = [
-            self.initial_order, self.stop_loss_order, self.reentry_order,
-            self.take_profit_33, self.take_profit_66, self.take_profit_99
-        ]
-        for order in orders:
-            await self.cancel_order(order)
+        ib.drop_connection(downtime)
+        await connection_supervisor.wait_ready()
+        recovery = dict(connection_supervisor.last_recovery)
+        resumed_at = clock.time()
+        await clock.sleep(5)
         
-        # Unregister from global manager
-        order_manager.unregister_trader(self.symbol)
+        ended = sum(1 for trader in live if trader.state == TradeState.TRADE_COMPLETE)
+        stale = sum(1 for trader in live if trader.state != TradeState.TRADE_COMPLETE
+                    and (trader.last_pnl_update_time or 0) < resumed_at)
+        return dict(traders=len(live), orders=orders, **recovery, ended=ended, stale=stale)
+    finally:
+        connection_supervisor.stop()
+        for trader in traders:
+            if trader.state != TradeState.TRADE_COMPLETE:
+                await trader.abort()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        driver.cancel()
+
+
+def benchmark_reconnect(traders: int = 200, downtime: float = 5.0, seed: int = 7) -> dict:
+    """Recovery time and resync cost for a connection drop under live traders"""
+    with virtual_session(connection_supervisor=ConnectionSupervisor()) as loop:
+        return loop.run_until_complete(reconnect_session(traders, downtime, seed))
+
+
+async def accounts_session(signals: int, accounts: Dict[str, float], lifetime: float, seed: int) -> dict:
+    """Fan signals out across simulated accounts and count per-account fills and leftovers"""
+    ib = SimulatedIB(accounts=accounts)
+    symbols = [f"ALLOC{i}" for i in range(signals)]
+    for symbol in symbols:
+        ib.set_price(symbol, 10.0)
+    traders = [spawn_trader(ib, symbol, 10.0, ib.net_liquidation, 2, 10, lifetime=lifetime)
+               for symbol in symbols]
+    driver = asyncio.ensure_future(ib.random_walk(symbols, random.Random(seed), volatility=0.002))
+    try:
+        deadline = clock.time() + 60
+        while clock.time() < deadline and any(
+                len(trader.children) < len(accounts)
+                or any(child.state == TradeState.NEW for child in trader.children.values())
+                for trader in traders):
+            await clock.sleep(1)
         
-        # Remove from tracked symbols
-        global tracked_symbols
-        if self.symbol_price_key in tracked_symbols:
-            tracked_symbols.remove(self.symbol_price_key)
-            logging.info(f"[{self.symbol}] Removed {self.symbol_price_key} from tracked symbols")
-            print(f"\t[{self.symbol}] Symbol/price cleared from tracking")
+        mismatched = 0
+        for trader in traders:
+            for account, child in trader.children.items():
+                held = sum(p.position for p in ib.positions(account) if p.contract.symbol == trader.symbol)
+                if child.live_position and held != child.live_position:
+                    mismatched += 1
         
-        print(f"\t[{self.symbol}] Trader shutdown complete")
+        await asyncio.gather(*list(trader_tasks))
+        if driver.done():
+            driver.result()
+        leftover = [p for p in ib.positions() if p.contract.symbol in symbols]
+    finally:
+        driver.cancel()
     
-    async def run_state_machine(self):
-        """Run the trading state machine"""
-        state_handlers = {
-            TradeState.IN_TRADE_PNL_U5: self.handle_in_trade_pnl_u5,
-            TradeState.STOPPED_OUT: self.handle_stopped_out,
-            TradeState.WAITING_REENTRY: self.handle_waiting_reentry,
-            TradeState.IN_TRADE_PNL_O5: self.handle_in_trade_pnl_o5,
-            TradeState.IN_TRADE_PNL_O33: self.handle_in_trade_pnl_o33,
-            TradeState.IN_TRADE_PNL_O66: self.handle_in_trade_pnl_o66,
-            TradeState.IN_TRADE_PNL_O99: self.handle_in_trade_pnl_o99,
-            TradeState.TRADE_COMPLETE: self.handle_trade_complete
-        }
-        
-        while self.state != TradeState.TRADE_COMPLETE:
-            if self.state in state_handlers:
-                try:
-                    await state_handlers[self.state]()
-                except Exception as e:
-                    logging.error(f"[{self.symbol}] State handler error in {self.state}: {e}")
-                    print(f"\t[{self.symbol}] Error in {self.state}: {e}")
-                    await self.set_state(TradeState.TRADE_COMPLETE)
-            else:
-                logging.error(f"[{self.symbol}] Unknown state: {self.state}")
-                print(f"\t[{self.symbol}] Unknown state: {self.state}")
-                await self.set_state(TradeState.TRADE_COMPLETE)
-        
-        logging.info(f"[{self.symbol}] State machine completed")
+    skews = [trader.submit_skew_us for trader in traders if trader.submit_skew_us is not None]
+    sizes = {account: child.position_size for account, child in traders[0].children.items()}
+    return {
+        'signals': signals,
+        'accounts': len(accounts),
+        'messages_sent': ib.messages_sent,
+        'sizes_per_account': sizes,
+        'mean_skew_us': round(sum(skews) / len(skews), 1) if skews else None,
+        'max_skew_us': max(skews) if skews else None,
+        'skews_reported': len(skews),
+        'mismatched_positions': mismatched,
+        'positions_left_open': len(leftover),
+        'pnl_handlers_left': subscriptions.counts()['pnl_handlers'],
+    }
+
+
+def benchmark_accounts(signals: int = 100, account_count: int = 4, lifetime: float = 300,
+                       seed: int = 7) -> dict:
+    """Submission skew and per-account bookkeeping for capital-weighted allocation"""
+    accounts = {f"SIM{i + 1}": 50000.0 * (i + 1) for i in range(account_count)}
+    config = {'ACCOUNTS': dict.fromkeys(accounts, 1.0), 'ALLOCATION_MODE': 'capital'}
+    with virtual_session(config) as loop:
+        return loop.run_until_complete(accounts_session(signals, accounts, lifetime, seed))
+
+
+async def entry_session(signals: int, lifetime: float, seed: int) -> dict:
+    """Run one batch of signals whose market has already moved away from the signal price"""
+    rng = random.Random(seed)
+    ib = SimulatedIB()
+    symbols = [f"ENTRY{i}" for i in range(signals)]
+    for symbol in symbols:
+        # Quotes at signal time sit between 0.5% below and 2% above the signal price
+        ib.set_price(symbol, round(10.0 * (1 + rng.uniform(-0.005, 0.02)), 2))
+    for symbol in symbols:
+        spawn_trader(ib, symbol, 10.0, ib.net_liquidation, 2, 100, lifetime=lifetime)
+    driver = asyncio.ensure_future(ib.random_walk(symbols, rng, volatility=0.003))
+    try:
+        await asyncio.gather(*list(trader_tasks))
+    finally:
+        driver.cancel()
+    return {'messages_sent': ib.messages_sent}
+
+
+def benchmark_entry(signals: int = 200, lifetime: float = 60, seed: int = 11) -> dict:
+    """Fill rate, slippage and time to fill of fixed versus pegged entries on the same signals"""
+    result = {'signals': signals}
+    for mode in ('fixed', 'pegged'):
+        # Every pegged entry gets its quotes (the simulator has no line limit)
+        config = {'ENTRY_MODE': mode, 'MARKET_DATA_LINES': signals}
+        with virtual_session(config, entry_stats=EntryStats()) as loop:
+            session = loop.run_until_complete(entry_session(signals, lifetime, seed))
+            # A fixed GTC entry that never fills is only cancelled with its trader
+            for _ in range(signals - len(entry_stats.signals.get(mode, []))):
+                entry_stats.record(mode, 100, 0, 0.0, lifetime)
+            result[mode] = dict(entry_stats.summary(mode), **session)
+    return result
+
+
+# ==================== SHARDING ====================
+
+class SignalRing:
+    """
+    Single-producer/single-consumer ring of fixed-size records in shared memory
+    
+    The write index lives at offset 0 and the read index at offset 64, so
+    producer and consumer never write to the same cache line. Both indices
+    only grow; a record is fully written before the write index is
+    published, so the consumer never sees a partial record.
+    """
+    HEADER_SIZE = 128
+    WRITE_OFFSET = 0
+    READ_OFFSET = 64
+    CAPACITY_OFFSET = 8
+    INDEX = struct.Struct('<Q')
+    
+    def __init__(self, record: struct.Struct, name: str = None, capacity: int = None):
+        self.record = record
+        if name is None:
+            capacity = capacity or Config.SHARD_RING_CAPACITY
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=self.HEADER_SIZE + capacity * record.size
+            )
+            self.shm.buf[:self.HEADER_SIZE] = bytes(self.HEADER_SIZE)
+            self.INDEX.pack_into(self.shm.buf, self.CAPACITY_OFFSET, capacity)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.capacity = self.INDEX.unpack_from(self.shm.buf, self.CAPACITY_OFFSET)[0]
+        # Each side caches its own index; only the other side's is read from shared memory
+        self._write = self.INDEX.unpack_from(self.shm.buf, self.WRITE_OFFSET)[0]
+        self._read = self.INDEX.unpack_from(self.shm.buf, self.READ_OFFSET)[0]
+    
+    def push(self, *values) -> bool:
+        """Append one record (producer side); False if the ring is full"""
+        buf = self.shm.buf
+        if self._write - self.INDEX.unpack_from(buf, self.READ_OFFSET)[0] >= self.capacity:
+            return False
+        offset = self.HEADER_SIZE + (self._write % self.capacity) * self.record.size
+        self.record.pack_into(buf, offset, *values)
+        self._write += 1
+        self.INDEX.pack_into(buf, self.WRITE_OFFSET, self._write)
+        return True
+    
+    def pop_all(self) -> List[tuple]:
+        """Take every published record (consumer side)"""
+        buf = self.shm.buf
+        write = self.INDEX.unpack_from(buf, self.WRITE_OFFSET)[0]
+        if write == self._read:
+            return []
+        records = []
+        for index in range(self._read, write):
+            offset = self.HEADER_SIZE + (index % self.capacity) * self.record.size
+            records.append(self.record.unpack_from(buf, offset))
+        self._read = write
+        self.INDEX.pack_into(buf, self.READ_OFFSET, write)
+        return records
+    
+    def close(self):
+        """Detach from the shared memory (and free it if this side created it)"""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Coordinator -> worker: symbol, entry price, capital, price precision, position, stop loss pct
+# (an empty symbol tells the worker to shut down)
+SIGNAL_RECORD = struct.Struct('<16sddiid')
+# Worker -> coordinator: symbol, entry price of a finished trader
+# (an empty symbol means the worker is ready)
+DONE_RECORD = struct.Struct('<16sd')
+
+
+def shard_of(symbol: str, shards: int) -> int:
+    """Worker index that owns a symbol"""
+    return zlib.crc32(symbol.encode()) % shards
+
+
+async def shard_worker_session(shard: int, signal_ring: SignalRing, done_ring: SignalRing, ib,
+                               poll_seconds: float = None, lifetime: float = None):
+    """Spawn traders for signals from the coordinator until told to shut down"""
+    poll_seconds = poll_seconds or Config.SHARD_POLL_SECONDS
+    # Completions the ring had no room for, retried in order on each poll
+    unsent = deque()
+    
+    def flush_completions() -> bool:
+        while unsent:
+            if not done_ring.push(*unsent[0]):
+                return False
+            unsent.popleft()
+        return True
+    
+    def trader_done(trader):
+        unsent.append((trader.symbol.encode(), trader.entry_price))
+        if not flush_completions() and len(unsent) == 1:
+            logging.warning(f"Shard {shard}: completion ring full, queueing completions")
+    
+    done_ring.push(b'', 0.0)
+    while True:
+        flush_completions()
+        for symbol, entry_price, capital, price_precision, position, stop_loss_pct in signal_ring.pop_all():
+            symbol = symbol.rstrip(b'\0').decode()
+            if not symbol:
+                if not flush_completions():
+                    logging.warning(f"Shard {shard}: {len(unsent)} completions unsent at shutdown")
+                return
+            if loop_watchdog.paused:
+                logging.warning(f"[{symbol}] Signal refused on shard {shard}: loop watchdog paused")
+                trader_done(types.SimpleNamespace(symbol=symbol, entry_price=entry_price))
+                continue
+            spawn_trader(ib, symbol, entry_price, capital, price_precision, position,
+                         on_done=trader_done, lifetime=lifetime, stop_loss_pct=stop_loss_pct)
+        await clock.sleep(poll_seconds)
+
+
+async def shard_worker_main(shard: int, signal_ring: SignalRing, done_ring: SignalRing):
+    """Worker process: own IB connection hosting one shard of traders"""
+    ib = IB()
+    client_id = Config.IB_CLIENT_ID + 1 + shard
+    try:
+        await ib.connectAsync(Config.IB_HOST, Config.IB_PORT, clientId=client_id)
+        logging.info(f"Shard {shard} connected to IB as client {client_id}")
+        print(f"\tShard {shard} connected (client ID {client_id})")
+        connection_supervisor.start(ib, client_id)
+        start_session_recorder(ib, f"_shard{shard}")
+        start_blotter(ib, f"_shard{shard}", shard + 1)
+        await start_status_server(Config.STATUS_PORT + 1 + shard)
+        stress_calculator.start()
+        if Config.WATCHDOG_ENABLED:
+            loop_watchdog.start()
+        if Config.SHADOW_ENABLED:
+            shadow_book.start(ib)
+        await shard_worker_session(shard, signal_ring, done_ring, ib)
+    except Exception as e:
+        logging.error(f"Shard {shard} error: {e}")
+        print(f"\tShard {shard} error: {e}")
+    finally:
+        connection_supervisor.stop()
+        loop_watchdog.stop()
+        stress_calculator.stop()
+        shadow_book.close(f"_shard{shard}")
+        status_server.stop()
+        session_recorder.close()
+        blotter.close()
+        tick_engine.close()
+        if amend_stats.amendments:
+            logging.info(f"Shard {shard} order amendments: {amend_stats.summary()}")
+        if ib.isConnected():
+            ib.disconnect()
+            logging.info(f"Shard {shard} disconnected from IB")
+
+
+def run_shard_worker(shard: int, signal_ring_name: str, done_ring_name: str):
+    """Worker process entry point"""
+    signal_ring = SignalRing(SIGNAL_RECORD, signal_ring_name)
+    done_ring = SignalRing(DONE_RECORD, done_ring_name)
+    try:
+        asyncio.run(shard_worker_main(shard, signal_ring, done_ring))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal_ring.close()
+        done_ring.close()
+
+
+class ShardCoordinator:
+    """
+    Routes trade signals to worker processes by symbol
+    
+    Each worker owns the symbols with crc32(symbol) % shards == its index,
+    runs its own event loop and IB connection (client ID IB_CLIENT_ID + 1 +
+    shard) and hosts the StockTraders for those symbols. Signals go out and
+    trader completions come back over shared-memory rings; completions
+    release the signal from signal_index.
+    """
+    
+    def __init__(self, shards: int, worker=run_shard_worker, worker_args: tuple = ()):
+        self.shards = shards
+        self.worker = worker
+        self.worker_args = worker_args
+        self.processes = []
+        self.signal_rings: List[SignalRing] = []
+        self.done_rings: List[SignalRing] = []
+        self.pending: Dict[tuple, deque] = {}   # (symbol, entry_price) -> signal ids, oldest first
+        self.ready = 0
+        self.sent = 0
+        self.completed = 0
+    
+    def start(self):
+        """Create the rings and start the worker processes"""
+        context = multiprocessing.get_context('spawn')
+        for shard in range(self.shards):
+            signal_ring = SignalRing(SIGNAL_RECORD)
+            done_ring = SignalRing(DONE_RECORD)
+            process = context.Process(
+                target=self.worker, name=f"shard-{shard}", daemon=True,
+                args=(shard, signal_ring.name, done_ring.name) + self.worker_args
+            )
+            process.start()
+            self.signal_rings.append(signal_ring)
+            self.done_rings.append(done_ring)
+            self.processes.append(process)
+        logging.info(f"Started {self.shards} shard workers")
+    
+    def shard_for(self, symbol: str) -> int:
+        """Worker index that owns a symbol"""
+        return shard_of(symbol, self.shards)
+    
+    def submit(self, symbol: str, entry_price: float, capital: float,
+               price_precision: int, position: int, stop_loss_pct: float = None,
+               signal_id: int = None) -> bool:
+        """Send a signal to the symbol's worker; False if its ring is full"""
+        ring = self.signal_rings[self.shard_for(symbol)]
+        stop_loss_pct = stop_loss_pct or Config.STOP_LOSS_PCT
+        if not ring.push(symbol.encode(), entry_price, capital, price_precision, position, stop_loss_pct):
+            return False
+        if signal_id is not None:
+            self.pending.setdefault((symbol, entry_price), deque()).append(signal_id)
+        self.sent += 1
+        return True
+    
+    def poll(self) -> List[tuple]:
+        """Collect finished (symbol, entry_price) pairs from all workers"""
+        finished = []
+        for ring in self.done_rings:
+            for symbol, entry_price in ring.pop_all():
+                symbol = symbol.rstrip(b'\0').decode()
+                if not symbol:
+                    self.ready += 1
+                    continue
+                finished.append((symbol, entry_price))
+        self.completed += len(finished)
+        return finished
+    
+    async def run(self):
+        """Release signals as workers report finished traders"""
+        reported_dead = set()
+        while True:
+            for symbol, entry_price in self.poll():
+                signal_ids = self.pending.get((symbol, entry_price))
+                if signal_ids:
+                    signal_index.release(signal_ids.popleft())
+                    if not signal_ids:
+                        del self.pending[(symbol, entry_price)]
+                logging.info(f"[{symbol}] Trader finished on shard {self.shard_for(symbol)}")
+            for shard, process in enumerate(self.processes):
+                if not process.is_alive() and shard not in reported_dead:
+                    reported_dead.add(shard)
+                    logging.error(f"Shard {shard} worker exited (code {process.exitcode})")
+                    print(f"\t[!] Shard {shard} worker exited (code {process.exitcode})")
+            await clock.sleep(Config.SHARD_POLL_SECONDS)
     
-    async def start(self):
-        """Start the trader"""
+    def stop(self, timeout: float = 10):
+        """Tell workers to shut down, wait for them and free the rings"""
+        deadline = time.perf_counter() + timeout
+        told = []
+        for shard, ring in enumerate(self.signal_rings):
+            # A full ring drains as the worker takes signals; retry until the deadline
+            while not ring.push(b'', 0.0, 0.0, 0, 0, 0.0):
+                alive = shard < len(self.processes) and self.processes[shard].is_alive()
+                if not alive or time.perf_counter() >= deadline:
+                    break
+                time.sleep(0.01)
+            else:
+                told.append(shard)
+        for shard, process in enumerate(self.processes):
+            process.join(max(0.0, deadline - time.perf_counter()))
+            if process.is_alive():
+                reason = "did not stop" if shard in told else "could not be told to stop (signal ring full)"
+                logging.warning(f"Shard {shard} worker {reason} within {timeout}s - terminating")
+                print(f"\t[!] Shard {shard} worker {reason} within {timeout}s - terminating")
+                process.terminate()
+                process.join(1)
+        for ring in self.signal_rings + self.done_rings:
+            ring.close()
+        logging.info(f"Shard workers stopped: {self.sent} signals sent, {self.completed} traders finished")
+
+
+async def sim_shard_session(shard: int, signal_ring: SignalRing, done_ring: SignalRing,
+                            shards: int, symbols: List[str], lifetime: float):
+    """Benchmark worker session against SimulatedIB"""
+    ib = SimulatedIB()
+    owned = [symbol for symbol in symbols if shard_of(symbol, shards) == shard]
+    for symbol in owned:
+        ib.set_price(symbol, 10.0)
+    driver = asyncio.ensure_future(ib.random_walk(owned, random.Random(shard)))
+    try:
+        await shard_worker_session(shard, signal_ring, done_ring, ib, poll_seconds=0.1, lifetime=lifetime)
+    finally:
+        driver.cancel()
+
+
+def run_sim_shard_worker(shard: int, signal_ring_name: str, done_ring_name: str,
+                         shards: int, symbols: List[str], lifetime: float):
+    """Benchmark worker process: SimulatedIB on virtual time instead of an IB connection"""
+    signal_ring = SignalRing(SIGNAL_RECORD, signal_ring_name)
+    done_ring = SignalRing(DONE_RECORD, done_ring_name)
+    try:
+        with virtual_session() as loop:
+            loop.run_until_complete(
+                sim_shard_session(shard, signal_ring, done_ring, shards, symbols, lifetime)
+            )
+    finally:
+        signal_ring.close()
+        done_ring.close()
+
+
+def benchmark_shards(signals: int = 600, shards: int = None, symbol_count: int = 40,
+                     lifetime: float = 120, in_flight: int = 100) -> dict:
+    """Trader lifecycles per second: one event loop vs several worker processes"""
+    shards = shards or max(2, min(4, os.cpu_count() or 1))
+    symbols = [f"SHARD{i}" for i in range(symbol_count)]
+    result = {'signals': signals, 'cpus': os.cpu_count()}
+    for count in (1, shards):
+        coordinator = ShardCoordinator(count, worker=run_sim_shard_worker,
+                                       worker_args=(count, symbols, lifetime))
+        coordinator.start()
         try:
-            await self.ib.qualifyContractsAsync(self.contract)
-            await self.submit_initial_buy()
-            await self.run_state_machine()
-        except Exception as e:
-            logging.error(f"[{self.symbol}] Start error: {e}")
-            print(f"\t[{self.symbol}] Start error: {e}")
+            while coordinator.ready < count:
+                coordinator.poll()
+                time.sleep(0.01)
+            
+            start = time.perf_counter()
+            dispatch = 0.0
+            finished = 0
+            index = 0
+            while finished < signals:
+                while index < signals and index - finished < in_flight:
+                    t0 = time.perf_counter()
+                    if not coordinator.submit(symbols[index % symbol_count], 10.0, 100000.0, 2, 10):
+                        break
+                    dispatch += time.perf_counter() - t0
+                    index += 1
+                finished += len(coordinator.poll())
+                time.sleep(0.001)
+            elapsed = time.perf_counter() - start
         finally:
-            order_manager.unregister_trader(self.symbol)
-            global tracked_symbols
-            if hasattr(self, 'symbol_price_key') and self.symbol_price_key in tracked_symbols:
-                tracked_symbols.remove(self.symbol_price_key)
-                logging.info(
-                    f"[{self.symbol}] Emergency cleanup: "
-                    f"Removed {self.symbol_price_key} from tracked symbols"
-                )
-                print(f"\t[{self.symbol}] Emergency cleanup: Symbol/price cleared from tracking")
+            coordinator.stop()
+        
+        label = 'single_loop' if count == 1 else f"{count}_shards"
+        result[f"{label}_lifecycles_per_sec"] = round(signals / elapsed)
+        result[f"{label}_seconds"] = round(elapsed, 2)
+        result[f"{label}_dispatch_us"] = round(dispatch / signals * 1e6, 2)
+    result['speedup'] = round(
+        result[f"{shards}_shards_lifecycles_per_sec"] / result['single_loop_lifecycles_per_sec'], 2
+    )
+    return result
 
 
 async def wait_for_clipboard_change(prompt, cast_func=str):
@@ -1050,7 +7328,7 @@ async def wait_for_clipboard_change(prompt, cast_func=str):
     last_value = pyperclip.paste().strip()
     
     while True:
-        await asyncio.sleep(0.11)
+        await clock.sleep(0.11)
         try:
             current = pyperclip.paste().strip()
             if current != last_value:
@@ -1067,7 +7345,95 @@ async def wait_for_clipboard_change(prompt, cast_func=str):
             continue
 
 
-async def monitor_clipboard_and_spawn(ib):
+async def dispatch_signal(ib, symbol: str, entry_price: float, capital: float,
+                          coordinator: ShardCoordinator = None, on_spawn=None, on_done=None) -> bool:
+    """
+    Take a (symbol, price) signal from the clipboard or the scanner through
+    the checks, sizing and deduplication to a trader; True if one was
+    spawned (or sent to a shard worker)
+    """
+    # Check pasted price against the live quote
+    if Config.WATCHLIST_MODE and not await quote_table.sanity_check(symbol, entry_price):
+        return False
+    
+    # Account-level risk check
+    if not account_state.risk_check(symbol):
+        return False
+    
+    # Dynamic position sizing (ATR from the bar store when available)
+    position, stop_loss_pct = compute_position_size(symbol, entry_price)
+    if position <= 0:
+        print(f"\t[!] Buying power ${account_state.buying_power():,.2f} too low for {symbol}")
+        return False
+    if Config.ATR_SIZING and bar_store.ib is not None:
+        bar_store.track(symbol)
+    print(f"\t[{symbol}] Size {position} shares, stop {(1 - stop_loss_pct) * 100:.2f}% below fill")
+    
+    # Duplicate of an open signal (same conId, within SIGNAL_BAND_TICKS)?
+    con_id = await signal_index.resolve(ib, symbol)
+    if con_id is None:
+        print(f"\t[!] Unknown symbol {symbol}")
+        return False
+    action, trade_signal, position = signal_index.admit(con_id, symbol, entry_price, position)
+    if action in ('reject', 'merge'):
+        outcome = 'merged into' if action == 'merge' else 'rejected as a repeat of'
+        logging.info(
+            f"[{symbol}] Signal at {entry_price} {outcome} signal {trade_signal.signal_id} "
+            f"@ {trade_signal.price} (repeat {trade_signal.repeats})"
+        )
+        print(f"\t[!] Already handling {symbol} at {trade_signal.price}"
+              + (" - repeat merged" if action == 'merge' else ""))
+        return False
+    if action == 'scale':
+        logging.info(
+            f"[{symbol}] Repeat {trade_signal.repeats} of signal {trade_signal.signal_id} "
+            f"@ {trade_signal.price} scaled to {position} shares"
+        )
+        print(f"\t[{symbol}] Repeat signal - trading {position} more shares")
+    
+    # ... or another instance is trading it
+    if not trade_signal.running and not await signal_leases.acquire_async(symbol, trade_signal.price):
+        if action == 'new':
+            signal_index.discard(trade_signal)
+        logging.info(f"[{symbol}] Signal at {entry_price} leased by another instance - skipped")
+        print(f"\t[!] {symbol} at {entry_price} is already being traded by another instance")
+        return False
+    
+    # Determine price precision
+    entry_price_str = f"{entry_price:.10f}".rstrip('0').rstrip('.')
+    price_precision = (
+        len(entry_price_str.split('.')[-1]) 
+        if '.' in entry_price_str else 0
+    )
+    
+    # Hand off to the symbol's shard worker
+    signal_id = signal_index.attach(trade_signal)
+    if coordinator is not None:
+        if not coordinator.submit(symbol, entry_price, capital, price_precision, position,
+                                  stop_loss_pct, signal_id):
+            signal_index.release(signal_id)
+            if action == 'new':
+                signal_index.discard(trade_signal)
+            logging.error(f"[{symbol}] Shard {coordinator.shard_for(symbol)} signal ring full")
+            print(f"\t[!] Shard {coordinator.shard_for(symbol)} busy - {symbol} not sent")
+            return False
+        logging.info(f"Sent {symbol} at {entry_price} to shard {coordinator.shard_for(symbol)}")
+        print(f"\t[{symbol}] Sent to shard {coordinator.shard_for(symbol)}")
+        return True
+    
+    # Create and spawn trader
+    trader = spawn_trader(
+        ib, symbol, entry_price, capital,
+        price_precision, position, on_done=on_done,
+        stop_loss_pct=stop_loss_pct, signal_id=signal_id
+    )
+    if on_spawn is not None:
+        on_spawn(trader)
+    print(f"\t[{symbol}] Trader spawned successfully")
+    return True
+
+
+async def monitor_clipboard_and_spawn(ib, coordinator: ShardCoordinator = None):
     """
     Monitor clipboard for symbol/price pairs and spawn traders
     
@@ -1075,28 +7441,27 @@ async def monitor_clipboard_and_spawn(ib):
     1. Wait for symbol paste
     2. Wait for price paste
     3. Calculate position size
-    4. Spawn StockTrader coroutine
+    4. Spawn StockTrader coroutine (or send it to a shard worker)
     5. Repeat
     """
-    global tracked_symbols
-    active_traders = {}
+    active_traders = set()   # several traders may run per symbol
     
-    async def trader_wrapper(trader):
-        """Wrapper to manage trader lifecycle"""
-        nonlocal active_traders
-        try:
-            await trader.start()
-        finally:
-            if trader.symbol in active_traders:
-                del active_traders[trader.symbol]
-                print(f"\t[{trader.symbol}] Removed from active traders count")
+    def trader_done(trader):
+        """Manage trader lifecycle"""
+        if trader in active_traders:
+            active_traders.discard(trader)
+            print(f"\t[{trader.symbol}] Removed from active traders count")
     
     while True:
         try:
+            await connection_supervisor.wait_ready()
+            
             # Get account capital
-            capital = float(
-                next(v.value for v in ib.accountValues() if v.tag == 'NetLiquidation')
-            )
+            capital = account_state.net_liquidation()
+            if capital is None:
+                print("\tWaiting for account summary...")
+                await account_state.wait_ready()
+                continue
             print(f"\n\t=== Capital: ${capital:,.2f} ===")
             
             # Wait for symbol
@@ -1109,6 +7474,15 @@ async def monitor_clipboard_and_spawn(ib):
             except ClipboardClearedException:
                 continue
             
+            if symbol == Config.PROFILE_TOGGLE_COMMAND:
+                profiler.toggle()
+                continue
+            
+            if loop_watchdog.paused:
+                print(f"\t[!] Event loop lagging - {symbol} not traded until it recovers")
+                logging.warning(f"[{symbol}] Signal refused: loop watchdog paused")
+                continue
+            
             # Wait for price
             try:
                 entry_price = await wait_for_clipboard_change(
@@ -1121,43 +7495,243 @@ async def monitor_clipboard_and_spawn(ib):
                 print(f"\t[!] Invalid price format: {e}")
                 continue
             
-            # Dynamic position sizing
-            if int(Config.POSITION_CAPITAL // entry_price) < Config.MIN_POSITION_SIZE:
-                position = Config.MIN_POSITION_SIZE
-            else:
-                position = int(Config.POSITION_CAPITAL // entry_price)
-            
-            # Check if already tracking this symbol/price
-            if (symbol, entry_price) in tracked_symbols:
-                print(f"\t[!] Already handling {symbol} at {entry_price}")
-                continue
-            
-            tracked_symbols.add((symbol, entry_price))
-            
-            # Determine price precision
-            entry_price_str = f"{entry_price:.10f}".rstrip('0').rstrip('.')
-            price_precision = (
-                len(entry_price_str.split('.')[-1]) 
-                if '.' in entry_price_str else 0
-            )
-            
-            # Create and spawn trader
-            trader = StockTrader(
-                ib, symbol, entry_price, capital, 
-                price_precision, position
-            )
-            active_traders[symbol] = trader
-            asyncio.create_task(trader_wrapper(trader))
-            
-            logging.info(f"Spawned coroutine for {symbol} at {entry_price}")
-            print(f"\t[{symbol}] Trader spawned successfully")
-            
-            await asyncio.sleep(1)
+            if await dispatch_signal(ib, symbol, entry_price, capital, coordinator,
+                                     on_spawn=active_traders.add, on_done=trader_done):
+                await clock.sleep(1)
             
         except Exception as e:
             logging.error(f"Clipboard monitor error: {e}")
             print(f"\tClipboard monitor error: {e}")
-            await asyncio.sleep(1)
+            await clock.sleep(1)
+
+
+async def run_scanner_signals(ib, coordinator: ShardCoordinator = None):
+    """Trade the momentum scanner's signals through the same path as pasted ones"""
+    signals = asyncio.Queue()
+    momentum_scanner.on_signal = lambda symbol, price, stamp: signals.put_nowait((symbol, price, stamp))
+    try:
+        while True:
+            symbol, entry_price, stamp = await signals.get()
+            try:
+                await connection_supervisor.wait_ready()
+                capital = account_state.net_liquidation()
+                if capital is None:
+                    logging.warning(f"[{symbol}] Scanner signal skipped: no account summary yet")
+                    continue
+                if loop_watchdog.paused:
+                    logging.warning(f"[{symbol}] Scanner signal refused: loop watchdog paused")
+                    continue
+                print(f"\n\t=== Scanner: {symbol} @ {entry_price} ===")
+                if await dispatch_signal(ib, symbol, entry_price, capital, coordinator):
+                    momentum_scanner.record_dispatch(stamp)
+            except Exception as e:
+                logging.error(f"[{symbol}] Scanner signal error: {e}")
+                print(f"\t[{symbol}] Scanner signal error: {e}")
+    finally:
+        momentum_scanner.on_signal = None
+
+
+def _scanner_reference(history: List[tuple], now: float, scanner: 'MomentumScanner', start_bin: int) -> dict:
+    """Features of one symbol recomputed from its full tick history"""
+    times, prices, volumes = (np.array(column) for column in zip(*history))
+    tick_bins = (times // scanner.bin_seconds).astype(np.int64)
+    current = int(now // scanner.bin_seconds)
+    oldest_bin = current - scanner.bins + 1
+    before = np.flatnonzero(tick_bins <= oldest_bin)
+    oldest = prices[before[-1]] if len(before) else prices[0]
+    window_volume = volumes[tick_bins >= oldest_bin].sum()
+    per_bin = np.bincount(tick_bins - start_bin, weights=volumes, minlength=current - start_bin + 1)
+    base = 0.0
+    for volume in per_bin[:current - start_bin].tolist():
+        base = base * scanner.decay + volume * (1 - scanner.decay)
+    return {
+        'change_pct': (prices[-1] / oldest - 1) * 100,
+        'window_volume': window_volume,
+        'relative_volume': window_volume / (base * scanner.bins),
+    }
+
+
+def _scanner_tape(symbols: int, seconds: int, ticks_per_second: int, batch: int, spikes: int,
+                  seed: int, checked: int = 10) -> dict:
+    """
+    Feed a synthetic universe (random walks plus momentum bursts: +6% on
+    10x volume over 30 seconds) through a scanner in batches
+    """
+    rng = np.random.default_rng(seed)
+    scanner = MomentumScanner(capacity=symbols)
+    rows = np.array([scanner.slot(f"SCAN{i}") for i in range(symbols)])
+    prices = rng.uniform(2, 40, symbols)
+    spiked = rng.choice(symbols, spikes, replace=False)
+    spike_start = np.full(symbols, np.inf)
+    spike_start[spiked] = rng.uniform(180, seconds - 60, spikes)
+    step_seconds = 1 / ticks_per_second
+    ramp = np.log(1.06) / (30 * ticks_per_second)
+    
+    now = [0.0]
+    signals = []
+    scanner.on_signal = lambda symbol, price, stamp: signals.append((int(symbol[4:]), now[0]))
+    checked_rows = np.concatenate([rng.choice(np.setdiff1d(rows, spiked), checked, replace=False), spiked[:5]])
+    history = {int(row): [] for row in checked_rows}
+    start_bin = None
+    max_error = 0.0
+    for step in range(seconds * ticks_per_second):
+        t = step * step_seconds
+        returns = rng.normal(0, 0.0004, symbols)
+        volumes = rng.exponential(100, symbols)
+        bursting = (t >= spike_start) & (t < spike_start + 30)
+        returns[bursting] += ramp
+        volumes[bursting] *= 10
+        prices *= np.exp(returns)
+        order = rng.permutation(symbols)
+        for i in range(0, symbols, batch):
+            chunk = order[i:i + batch]
+            now[0] = t + i / symbols * step_seconds
+            scanner.on_ticks(rows[chunk], prices[chunk], volumes[chunk], time.perf_counter_ns(), now=now[0])
+            if start_bin is None:
+                start_bin = scanner.bin
+        position = np.empty(symbols, dtype=np.int64)
+        position[order] = np.arange(symbols)
+        for row in history:
+            tick_time = t + (position[row] // batch * batch) / symbols * step_seconds
+            history[row].append((tick_time, prices[row], volumes[row]))
+        if step % (60 * ticks_per_second) == 0 and step:
+            for row, ticks in history.items():
+                expected = _scanner_reference(ticks, now[0], scanner, start_bin)
+                actual = scanner.features(f"SCAN{row}")
+                for key, value in expected.items():
+                    max_error = max(max_error, abs(actual[key] - value) / max(abs(value), 1e-9))
+    
+    caught = {row for row, at in signals if spike_start[row] <= at < spike_start[row] + 60}
+    return {
+        'scanner': scanner,
+        'recall': len(caught) / spikes if spikes else 1.0,
+        'false_signals': sum(1 for row, at in signals if not spike_start[row] <= at < spike_start[row] + 60),
+        'max_relative_error': max_error,
+    }
+
+
+async def scanner_session(path: str, symbols: List[str]) -> dict:
+    """Replay a tape through the scanner and trade its signals on a simulated gateway"""
+    ib = SimulatedIB()
+    consumer = asyncio.ensure_future(run_scanner_signals(ib))
+    await momentum_scanner.start(ib, path)
+    await momentum_scanner._task
+    await clock.sleep(1)
+    spawned = sorted({trader.symbol for trader in order_manager.active_traders.values()})
+    for trader in list(order_manager.active_traders.values()):
+        await trader.abort()
+    await asyncio.gather(*list(trader_tasks))
+    consumer.cancel()
+    momentum_scanner.stop()
+    return {'spawned': spawned}
+
+
+def run_scanner_replay(path: str, seed: int = 17) -> dict:
+    """
+    Write a 20-symbol tape with three momentum bursts to path and trade it on
+    virtual time: replayed tape -> scanner -> run_scanner_signals ->
+    dispatch_signal -> traders
+    """
+    rng = random.Random(seed)
+    names = [f"TAPE{i}" for i in range(20)]
+    movers = {'TAPE3': 200, 'TAPE7': 300, 'TAPE11': 400}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        f.write("seconds,symbol,price,volume\n")
+        tape_prices = {name: 10.0 for name in names}
+        for second in range(600):
+            for name in names:
+                moving = name in movers and movers[name] <= second < movers[name] + 30
+                tape_prices[name] *= 1 + rng.gauss(0.002 if moving else 0, 0.0005)
+                volume = rng.randint(50, 150) * (10 if moving else 1)
+                f.write(f"{second},{name},{tape_prices[name]:.2f},{volume}\n")
+    
+    accounts = AccountState()
+    accounts.default_account = 'SIM'
+    accounts.accounts['SIM'] = AccountSnapshot('SIM')
+    accounts.accounts['SIM'].net_liquidation = 100000.0
+    with virtual_session(account_state=accounts, signal_index=SignalIndex(), signal_leases=SignalLeases(),
+                         momentum_scanner=MomentumScanner(capacity=64)) as loop:
+        session = loop.run_until_complete(scanner_session(path, names))
+        stats = momentum_scanner.stats()
+    return {'movers': sorted(movers), 'spawned': session['spawned'], 'stats': stats}
+
+
+def benchmark_scanner(symbols: int = 5000, seconds: int = 600, ticks_per_second: int = 2,
+                      batch: int = 500, spikes: int = 25, seed: int = 17) -> dict:
+    """
+    Per-tick cost, spike recall and tick-to-signal latency of the momentum
+    scanner, its features checked against a brute-force recompute, and
+    replayed signals reaching traders through dispatch_signal
+    """
+    path = os.path.join(Config.CACHE_DIR, f"bench_scanner_{os.getpid()}.csv")
+    logging.disable(logging.INFO)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            tape = _scanner_tape(symbols, seconds, ticks_per_second, batch, spikes, seed)
+            small = _scanner_tape(symbols // 10, 300, ticks_per_second, batch, 0, seed, checked=0)
+        replay = run_scanner_replay(path, seed)
+    finally:
+        logging.disable(logging.NOTSET)
+        if os.path.exists(path):
+            os.remove(path)
+    
+    stats = tape['scanner'].stats()
+    small_stats = small['scanner'].stats()
+    return {
+        'symbols': symbols,
+        'ticks': stats['ticks'],
+        'ns_per_tick': stats['ns_per_tick'],
+        f"ns_per_tick_{symbols // 10}_symbols": small_stats['ns_per_tick'],
+        'max_batch_us': stats['max_batch_us'],
+        'spikes': spikes,
+        'recall': tape['recall'],
+        'false_signals': tape['false_signals'],
+        'tick_to_signal_p50_us': stats['signal_p50_us'],
+        'tick_to_signal_p99_us': stats['signal_p99_us'],
+        'feature_max_relative_error': f"{tape['max_relative_error']:.1e}",
+        'replay_movers': replay['movers'],
+        'replay_spawned': replay['spawned'],
+        'tick_to_trader_p50_us': replay['stats']['dispatch_p50_us'],
+        'tick_to_trader_p99_us': replay['stats']['dispatch_p99_us'],
+    }
+
+
+def start_session_recorder(ib, suffix: str = ""):
+    """Open this process's session recording and attach it to the IB client"""
+    if not Config.RECORDER_ENABLED:
+        return
+    session_path = os.path.join(
+        Config.RECORDER_DIR,
+        f"session_{clock.now().strftime('%Y%m%d_%H%M%S')}{suffix}.dhrec"
+    )
+    session_recorder.open(session_path)
+    session_recorder.attach(ib)
+    asyncio.create_task(session_recorder.run_flusher())
+    print(f"\tRecording session to {session_path}")
+
+
+def start_blotter(ib, suffix: str = "", instance: int = 0):
+    """Open this process's trade blotter (instance picks its trade id block) and attach it to the IB client"""
+    if not Config.BLOTTER_ENABLED:
+        return
+    root, ext = os.path.splitext(Config.BLOTTER_FILE)
+    blotter_path = os.path.join(Config.BLOTTER_DIR, f"{root}{suffix}{ext}")
+    blotter.open(blotter_path, instance)
+    blotter.attach(ib)
+    asyncio.create_task(blotter.run_flusher())
+    print(f"\tTrade blotter: {blotter_path}")
+
+
+async def start_status_server(port: int = None):
+    """Start this process's status API (a busy port only disables the API)"""
+    if not Config.STATUS_SERVER_ENABLED:
+        return
+    try:
+        await status_server.start(port=port)
+    except OSError as e:
+        logging.warning(f"Status API not started: {e}")
+        print(f"\tStatus API not started: {e}")
 
 
 async def main():
@@ -1166,6 +7740,7 @@ async def main():
     logging.info("Trading bot started")
     
     ib = IB()
+    coordinator = None
     
     try:
         # Connect to IB
@@ -1173,34 +7748,516 @@ async def main():
         await ib.connectAsync(Config.IB_HOST, Config.IB_PORT, clientId=Config.IB_CLIENT_ID)
         print("\tConnected to IB successfully!")
         logging.info("Connected to IB")
+        connection_supervisor.start(ib, Config.IB_CLIENT_ID)
+        await account_state.start(ib)
+        
+        # Start session recorder and trade blotter
+        start_session_recorder(ib)
+        start_blotter(ib)
+        await start_status_server()
+        
+        # Coordinate signals with other bot instances
+        if Config.LEASES_ENABLED:
+            signal_leases.open()
+            signal_leases.start()
+        
+        await clock.sleep(1.3)
+        
+        # Start shard workers
+        if Config.SHARDS:
+            coordinator = ShardCoordinator(Config.SHARDS)
+            coordinator.start()
+            asyncio.create_task(coordinator.run())
+            print(f"\tTraders sharded across {Config.SHARDS} worker processes")
+        
+        # Start watchlist quotes
+        if Config.WATCHLIST_MODE:
+            await quote_table.start(ib, Config.WATCHLIST)
         
-        await asyncio.sleep(1.3)
+        # Keep historical bars current for ATR sizing
+        if Config.ATR_SIZING:
+            bar_store.start(ib, Config.WATCHLIST)
+        
+        # Background stress test of the open book
+        stress_calculator.start()
+        
+        # Virtual parameter variants of every signal
+        if Config.SHADOW_ENABLED:
+            shadow_book.start(ib)
+        
+        # Momentum scanner signals
+        if Config.SCANNER_ENABLED:
+            asyncio.create_task(run_scanner_signals(ib, coordinator))
+            await momentum_scanner.start(ib)
         
         # Setup emergency hotkeys
+        loop = asyncio.get_running_loop()
+        
         def setup_hotkeys():
             order_manager.setup_emergency_hotkeys()
+            keyboard.add_hotkey('ctrl+shift+s', lambda: loop.call_soon_threadsafe(stress_calculator.print_report))
         
         hotkey_thread = threading.Thread(target=setup_hotkeys, daemon=True)
         hotkey_thread.start()
         
+        # Loop lag watchdog
+        if Config.WATCHDOG_ENABLED:
+            loop_watchdog.start()
+        
+        # Profiling toggle
+        if Config.PROFILE_ON_START:
+            profiler.start()
+        if hasattr(signal, 'SIGUSR1'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.toggle)
+        
         print("\n\t=== Emergency Hotkeys Active ===")
         print("\tCtrl+Shift+X: Clear clipboard symbol")
+        print("\tCtrl+Shift+S: Stress test open positions")
         print("\t================================\n")
         
         # Start clipboard monitoring
-        await monitor_clipboard_and_spawn(ib)
+        await monitor_clipboard_and_spawn(ib, coordinator)
         
     except Exception as e:
         logging.error(f"Main error: {e}")
         print(f"\tMain error: {e}")
     finally:
+        profiler.stop()
+        loop_watchdog.stop()
+        stress_calculator.stop()
+        shadow_book.close()
+        momentum_scanner.stop()
+        account_state.stop()
+        connection_supervisor.stop()
+        bar_store.stop()
+        if bar_store.fetches:
+            logging.info(f"Bar store: {bar_store.stats()}")
+        if coordinator is not None:
+            coordinator.stop()
+        status_server.stop()
+        signal_leases.close()
+        session_recorder.close()
+        blotter.close()
+        tick_engine.close()
+        if quote_table.checks:
+            logging.info(f"Price sanity checks: {quote_table.stats()}")
+        if amend_stats.amendments:
+            print(f"\tOrder amendments: {amend_stats.summary()}")
+            logging.info(f"Order amendments: {amend_stats.summary()}")
         if ib.isConnected():
             ib.disconnect()
             print("\tDisconnected from IB")
             logging.info("Disconnected from IB")
 
 
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="IBKR Momentum Trading Bot - DEADHAND v2.0")
+    parser.add_argument(
+        '--bench', choices=['recorder', 'blotter', 'traders', 'status', 'shards', 'reconnect', 'bars', 'accounts',
+                            'entry', 'stress', 'leases', 'watchdog', 'shadow', 'signals', 'scanner'],
+        help="Run a built-in benchmark instead of trading"
+    )
+    parser.add_argument(
+        '--watchlist', metavar='SYMBOLS',
+        help="Comma-separated symbols to stream; enables the pasted-price sanity check"
+    )
+    parser.add_argument(
+        '--scanner', metavar='SOURCE',
+        help="Trade momentum scanner signals from comma-separated symbols to stream, 'ib_scanner' "
+             "(IB's SCANNER_SCAN_CODE scan) or a 'seconds,symbol,price,volume' CSV to replay"
+    )
+    parser.add_argument(
+        '--shards', type=int, metavar='N',
+        help="Run traders in N worker processes, each with its own event loop and IB client ID"
+    )
+    parser.add_argument(
+        '--simulate', metavar='CSV',
+        help="Run one trader on virtual time against a 'seconds,price' CSV path ('synthetic' for a random walk)"
+    )
+    parser.add_argument(
+        '--soak', type=int, metavar='N',
+        help="Run N simulated trader lifecycles and check for subscription/handler/memory leaks"
+    )
+    parser.add_argument(
+        '--analyze-log', nargs='?', const='', metavar='PATH',
+        help="Rebuild trades from a session log (default: the bot's own) and print win rate, "
+             "average R, reentry effectiveness and time in state per symbol"
+    )
+    parser.add_argument(
+        '--report', nargs='?', const='', metavar='DAY',
+        help="Print blotter reports: P&L per symbol (for DAY, YYYY-MM-DD, if given) and per day, "
+             "reentry success rate, time in state"
+    )
+    parser.add_argument(
+        '--watchdog', action='store_true',
+        help="Measure event loop lag and apply LAG_SAFETY_ACTION (WATCHDOG_ATTRIBUTE also names slow callbacks)"
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help="Profile from startup (toggle at runtime with SIGUSR1 or by pasting !PROFILE)"
+    )
+    parser.add_argument('--sim-symbol', default='SIM', help="Symbol for --simulate")
+    parser.add_argument('--sim-entry', type=float, default=10.0, help="Entry price for --simulate")
+    parser.add_argument('--sim-seed', type=int, default=7, help="Random seed for a synthetic path")
+    return parser.parse_args()
+
+
+def run_benchmark(name: str):
+    """Run a built-in benchmark and print its results"""
+    benchmarks = {
+        'recorder': benchmark_recorder,
+        'blotter': benchmark_blotter,
+        'traders': benchmark_traders,
+        'status': benchmark_status,
+        'shards': benchmark_shards,
+        'reconnect': benchmark_reconnect,
+        'bars': benchmark_bars,
+        'accounts': benchmark_accounts,
+        'entry': benchmark_entry,
+        'stress': benchmark_stress,
+        'leases': benchmark_leases,
+        'watchdog': benchmark_watchdog,
+        'shadow': benchmark_shadow,
+        'signals': benchmark_signals,
+        'scanner': benchmark_scanner,
+    }
+    result = benchmarks[name]()
+    print(f"\t=== Benchmark: {name} ===")
+    for key, value in result.items():
+        print(f"\t{key}: {value}")
+    logging.info(f"Benchmark {name}: {result}")
+
+
+# ==================== LOG ANALYSIS ====================
+
+# Only INFO lines matter, so the scan searches for this literal and reads the fixed-width
+# asctime ('YYYY-MM-DD HH:MM:SS,mmm') just before it
+LOG_EVENT = re.compile(
+    rb' - INFO - (?:StockTrader initialized for (\S+) at ([\d.]+)'
+    rb'|\[([^\]\n]+)\] (?:State change: (\S+) -> (\S+)'
+    rb'|(Order filled|Stop loss placed|Stop Loss filled|Reentry #\d+ filled|Take profit \d+% filled)'
+    rb': ([\d.]+) @ ([\d.]+)))'
+)
+LOG_TIMESTAMP_WIDTH = 23
+LOG_EVENT_KINDS = {
+    b'Order filled': 'entry', b'Stop loss placed': 'stop_placed', b'Stop Loss filled': 'stop_filled',
+}
+
+
+def _log_state(token: bytes) -> TradeState:
+    """State from its logged name ('NEW'; logs from before TradeState was an IntEnum say 'TradeState.NEW')"""
+    return TradeState[token.decode().rsplit('.', 1)[-1]]
+
+
+def _align_to_line(mm, offset: int) -> int:
+    """First line start at or after offset"""
+    if offset <= 0:
+        return 0
+    newline = mm.find(b'\n', offset - 1)
+    return len(mm) if newline < 0 else newline + 1
+
+
+def scan_log_chunk(task: tuple) -> list:
+    """Trade events in [start, end) of a log, each line counted in the chunk it starts in"""
+    path, start, end = task
+    events = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start, end = _align_to_line(mm, start), _align_to_line(mm, end)
+        seconds_cache = {}
+        for match in LOG_EVENT.finditer(mm, start, end):
+            stamp = mm[match.start() - LOG_TIMESTAMP_WIDTH:match.start()]
+            second = seconds_cache.get(stamp[:19])
+            if second is None:
+                try:
+                    second = datetime.strptime(stamp[:19].decode(), '%Y-%m-%d %H:%M:%S').timestamp()
+                except ValueError:
+                    continue
+                seconds_cache[stamp[:19]] = second
+            t = second + int(stamp[20:23] or 0) / 1000
+            (init_symbol, init_price, symbol, old_state, new_state, kind, shares, price) = match.groups()
+            if init_symbol is not None:
+                events.append((t, init_symbol.decode(), 'init', float(init_price), 0))
+            elif old_state is not None:
+                try:
+                    events.append((t, symbol.decode(), 'state', _log_state(old_state), _log_state(new_state)))
+                except (KeyError, ValueError):
+                    continue
+            else:
+                name = LOG_EVENT_KINDS.get(kind) or ('reentry' if kind.startswith(b'Reentry') else 'take_profit')
+                events.append((t, symbol.decode(), name, float(shares), float(price)))
+    return events
+
+
+class LogLifecycles:
+    """
+    Trade lifecycles rebuilt from log events, fed in file order
+    
+    A trade starts at 'StockTrader initialized' (or its first fill) and ends
+    at the change to TRADE_COMPLETE. Trades are keyed by the 'SYMBOL#trade_id'
+    log prefix, so traders of one symbol that overlap stay apart (logs from
+    before the id was logged fall back to the bare symbol). Each entry and reentry is a leg with
+    its own fill, first stop and exits; R is P&L over the leg's initial
+    risk (shares x (fill - stop)). A trade only counts toward win rate and
+    R when every leg's shares have a logged exit; older logs without take
+    profit lines leave those trades unresolved.
+    """
+    
+    def __init__(self):
+        self.open: Dict[str, dict] = {}   # log prefix ('SYMBOL#trade_id') -> trade in progress
+        self.symbols: Dict[str, dict] = {}
+        self.state_seconds = [0.0] * len(TradeState)
+        self.state_visits = [0] * len(TradeState)
+        self.events = 0
+    
+    def _new_trade(self, key: str, t: float) -> dict:
+        if key in self.open:
+            self._finish(self.open.pop(key))
+        trade = {'symbol': key.partition('#')[0], 'state': TradeState.NEW, 'since': t, 'legs': []}
+        self.open[key] = trade
+        return trade
+    
+    def feed(self, event: tuple):
+        t, key, kind, a, b = event
+        self.events += 1
+        if kind == 'init':
+            self._new_trade(key, t)
+            return
+        trade = self.open.get(key)
+        if trade is None:
+            if kind not in ('entry', 'state'):
+                return
+            trade = self._new_trade(key, t)
+        legs = trade['legs']
+        if kind == 'state':
+            self.state_seconds[trade['state']] += t - trade['since']
+            self.state_visits[trade['state']] += 1
+            trade['state'], trade['since'] = b, t
+            if b == TradeState.TRADE_COMPLETE:
+                self._finish(self.open.pop(key))
+        elif kind in ('entry', 'reentry'):
+            legs.append([a, b, None, 0, 0.0])   # shares, fill, stop, exited shares, exit value
+        elif not legs:
+            return
+        elif kind == 'stop_placed':
+            if legs[-1][2] is None:
+                legs[-1][2] = b
+        else:
+            leg = legs[-1]
+            shares = min(a, leg[0] - leg[3])
+            leg[3] += shares
+            leg[4] += shares * b
+    
+    def _finish(self, trade: dict):
+        stats = self.symbols.setdefault(trade['symbol'], {
+            'trades': 0, 'unfilled': 0, 'unresolved': 0, 'wins': 0, 'pnl': 0.0, 'r': [],
+            'reentries': 0, 'reentry_wins': 0, 'reentry_r': [],
+        })
+        stats['trades'] += 1
+        legs = trade['legs']
+        if not legs:
+            stats['unfilled'] += 1
+            return
+        if any(leg[3] < leg[0] for leg in legs):
+            stats['unresolved'] += 1
+            return
+        pnl = 0.0
+        for index, (shares, fill, stop, _, exit_value) in enumerate(legs):
+            leg_pnl = exit_value - shares * fill
+            pnl += leg_pnl
+            risk = shares * (fill - stop) if stop is not None else 0.0
+            if index:
+                stats['reentries'] += 1
+                stats['reentry_wins'] += leg_pnl > 0
+                if risk > 0:
+                    stats['reentry_r'].append(leg_pnl / risk)
+        first_shares, first_fill, first_stop = legs[0][:3]
+        initial_risk = first_shares * (first_fill - first_stop) if first_stop is not None else 0.0
+        if initial_risk > 0:
+            stats['r'].append(pnl / initial_risk)
+        stats['wins'] += pnl > 0
+        stats['pnl'] += pnl
+    
+    def summary(self) -> dict:
+        """Per-symbol rows, totals and time in state"""
+        def row(stats: dict) -> dict:
+            resolved = stats['trades'] - stats['unfilled'] - stats['unresolved']
+            return {
+                'trades': stats['trades'],
+                'resolved': resolved,
+                'unfilled': stats['unfilled'],
+                'win_rate': round(stats['wins'] / resolved, 3) if resolved else None,
+                'avg_r': round(sum(stats['r']) / len(stats['r']), 2) if stats['r'] else None,
+                'pnl': round(stats['pnl'], 2),
+                'reentries': stats['reentries'],
+                'reentry_win_rate': (round(stats['reentry_wins'] / stats['reentries'], 3)
+                                     if stats['reentries'] else None),
+                'reentry_avg_r': (round(sum(stats['reentry_r']) / len(stats['reentry_r']), 2)
+                                  if stats['reentry_r'] else None),
+            }
+        
+        total = {'trades': 0, 'unfilled': 0, 'unresolved': 0, 'wins': 0, 'pnl': 0.0, 'r': [],
+                 'reentries': 0, 'reentry_wins': 0, 'reentry_r': []}
+        for stats in self.symbols.values():
+            for key, value in stats.items():
+                total[key] += value
+        return {
+            'symbols': {symbol: row(stats) for symbol, stats in sorted(self.symbols.items())},
+            'total': row(total),
+            'open_trades': len(self.open),
+            'time_in_state': {
+                state.name: (visits, round(seconds / visits, 1), round(seconds, 1))
+                for state, visits, seconds in zip(TradeState, self.state_visits, self.state_seconds) if visits
+            },
+        }
+
+
+def analyze_log(path: str, workers: int = None) -> dict:
+    """Stream a session log through scan_log_chunk on every core and rebuild the trades"""
+    size = os.path.getsize(path)
+    chunk = max(1, int(Config.ANALYZE_CHUNK_MB * 1024 * 1024))
+    tasks = [(path, start, min(start + chunk, size)) for start in range(0, size, chunk)]
+    workers = min(workers or Config.ANALYZE_WORKERS or os.cpu_count() or 1, len(tasks))
+    t0 = time.perf_counter()
+    lifecycles = LogLifecycles()
+    if workers > 1:
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            # imap keeps file order, so lifecycles crossing chunk boundaries reassemble
+            for events in pool.imap(scan_log_chunk, tasks):
+                for event in events:
+                    lifecycles.feed(event)
+    else:
+        for task in tasks:
+            for event in scan_log_chunk(task):
+                lifecycles.feed(event)
+    elapsed = time.perf_counter() - t0
+    
+    result = lifecycles.summary()
+    result.update({
+        'path': path,
+        'mb': round(size / 1024 / 1024, 1),
+        'events': lifecycles.events,
+        'workers': workers,
+        'seconds': round(elapsed, 2),
+        'mb_per_sec': round(size / 1024 / 1024 / elapsed, 1) if elapsed else None,
+    })
+    return result
+
+
+def run_log_analysis(path: str = None):
+    """Print --analyze-log results"""
+    path = path or os.path.join(Config.LOG_DIR, Config.LOG_FILE)
+    if not os.path.exists(path):
+        print(f"\tNo log at {path}")
+        return
+    result = analyze_log(path)
+    
+    def fmt(value, width: int, precision: int = 2) -> str:
+        return f"{value:>{width}.{precision}f}" if value is not None else f"{'-':>{width}}"
+    
+    print(f"\t=== {result['path']}: {result['mb']} MB, {result['events']} events, "
+          f"{result['seconds']}s on {result['workers']} worker(s) ({result['mb_per_sec']} MB/s) ===")
+    print(f"\t{'Symbol':<8}{'Trades':>7}{'Resolved':>9}{'Win %':>7}{'Avg R':>7}{'P&L':>12}"
+          f"{'Reentries':>10}{'Re win %':>9}{'Re avg R':>9}")
+    rows = list(result['symbols'].items()) + [('TOTAL', result['total'])]
+    for symbol, row in rows:
+        win = row['win_rate'] * 100 if row['win_rate'] is not None else None
+        re_win = row['reentry_win_rate'] * 100 if row['reentry_win_rate'] is not None else None
+        print(f"\t{symbol:<8}{row['trades']:>7}{row['resolved']:>9}{fmt(win, 7, 1)}"
+              f"{fmt(row['avg_r'], 7)}{row['pnl']:>12,.2f}{row['reentries']:>10}"
+              f"{fmt(re_win, 9, 1)}{fmt(row['reentry_avg_r'], 9)}")
+    print("\t=== Time in state ===")
+    for state, (visits, mean_s, total_s) in result['time_in_state'].items():
+        print(f"\t{state:<24} {visits:>6} visits  mean {mean_s:>8}s  total {total_s:>10}s")
+    if result['open_trades']:
+        print(f"\t{result['open_trades']} trade(s) still open at the end of the log")
+
+
+def blotter_files() -> List[str]:
+    """The main blotter and the shard workers' blotters that exist, main first"""
+    root, ext = os.path.splitext(Config.BLOTTER_FILE)
+    shard_file = re.compile(rf"{re.escape(root)}_shard(\d+){re.escape(ext)}$")
+    shards = []
+    if os.path.isdir(Config.BLOTTER_DIR):
+        for name in os.listdir(Config.BLOTTER_DIR):
+            match = shard_file.match(name)
+            if match:
+                shards.append((int(match.group(1)), os.path.join(Config.BLOTTER_DIR, name)))
+    paths = [os.path.join(Config.BLOTTER_DIR, Config.BLOTTER_FILE)]
+    return [path for path in paths if os.path.exists(path)] + [path for _, path in sorted(shards)]
+
+
+def run_report(day: str = None):
+    """Print the trade blotter reports over the main and shard blotters"""
+    paths = blotter_files()
+    if not paths:
+        print(f"\tNo blotter at {os.path.join(Config.BLOTTER_DIR, Config.BLOTTER_FILE)}")
+        return
+    blotter.path, blotter.attached = paths[0], paths[1:]
+    if blotter.attached:
+        print(f"\tReading {len(paths)} blotters: {', '.join(os.path.basename(path) for path in paths)}")
+    print(f"\t=== P&L by symbol{f' ({day})' if day else ''} ===")
+    for symbol, trips, pnl in blotter.pnl_by_symbol(day or None):
+        print(f"\t{symbol:<8} {trips:>5} trades  ${pnl:>10,.2f}")
+    print("\t=== P&L by day ===")
+    for trade_day, trips, pnl in blotter.pnl_by_day():
+        print(f"\t{trade_day}  {trips:>5} trades  ${pnl:>10,.2f}")
+    total, wins, rate = blotter.reentry_success_rate()
+    print(f"\t=== Reentries: {wins}/{total} profitable ({rate if rate is not None else '-'}) ===")
+    print("\t=== Time in state ===")
+    for state, visits, mean_s, total_s in blotter.time_in_state():
+        print(f"\t{state:<24} {visits:>6} visits  mean {mean_s:>8}s  total {total_s:>10}s")
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.bench:
+        run_benchmark(args.bench)
+        raise SystemExit(0)
+    if args.report is not None:
+        run_report(args.report)
+        raise SystemExit(0)
+    if args.analyze_log is not None:
+        run_log_analysis(args.analyze_log)
+        raise SystemExit(0)
+    if args.watchlist is not None:
+        Config.WATCHLIST_MODE = True
+        Config.WATCHLIST = [sym.strip().upper() for sym in args.watchlist.split(',') if sym.strip()]
+    if args.scanner is not None:
+        Config.SCANNER_ENABLED = True
+        if args.scanner == 'ib_scanner' or os.path.isfile(args.scanner):
+            Config.SCANNER_SOURCE = args.scanner
+        else:
+            Config.SCANNER_SOURCE = 'quotes'
+            Config.SCANNER_UNIVERSE = [sym.strip().upper() for sym in args.scanner.split(',') if sym.strip()]
+    if args.shards:
+        Config.SHARDS = args.shards
+    if args.profile:
+        Config.PROFILE_ON_START = True
+    if args.watchdog:
+        Config.WATCHDOG_ENABLED = True
+    if args.soak:
+        result = run_soak_test(lifecycles=args.soak)
+        print(f"\n\t=== Soak test: {args.soak} lifecycles ===")
+        for key, value in result.items():
+            print(f"\t{key}: {value}")
+        logging.info(f"Soak test: {result}")
+        raise SystemExit(0 if result['passed'] else 1)
+    if args.simulate:
+        if args.simulate == 'synthetic':
+            price_path = synthetic_price_path(args.sim_entry, seed=args.sim_seed)
+        else:
+            price_path = load_price_path(args.simulate)
+        if args.profile:
+            profiler.start()
+        result = run_simulation(args.sim_symbol, args.sim_entry, price_path)
+        profiler.stop()
+        print(f"\n\t=== Simulation: {args.sim_symbol} ===")
+        for key, value in result.items():
+            print(f"\t{key}: {value}")
+        logging.info(f"Simulation {args.sim_symbol}: {result}")
+        raise SystemExit(0)
+    
     try:
         asyncio.run(main())
     except KeyboardInterrupt: